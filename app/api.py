@@ -0,0 +1,586 @@
+"""API JSON versionada (/api/v1) sobre activos, catalogos, riesgos e incidentes.
+
+- GET /api/v1/<recurso>?fields=id,name&limit=100&after=<cursor>
+  Paginacion por cursor (keyset sobre id): `next` es el cursor de la pagina
+  siguiente o null en la ultima. `fields` limita las columnas leidas.
+- GET /api/v1/<recurso>/<id>
+- POST / PATCH / DELETE /api/v1/<recurso>/batch: alta, modificacion y baja
+  en lote. Se valida todo el lote con los mismos validadores que los
+  formularios web y se commitea en una sola transaccion; si un item falla
+  no se aplica ninguno (422 con los errores por item).
+- GET /api/v1/register.ndjson: registro completo en streaming, un objeto
+  JSON por linea.
+- POST /api/v1/incidents/ingest: ingesta asincrona de incidentes (ver
+  incident_ingest).
+- GET /api/v1/<recurso>/<id>/history y GET /api/v1/changes?since=...:
+  historial de cambios (ver audit).
+- GET /api/v1/search?q=...&kind=risks,incidents: busqueda de texto completo
+  (ver search).
+- POST /api/v1/risks/bulk: cambio masivo de tratamiento sobre los riesgos
+  que cumplen un filtro, con sentencias por conjunto (ver bulk_treatment).
+- GET/PUT /api/v1/assets/<id>/dependencies: dependencias entre activos e
+  impacto heredado (ver asset_graph).
+
+Las lecturas seleccionan columnas y serializan tuplas; solo las escrituras
+usan objetos ORM (para que corran los listeners de scores, contadores y
+versiones de datos).
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from wtforms import Form
+from wtforms.fields.core import UnboundField
+
+from forms import (
+    AssetForm, ThreatForm, VulnerabilityForm, ControlForm, RiskForm, TreatmentForm, ResidualForm, IncidentForm,
+    error_messages, row_form,
+)
+from asset_graph import DependencyCycleError, check_dependencies, dependencies_of
+from audit import changes_since, field_series, timeline
+from bulk_treatment import FILTER_FIELDS, apply_bulk, parse_change, parse_filters
+from models import db, Asset, Threat, Vulnerability, Control, RiskScenario, Incident
+from search import DOCUMENTS as SEARCH_KINDS, search
+
+LIMIT_DEFAULT = 100
+LIMIT_MAX = 1000
+BATCH_MAX = 1000
+INGEST_MAX_ITEMS = 5000
+EXPORT_CHUNK = 2000
+
+bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+
+@dataclass
+class Resource:
+    model: type
+    columns: dict  # campo publico -> columna
+    form: type[Form]
+    # campo publico -> campo del formulario (si difiere)
+    aliases: dict[str, str] = field(default_factory=dict)
+    defaults: dict = field(default_factory=dict)  # valores al crear
+    # campos con FK que el formulario no valida -> modelo referenciado
+    references: dict[str, type] = field(default_factory=dict)
+
+    @property
+    def writable(self) -> tuple[str, ...]:
+        form_fields = {name for name in dir(self.form) if isinstance(getattr(self.form, name, None), UnboundField)}
+        return tuple(name for name in self.columns
+                     if self.aliases.get(name, name) in form_fields or name in self.references)
+
+
+def _columns(model, *names: str, **renamed) -> dict:
+    return {"id": model.id, **{name: getattr(model, name) for name in names}, **renamed}
+
+
+RESOURCES = {
+    "assets": Resource(
+        Asset,
+        _columns(Asset, "name", "asset_type", "process", "owner", "description",
+                 "confidentiality", "integrity", "availability", "inherited_impact", "created_at"),
+        row_form(AssetForm, exclude=("depends_on",)),
+        aliases={"process": "process_area"},
+    ),
+    "threats": Resource(Threat, _columns(Threat, "name", "category", "description"), row_form(ThreatForm)),
+    "vulnerabilities": Resource(
+        Vulnerability, _columns(Vulnerability, "name", "category", "description"), row_form(VulnerabilityForm),
+    ),
+    "controls": Resource(
+        Control, _columns(Control, "name", "iso_reference", "control_type", "description"), row_form(ControlForm),
+    ),
+    "risks": Resource(
+        RiskScenario,
+        _columns(
+            RiskScenario, "asset_id", "threat_id", "vulnerability_id", "probability", "impact_override",
+            "existing_controls", "treatment_strategy", "responsible", "due_date", "status",
+            "acceptance_justification", "acceptance_approved_by", "residual_probability", "residual_impact",
+            "completed_at", "observations", "created_at", "last_review_at",
+            inherent_score=RiskScenario.stored_inherent_score,
+            inherent_level=RiskScenario.stored_inherent_level,
+            residual_score=RiskScenario.stored_residual_score,
+            residual_level=RiskScenario.stored_residual_level,
+        ),
+        row_form(RiskForm, TreatmentForm, ResidualForm, exclude=("proposed_controls",)),
+        defaults={"status": "Pendiente"},
+    ),
+    "incidents": Resource(
+        Incident,
+        _columns(Incident, "risk_id", "date", "severity", "description", "external_id"),
+        row_form(IncidentForm),
+        references={"risk_id": RiskScenario},
+    ),
+}
+
+# Export del registro: columnas de riesgos mas los nombres de catalogos.
+REGISTER_COLUMNS = {
+    **RESOURCES["risks"].columns,
+    "asset": Asset.name,
+    "threat": Threat.name,
+    "vulnerability": Vulnerability.name,
+}
+
+
+# ------------------- Serializacion -------------------
+def _json_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _as_dicts(names: list[str], rows) -> list[dict]:
+    return [{name: _json_value(v) for name, v in zip(names, row)} for row in rows]
+
+
+def _error(status: int, message: str, **extra):
+    return jsonify({"error": message, **extra}), status
+
+
+def _get_resource(name: str) -> Resource | None:
+    return RESOURCES.get(name)
+
+
+def _parse_fields(value: str | None, available) -> list[str]:
+    """`?fields=a,b` -> ["id", "a", "b"]; sin parametro, todas las columnas."""
+    if not value:
+        return list(available)
+    requested = [f.strip() for f in value.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in available]
+    if unknown:
+        raise ValueError(f"Campos desconocidos: {', '.join(unknown)}")
+    return ["id", *dict.fromkeys(f for f in requested if f != "id")]
+
+
+def _parse_limit(value: str | None) -> int:
+    try:
+        limit = int(value) if value else LIMIT_DEFAULT
+    except ValueError:
+        raise ValueError("limit debe ser un entero") from None
+    return max(1, min(limit, LIMIT_MAX))
+
+
+def _parse_cursor(value: str | None) -> int | None:
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError("Cursor invalido")
+    return int(value)
+
+
+def _read(resource: Resource, fields: list[str], ids) -> list[dict]:
+    stmt = select(*(resource.columns[f] for f in fields)).where(resource.model.id.in_(ids)).order_by(resource.model.id)
+    return _as_dicts(fields, db.session.execute(stmt))
+
+
+# ------------------- Lectura -------------------
+@bp.get("/<name>")
+def list_items(name: str):
+    resource = _get_resource(name)
+    if resource is None:
+        return _error(404, f"Recurso desconocido: {name}")
+    try:
+        fields = _parse_fields(request.args.get("fields"), resource.columns)
+        limit = _parse_limit(request.args.get("limit"))
+        after = _parse_cursor(request.args.get("after"))
+    except ValueError as exc:
+        return _error(400, str(exc))
+
+    stmt = select(*(resource.columns[f] for f in fields)).order_by(resource.model.id).limit(limit + 1)
+    if after is not None:
+        stmt = stmt.where(resource.model.id > after)
+    rows = db.session.execute(stmt).all()
+    has_more = len(rows) > limit
+    items = _as_dicts(fields, rows[:limit])
+    return jsonify({"items": items, "next": str(items[-1]["id"]) if has_more else None})
+
+
+@bp.get("/<name>/<int:item_id>")
+def get_item(name: str, item_id: int):
+    resource = _get_resource(name)
+    if resource is None:
+        return _error(404, f"Recurso desconocido: {name}")
+    try:
+        fields = _parse_fields(request.args.get("fields"), resource.columns)
+    except ValueError as exc:
+        return _error(400, str(exc))
+    items = _read(resource, fields, [item_id])
+    if not items:
+        return _error(404, f"{name}/{item_id} no existe")
+    return jsonify(items[0])
+
+
+@bp.get("/register.ndjson")
+def export_register():
+    """Registro completo en streaming; memoria constante en el servidor."""
+    try:
+        fields = _parse_fields(request.args.get("fields"), REGISTER_COLUMNS)
+    except ValueError as exc:
+        return _error(400, str(exc))
+    stmt = (
+        select(*(REGISTER_COLUMNS[f] for f in fields))
+        .join(Asset, RiskScenario.asset_id == Asset.id)
+        .join(Threat, RiskScenario.threat_id == Threat.id)
+        .join(Vulnerability, RiskScenario.vulnerability_id == Vulnerability.id)
+        .order_by(RiskScenario.id)
+        .execution_options(yield_per=EXPORT_CHUNK)
+    )
+
+    def generate():
+        result = db.session.execute(stmt)
+        for rows in result.partitions():
+            yield "".join(
+                json.dumps(dict(zip(fields, row)), default=_json_value, ensure_ascii=False) + "\n" for row in rows
+            )
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": "attachment; filename=registro_riesgos.ndjson"})
+
+
+# ------------------- Escritura en lote -------------------
+def _form_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _column_value(column, value):
+    """Dato del formulario -> valor de la columna ("" = NULL)."""
+    if value == "" or value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is int and isinstance(value, str):
+        return int(value)
+    if python_type is datetime and not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+
+def _validate(resource: Resource, index: int, current: dict, changes, errors: list[dict]) -> dict | None:
+    """Valida el estado resultante (actual + cambios); devuelve los valores a escribir."""
+    if not isinstance(changes, dict):
+        errors.append({"index": index, "messages": ["Se esperaba un objeto"]})
+        return None
+    writable = resource.writable
+    unknown = [k for k in changes if k not in writable and k != "id"]
+    if unknown:
+        errors.append({"index": index, "messages": [f"{k}: campo desconocido o de solo lectura" for k in unknown]})
+        return None
+    state = {**current, **{k: v for k, v in changes.items() if k != "id"}}
+    form = resource.form(formdata=MultiDict(
+        {resource.aliases.get(k, k): _form_value(v) for k, v in state.items() if k not in resource.references}
+    ))
+    messages = [] if form.validate() else error_messages(form)
+    values = {}
+    for name in writable:
+        if name not in changes and current:
+            continue
+        if name in resource.references:
+            value = state.get(name)
+            if not isinstance(value, int):
+                messages.append(f"{name}: se esperaba un ID entero")
+            values[name] = value
+        else:
+            values[name] = _column_value(resource.columns[name], form[resource.aliases.get(name, name)].data)
+    if messages:
+        errors.append({"index": index, "messages": messages})
+        return None
+    return values
+
+
+def _check_references(resource: Resource, values: list[dict], errors: list[dict]) -> None:
+    for name, model in resource.references.items():
+        wanted = {v[name] for v in values if v and name in v}
+        found = set(db.session.execute(select(model.id).where(model.id.in_(wanted))).scalars()) if wanted else set()
+        for index, v in enumerate(values):
+            if v and name in v and v[name] not in found:
+                errors.append({"index": index, "messages": [f"{name}: {v[name]} no existe"]})
+
+
+def _batch_items(payload) -> list | None:
+    items = payload.get("items") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items or len(items) > BATCH_MAX:
+        return None
+    return items
+
+
+def _conflict(exc: IntegrityError):
+    db.session.rollback()
+    return _error(409, "El lote viola una restriccion de la base; no se aplico ningun cambio", detail=str(exc.orig))
+
+
+@bp.post("/<name>/batch")
+def create_batch(name: str):
+    resource = _get_resource(name)
+    if resource is None:
+        return _error(404, f"Recurso desconocido: {name}")
+    items = _batch_items(request.get_json(silent=True))
+    if items is None:
+        return _error(400, f"Se esperaba {{\"items\": [...]}} con 1 a {BATCH_MAX} objetos")
+
+    errors: list[dict] = []
+    values = [_validate(resource, i, {}, {**resource.defaults, **item} if isinstance(item, dict) else item, errors)
+              for i, item in enumerate(items)]
+    _check_references(resource, values, errors)
+    if errors:
+        return _error(422, "Lote invalido; no se aplico ningun cambio", errors=sorted(errors, key=lambda e: e["index"]))
+
+    objects = [resource.model(**v) for v in values]
+    db.session.add_all(objects)
+    try:
+        db.session.flush()
+        ids = [obj.id for obj in objects]
+        db.session.commit()
+    except IntegrityError as exc:
+        return _conflict(exc)
+    return jsonify({"items": _read(resource, list(resource.columns), ids)}), 201
+
+
+@bp.patch("/<name>/batch")
+def update_batch(name: str):
+    resource = _get_resource(name)
+    if resource is None:
+        return _error(404, f"Recurso desconocido: {name}")
+    items = _batch_items(request.get_json(silent=True))
+    if items is None or not all(isinstance(item, dict) and isinstance(item.get("id"), int) for item in items):
+        return _error(400, f"Se esperaba {{\"items\": [{{\"id\": ..., ...}}]}} con 1 a {BATCH_MAX} objetos")
+
+    ids = [item["id"] for item in items]
+    objects = {obj.id: obj for obj in db.session.execute(
+        select(resource.model).where(resource.model.id.in_(ids))).scalars()}
+    errors: list[dict] = []
+    values = []
+    for i, item in enumerate(items):
+        obj = objects.get(item["id"])
+        if obj is None:
+            errors.append({"index": i, "messages": [f"id {item['id']} no existe"]})
+            values.append(None)
+            continue
+        current = {f: getattr(obj, f) for f in resource.writable}
+        values.append(_validate(resource, i, current, item, errors))
+    _check_references(resource, values, errors)
+    if errors:
+        return _error(422, "Lote invalido; no se aplico ningun cambio", errors=sorted(errors, key=lambda e: e["index"]))
+
+    for item, changes in zip(items, values):
+        obj = objects[item["id"]]
+        for key, value in changes.items():
+            setattr(obj, key, value)
+    try:
+        db.session.commit()
+    except IntegrityError as exc:
+        return _conflict(exc)
+    return jsonify({"items": _read(resource, list(resource.columns), ids)})
+
+
+@bp.delete("/<name>/batch")
+def delete_batch(name: str):
+    resource = _get_resource(name)
+    if resource is None:
+        return _error(404, f"Recurso desconocido: {name}")
+    payload = request.get_json(silent=True)
+    ids = payload.get("ids") if isinstance(payload, dict) else None
+    if not isinstance(ids, list) or not ids or len(ids) > BATCH_MAX or not all(isinstance(i, int) for i in ids):
+        return _error(400, f"Se esperaba {{\"ids\": [...]}} con 1 a {BATCH_MAX} IDs")
+
+    objects = db.session.execute(select(resource.model).where(resource.model.id.in_(ids))).scalars().all()
+    missing = sorted(set(ids) - {obj.id for obj in objects})
+    if missing:
+        return _error(404, "IDs inexistentes; no se borro nada", ids=missing)
+    for obj in objects:
+        db.session.delete(obj)
+    try:
+        db.session.commit()
+    except IntegrityError as exc:
+        return _conflict(exc)
+    return jsonify({"deleted": sorted(set(ids))})
+
+
+# ------------------- Cambios masivos -------------------
+_BULK_KEYS = {"filter", "ids", "all", "set", "add_controls", "remove_controls", "dry_run"}
+
+
+@bp.post("/risks/bulk")
+def bulk_risks():
+    """Aplica `set` y agrega/quita controles en los riesgos que cumplen `filter` (y estan en `ids`).
+
+    Responde con las cantidades afectadas y el tiempo; `dry_run` solo cuenta la seleccion.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or set(payload) - _BULK_KEYS:
+        return _error(400, f"Se esperaba un objeto con las claves {', '.join(sorted(_BULK_KEYS))}")
+    raw_filter, ids, values = payload.get("filter") or {}, payload.get("ids"), payload.get("set") or {}
+    if not isinstance(raw_filter, dict) or not isinstance(values, dict):
+        return _error(400, "filter y set deben ser objetos")
+    if ids is not None and not (isinstance(ids, list) and all(isinstance(i, int) for i in ids)):
+        return _error(400, "ids debe ser una lista de IDs enteros")
+    unknown = sorted(set(raw_filter) - set(FILTER_FIELDS))
+    if unknown:
+        return _error(400, f"Filtros desconocidos: {', '.join(unknown)}")
+    filters, errors = parse_filters(MultiDict({k: str(v) for k, v in raw_filter.items() if v is not None}))
+    if errors:
+        return _error(400, "Filtro invalido", errors=errors)
+    if not (filters.to_args() or ids is not None or payload.get("all") is True):
+        return _error(400, 'Indica filter, ids o "all": true para seleccionar todo el registro')
+
+    change, errors = parse_change(values, payload.get("add_controls") or [], payload.get("remove_controls") or [])
+    if errors:
+        return _error(422, "Cambio invalido; no se aplico nada", errors=errors)
+    result = apply_bulk(filters, change, ids, dry_run=payload.get("dry_run") is True)
+    return jsonify(result.to_dict())
+
+
+# ------------------- Dependencias entre activos -------------------
+@bp.get("/assets/<int:asset_id>/dependencies")
+def asset_dependencies(asset_id: int):
+    asset = db.session.get(Asset, asset_id)
+    if asset is None:
+        return _error(404, f"assets/{asset_id} no existe")
+    return jsonify(dependencies_of(asset))
+
+
+@bp.put("/assets/<int:asset_id>/dependencies")
+def asset_dependencies_replace(asset_id: int):
+    """Reemplaza las dependencias directas: {"depends_on": [ids]}. Un ciclo responde 409."""
+    asset = db.session.get(Asset, asset_id)
+    if asset is None:
+        return _error(404, f"assets/{asset_id} no existe")
+    payload = request.get_json(silent=True)
+    ids = payload.get("depends_on") if isinstance(payload, dict) else None
+    if not (isinstance(ids, list) and all(isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+        return _error(400, 'Se esperaba {"depends_on": [IDs de activos]}')
+    targets = db.session.execute(select(Asset).where(Asset.id.in_(set(ids)))).scalars().all() if ids else []
+    if len(targets) != len(set(ids)):
+        return _error(422, "Hay activos inexistentes", ids=sorted(set(ids) - {t.id for t in targets}))
+    errors = check_dependencies(asset.id, sorted(set(ids)))
+    if errors:
+        return _error(409, "Las dependencias crean un ciclo; no se aplico nada", errors=errors)
+    asset.depends_on = targets
+    try:
+        db.session.commit()
+    except DependencyCycleError as exc:  # otra escritura cerro el ciclo entre la validacion y el commit
+        db.session.rollback()
+        return _error(409, "Las dependencias crean un ciclo; no se aplico nada", errors=[str(exc)])
+    return jsonify(dependencies_of(asset))
+
+
+# ------------------- Busqueda -------------------
+@bp.get("/search")
+def search_items():
+    """Resultados por relevancia con titulo y fragmento resaltados (<mark>); `prefix=1` para autocompletar."""
+    q = request.args.get("q", "").strip()
+    kinds = [k for k in request.args.get("kind", "").split(",") if k]
+    unknown = [k for k in kinds if k not in SEARCH_KINDS]
+    if not q:
+        return _error(400, "Falta el parametro q")
+    if unknown:
+        return _error(400, f"Tipos desconocidos: {', '.join(unknown)}")
+    try:
+        limit = _parse_limit(request.args.get("limit"))
+        offset = max(0, int(request.args.get("offset", 0)))
+    except ValueError:
+        return _error(400, "limit y offset deben ser enteros")
+    hits = search(q, kinds or None, limit, offset, prefix_last=request.args.get("prefix") == "1")
+    return jsonify({"items": [hit.to_dict() for hit in hits]})
+
+
+# ------------------- Historial -------------------
+@bp.get("/<name>/<int:item_id>/history")
+def item_history(name: str, item_id: int):
+    """Linea de tiempo de una fila; para riesgos, ademas la serie del score residual."""
+    resource = _get_resource(name)
+    if resource is None:
+        return _error(404, f"Recurso desconocido: {name}")
+    try:
+        limit = _parse_limit(request.args.get("limit"))
+    except ValueError as exc:
+        return _error(400, str(exc))
+    entries = timeline(resource.model.__tablename__, item_id, limit)
+    body = {"items": entries}
+    if resource.model is RiskScenario:
+        body["residual_score"] = field_series(entries, "residual_score")
+    return jsonify(body)
+
+
+@bp.get("/changes")
+def list_changes():
+    """Que cambio desde `since` (ISO 8601), opcionalmente de un recurso; `after` pagina."""
+    try:
+        since = datetime.fromisoformat(request.args.get("since", ""))
+    except ValueError:
+        return _error(400, "since debe ser una fecha ISO 8601")
+    table = None
+    if request.args.get("resource"):
+        resource = _get_resource(request.args["resource"])
+        if resource is None:
+            return _error(404, f"Recurso desconocido: {request.args['resource']}")
+        table = resource.model.__tablename__
+    try:
+        limit = _parse_limit(request.args.get("limit"))
+        after = _parse_cursor(request.args.get("after"))
+    except ValueError as exc:
+        return _error(400, str(exc))
+    items = changes_since(since, table, after, limit + 1)
+    has_more = len(items) > limit
+    items = items[:limit]
+    return jsonify({"items": items, "next": str(items[-1]["id"]) if has_more else None})
+
+
+# ------------------- Ingesta de incidentes -------------------
+def _ingest_items() -> list | None:
+    """Un objeto, una lista JSON o NDJSON (application/x-ndjson)."""
+    if request.mimetype == "application/x-ndjson":
+        try:
+            return [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        except ValueError:
+            return None
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        return [payload]
+    return payload if isinstance(payload, list) else None
+
+
+@bp.post("/incidents/ingest")
+def ingest_incidents():
+    """Valida y encola: 202 con los aceptados y los errores por indice, 429 si la cola esta llena."""
+    ingestor = current_app.extensions["incident_ingestor"]
+    items = _ingest_items()
+    if not items or len(items) > INGEST_MAX_ITEMS:
+        return _error(400, f"Se esperaba un incidente, una lista o NDJSON con 1 a {INGEST_MAX_ITEMS} incidentes")
+
+    resource = RESOURCES["incidents"]
+    errors: list[dict] = []
+    values: list[dict | None] = []
+    for i, item in enumerate(items):
+        external_id = item.pop("external_id", None) if isinstance(item, dict) else None
+        if external_id is not None and not (isinstance(external_id, str) and 0 < len(external_id) <= 120):
+            errors.append({"index": i, "messages": ["external_id: texto de 1 a 120 caracteres"]})
+            values.append(None)
+            continue
+        row = _validate(resource, i, {}, item, errors)
+        if row is not None:
+            row["external_id"] = external_id
+        values.append(row)
+    _check_references(resource, values, errors)
+    invalid = {e["index"] for e in errors}
+    rows = [row for i, row in enumerate(values) if row is not None and i not in invalid]
+    ingestor.metrics.add(invalid=len(items) - len(rows))
+
+    if rows and not ingestor.offer(rows):
+        response = jsonify({"error": "Cola de ingesta llena; reintentar el request completo"})
+        response.headers["Retry-After"] = str(ingestor.retry_after())
+        return response, 429
+    return jsonify({"accepted": len(rows), "errors": sorted(errors, key=lambda e: e["index"])}), 202 if rows else 422
+
+
+@bp.get("/incidents/ingest/stats")
+def ingest_stats():
+    return jsonify(current_app.extensions["incident_ingestor"].stats())
@@ -1,16 +1,36 @@
 from __future__ import annotations
 
 import os
+import tempfile
 from datetime import date, datetime
 
 from dotenv import load_dotenv
-from flask import Flask, render_template, redirect, url_for, flash, request, send_file
+from flask import Flask, render_template, redirect, url_for, flash, request, send_file, abort, jsonify
 from flask_wtf.csrf import CSRFProtect
+from jinja2 import FileSystemBytecodeCache
 
 from models import db, Asset, Threat, Vulnerability, Control, RiskScenario, Incident
-from forms import AssetForm, ThreatForm, VulnerabilityForm, ControlForm, RiskForm, TreatmentForm, ResidualForm, IncidentForm
-from utils import KPI, severity_rank
-from reports import build_risk_register_pdf
+from forms import (
+    AssetForm, ThreatForm, VulnerabilityForm, ControlForm, RiskForm, TreatmentForm, ResidualForm, IncidentForm,
+    ImportForm, BulkTreatmentForm, STATUS, TREATMENT_STRATEGIES,
+)
+from api import bp as api_bp
+from asset_graph import DependencyCycleError, check_dependencies
+from audit import timeline
+from bulk_treatment import apply_bulk, count_selected, parse_change, parse_filters
+from counters import VIEWS as COUNTER_VIEWS, read_counters
+from catalog_cache import CATALOGS, catalog_choices, catalog_count, is_large, search_catalog
+from importer import import_rows, read_rows
+from incident_ingest import IncidentIngestor
+from instrumentation import install as install_instrumentation, install_engine as instrument_engine
+from kpis import dashboard_kpis, top_risks
+from migrate import check_schema as check_db_schema
+from queries import LEVELS, PER_PAGE_DEFAULT, RiskFilters, get_risk_or_404, risk_register_page
+from report_jobs import ReportJobs, TaskQueueFull, register_key
+from response_cache import ResponseCache, make_backend
+from search import DOCUMENTS as SEARCH_KINDS, search
+from snapshots import diff as snapshot_diff, kpi_series, list_snapshots, svg_polyline, take_snapshot
+from storage import configure_storage, install_pragmas
 
 load_dotenv()
 
@@ -18,46 +38,62 @@ BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DB_PATH = os.path.join(BASE_DIR, "riskguard.sqlite3")
 
 
-def create_app() -> Flask:
+def create_app(check_schema: bool = True) -> Flask:
     app = Flask(__name__)
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "dev-secret-key")
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", f"sqlite:///{DB_PATH}")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
+    app.config["EXPORTS_DIR"] = os.getenv("EXPORTS_DIR", os.path.join(BASE_DIR, "..", "exports"))
+    app.config["SIMULATION_WORKERS"] = int(os.getenv("SIMULATION_WORKERS", "1"))
+    app.config["RESPONSE_CACHE"] = os.getenv("RESPONSE_CACHE", "memory")
+    app.config["RESPONSE_CACHE_DIR"] = os.getenv("RESPONSE_CACHE_DIR", os.path.join(app.config["EXPORTS_DIR"], "pages"))
+
+    app.config["TEMPLATE_CACHE_DIR"] = os.getenv("TEMPLATE_CACHE_DIR", os.path.join(app.config["EXPORTS_DIR"], "templates"))
+
+    configure_storage(app)
+    # Produccion: el esquema se migra en el despliegue (python migrate.py), no
+    # al arrancar cada worker.
+    app.config["AUTO_MIGRATE"] = os.getenv(
+        "AUTO_MIGRATE", "0" if app.config["STORAGE_PROFILE"] == "production" else "1"
+    ) == "1"
+    # Plantillas compiladas a bytecode en disco: los workers nuevos no las
+    # vuelven a parsear (python migrate.py las precompila).
+    os.makedirs(app.config["TEMPLATE_CACHE_DIR"], exist_ok=True)
+    app.jinja_options = {**app.jinja_options,
+                         "bytecode_cache": FileSystemBytecodeCache(app.config["TEMPLATE_CACHE_DIR"])}
     db.init_app(app)
-    CSRFProtect(app)
+    csrf = CSRFProtect(app)
+    report_jobs = ReportJobs(
+        app,
+        app.config["EXPORTS_DIR"],
+        max_workers=int(os.getenv("REPORT_WORKERS", "1")),
+        max_bytes=int(os.getenv("REPORT_CACHE_MAX_MB", "200")) * 1024 * 1024,
+    )
+    cache = ResponseCache(app, make_backend(app.config["RESPONSE_CACHE"], app.config["RESPONSE_CACHE_DIR"]))
+    ingestor = IncidentIngestor(
+        app,
+        capacity=int(os.getenv("INGEST_QUEUE_MAX", "10000")),
+        batch_max=int(os.getenv("INGEST_BATCH_MAX", "500")),
+        linger=float(os.getenv("INGEST_LINGER_MS", "200")) / 1000,
+    )
+    app.extensions["incident_ingestor"] = ingestor
+    install_instrumentation(app, collectors=[cache.metrics.prometheus_lines, ingestor.prometheus_lines])
+    # La API es JSON sin sesion de navegador: no usa token CSRF.
+    csrf.exempt(api_bp)
+    app.register_blueprint(api_bp)
 
     with app.app_context():
-        db.create_all()
+        install_pragmas(app, db.engine)
+        instrument_engine(db.engine)
+        if check_schema:
+            check_db_schema(app)
 
     @app.route("/")
+    @cache.cached("risk_scenario", "asset", "threat", "vulnerability", "incident")
     def index():
-        risks = RiskScenario.query.all()
-        total = len(risks)
-
-        high_or_crit = [r for r in risks if r.inherent_level() in ("Alto", "Critico")]
-        with_plan = [r for r in high_or_crit if r.treatment_strategy and r.responsible and r.due_date]
-        kpi_plan = pct(len(with_plan), len(high_or_crit))
-
-        due_actions = [r for r in risks if r.due_date]
-        on_time = [r for r in due_actions if r.status == "Implementado" and r.completed_at and r.completed_at <= r.due_date]
-        kpi_ontime = pct(len(on_time), len(due_actions))
-
-        reduced = [r for r in risks if r.residual_level() and severity_rank(r.residual_level()) < severity_rank(r.inherent_level())]
-        accepted = [r for r in risks if r.treatment_strategy == "Aceptar" and r.acceptance_justification and r.acceptance_approved_by]
-        incidents_count = sum(len(r.incidents) for r in risks)
-
-        kpis = [
-            KPI("Riesgos (total)", str(total)),
-            KPI("% Alto/Critico con plan", kpi_plan, "Plan = estrategia + responsable + fecha limite"),
-            KPI("% acciones a tiempo", kpi_ontime, "Implementado y dentro del plazo"),
-            KPI("Riesgos que bajaron de categoria", str(len(reduced))),
-            KPI("Riesgos aceptados con justificacion", str(len(accepted))),
-            KPI("Incidentes registrados", str(incidents_count)),
-        ]
-
+        kpis = dashboard_kpis()
         # Top riesgos (orden por severidad inherente)
-        top = sorted(risks, key=lambda r: (severity_rank(r.inherent_level()), r.inherent_score()), reverse=True)[:8]
+        top = top_risks(8)
 
         return render_template("index.html", kpis=kpis, top_risks=top)
 
@@ -67,6 +103,7 @@ def create_app() -> Flask:
 
     # ------------------- Activos -------------------
     @app.route("/assets")
+    @cache.cached("asset")
     def assets_list():
         assets = Asset.query.order_by(Asset.created_at.desc()).all()
         return render_template("assets/list.html", assets=assets)
@@ -85,10 +122,12 @@ def create_app() -> Flask:
                 integrity=form.integrity.data,
                 availability=form.availability.data,
             )
+            asset.depends_on = _selected_assets(form.depends_on.data)
             db.session.add(asset)
             db.session.commit()
             flash("Activo creado", "success")
             return redirect(url_for("assets_list"))
+        fill_catalog_field(form.depends_on, "assets")
         return render_template("assets/form.html", form=form, title="Nuevo activo")
 
     @app.route("/assets/<int:asset_id>/edit", methods=["GET", "POST"])
@@ -99,8 +138,9 @@ def create_app() -> Flask:
         # Our form uses process_area to avoid colliding with Form.process().
         if request.method == "GET":
             form.process_area.data = asset.process
+            form.depends_on.data = [a.id for a in asset.depends_on]
 
-        if form.validate_on_submit():
+        if form.validate_on_submit() and not _dependency_errors(form, asset):
             asset.name = form.name.data
             asset.asset_type = form.asset_type.data
             asset.process = form.process_area.data
@@ -109,11 +149,26 @@ def create_app() -> Flask:
             asset.confidentiality = form.confidentiality.data
             asset.integrity = form.integrity.data
             asset.availability = form.availability.data
-
-            db.session.commit()
-            flash("Activo actualizado", "success")
-            return redirect(url_for("assets_list"))
-        return render_template("assets/form.html", form=form, title="Editar activo")
+            asset.depends_on = _selected_assets(form.depends_on.data)
+
+            try:
+                db.session.commit()
+            except DependencyCycleError as exc:  # otra escritura cerro el ciclo despues de validar
+                db.session.rollback()
+                flash(str(exc), "danger")
+            else:
+                flash("Activo actualizado", "success")
+                return redirect(url_for("assets_list"))
+        fill_catalog_field(form.depends_on, "assets")
+        return render_template("assets/form.html", form=form, asset=asset, title="Editar activo")
+
+    def _selected_assets(ids) -> list[Asset]:
+        return Asset.query.filter(Asset.id.in_(set(ids))).all() if ids else []
+
+    def _dependency_errors(form, asset: Asset) -> list[str]:
+        errors = check_dependencies(asset.id, form.depends_on.data or [])
+        form.depends_on.errors = [*form.depends_on.errors, *errors]
+        return errors
 
     @app.route("/assets/<int:asset_id>/delete", methods=["POST"])
     def assets_delete(asset_id: int):
@@ -125,6 +180,7 @@ def create_app() -> Flask:
 
     # ------------------- Catalogos -------------------
     @app.route("/threats")
+    @cache.cached("threat")
     def threats_list():
         items = Threat.query.order_by(Threat.id.desc()).all()
         return render_template("catalog/list.html", items=items, kind="threats", title="Amenazas")
@@ -160,6 +216,7 @@ def create_app() -> Flask:
         return redirect(url_for("threats_list"))
 
     @app.route("/vulnerabilities")
+    @cache.cached("vulnerability")
     def vulnerabilities_list():
         items = Vulnerability.query.order_by(Vulnerability.id.desc()).all()
         return render_template("catalog/list.html", items=items, kind="vulnerabilities", title="Vulnerabilidades")
@@ -195,6 +252,7 @@ def create_app() -> Flask:
         return redirect(url_for("vulnerabilities_list"))
 
     @app.route("/controls")
+    @cache.cached("control")
     def controls_list():
         items = Control.query.order_by(Control.id.desc()).all()
         return render_template("controls/list.html", items=items)
@@ -236,20 +294,31 @@ def create_app() -> Flask:
 
     # ------------------- Riesgos -------------------
     @app.route("/risks")
+    @cache.cached("risk_scenario", "asset", "threat", "vulnerability")
     def risks_list():
-        risks = RiskScenario.query.all()
-        # Ordenar por severidad inherente
-        risks = sorted(risks, key=lambda r: (severity_rank(r.inherent_level()), r.inherent_score()), reverse=True)
-        return render_template("risks/list.html", risks=risks)
+        # Paginado por severidad inherente (keyset sobre la columna materializada)
+        filters = RiskFilters.from_args(request.args)
+        page = risk_register_page(
+            filters,
+            after=request.args.get("after"),
+            before=request.args.get("before"),
+            per_page=request.args.get("per_page", PER_PAGE_DEFAULT, type=int),
+        )
+        return render_template(
+            "risks/list.html",
+            risks=page.items,
+            page=page,
+            filters=filters,
+            levels=LEVELS,
+            statuses=[s for s, _ in STATUS],
+            strategies=[s for s, _ in TREATMENT_STRATEGIES],
+        )
 
     @app.route("/risks/new", methods=["GET", "POST"])
     def risks_new():
         form = RiskForm()
-        form.asset_id.choices = [(a.id, f"{a.name} ({a.asset_type})") for a in Asset.query.order_by(Asset.name).all()]
-        form.threat_id.choices = [(t.id, f"{t.name} ({t.category})") for t in Threat.query.order_by(Threat.name).all()]
-        form.vulnerability_id.choices = [(v.id, f"{v.name} ({v.category})") for v in Vulnerability.query.order_by(Vulnerability.name).all()]
 
-        if request.method == "POST" and not (form.asset_id.choices and form.threat_id.choices and form.vulnerability_id.choices):
+        if request.method == "POST" and not all(catalog_count(k) for k in ("assets", "threats", "vulnerabilities")):
             flash("Primero registra al menos 1 activo, 1 amenaza y 1 vulnerabilidad", "warning")
 
         if form.validate_on_submit():
@@ -266,15 +335,15 @@ def create_app() -> Flask:
             db.session.commit()
             flash("Riesgo creado", "success")
             return redirect(url_for("risks_list"))
+        fill_catalog_field(form.asset_id, "assets")
+        fill_catalog_field(form.threat_id, "threats")
+        fill_catalog_field(form.vulnerability_id, "vulnerabilities")
         return render_template("risks/form.html", form=form)
 
     @app.route("/risks/<int:risk_id>/edit", methods=["GET", "POST"])
     def risks_edit(risk_id: int):
-        risk = RiskScenario.query.get_or_404(risk_id)
+        risk = get_risk_or_404(risk_id, "bare")
         form = RiskForm()
-        form.asset_id.choices = [(a.id, f"{a.name} ({a.asset_type})") for a in Asset.query.order_by(Asset.name).all()]
-        form.threat_id.choices = [(t.id, f"{t.name} ({t.category})") for t in Threat.query.order_by(Threat.name).all()]
-        form.vulnerability_id.choices = [(v.id, f"{v.name} ({v.category})") for v in Vulnerability.query.order_by(Vulnerability.name).all()]
 
         if request.method == "GET":
             form.asset_id.data = risk.asset_id
@@ -297,18 +366,27 @@ def create_app() -> Flask:
             flash("Riesgo actualizado", "success")
             return redirect(url_for("risks_detail", risk_id=risk.id))
 
+        fill_catalog_field(form.asset_id, "assets")
+        fill_catalog_field(form.threat_id, "threats")
+        fill_catalog_field(form.vulnerability_id, "vulnerabilities")
         return render_template("risks/edit.html", risk=risk, form=form)
 
     @app.route("/risks/<int:risk_id>")
+    @cache.cached("risk_scenario", "asset", "threat", "vulnerability", "control", "risk_controls", "incident")
     def risks_detail(risk_id: int):
-        risk = RiskScenario.query.get_or_404(risk_id)
+        risk = get_risk_or_404(risk_id, "detail")
         return render_template("risks/detail.html", risk=risk)
 
+    @app.route("/risks/<int:risk_id>/history")
+    def risks_history(risk_id: int):
+        risk = get_risk_or_404(risk_id, "bare")
+        entries = timeline(RiskScenario.__tablename__, risk.id)
+        return render_template("risks/history.html", risk=risk, entries=entries)
+
     @app.route("/risks/<int:risk_id>/treatment", methods=["GET", "POST"])
     def risks_treatment(risk_id: int):
-        risk = RiskScenario.query.get_or_404(risk_id)
+        risk = get_risk_or_404(risk_id, "treatment")
         form = TreatmentForm(obj=risk)
-        form.proposed_controls.choices = [(c.id, f"{c.name}" + (f" [{c.iso_reference}]" if c.iso_reference else "")) for c in Control.query.order_by(Control.name).all()]
 
         if request.method == "GET":
             form.proposed_controls.data = [c.id for c in risk.proposed_controls]
@@ -329,11 +407,12 @@ def create_app() -> Flask:
             flash("Tratamiento guardado", "success")
             return redirect(url_for("risks_detail", risk_id=risk.id))
 
+        fill_catalog_field(form.proposed_controls, "controls")
         return render_template("risks/treatment.html", risk=risk, form=form)
 
     @app.route("/risks/<int:risk_id>/residual", methods=["GET", "POST"])
     def risks_residual(risk_id: int):
-        risk = RiskScenario.query.get_or_404(risk_id)
+        risk = get_risk_or_404(risk_id, "residual")
         form = ResidualForm()
         if request.method == "GET":
             form.residual_probability.data = str(risk.residual_probability) if risk.residual_probability is not None else ""
@@ -353,9 +432,39 @@ def create_app() -> Flask:
 
         return render_template("risks/residual.html", risk=risk, form=form)
 
+    @app.route("/risks/bulk", methods=["GET", "POST"])
+    def risks_bulk():
+        # Los filtros viajan en la URL (el formulario tiene campos con los mismos nombres).
+        filters, errors = parse_filters(request.args)
+        if errors:
+            flash("Filtro invalido: " + "; ".join(errors), "danger")
+            return redirect(url_for("risks_list"))
+        form = BulkTreatmentForm()
+
+        if form.validate_on_submit():
+            change, errors = parse_change(form.bulk_values(), form.add_controls.data or [],
+                                          form.remove_controls.data or [])
+            if not filters.to_args():
+                flash("Filtra el registro antes de aplicar un cambio masivo", "warning")
+            elif errors:
+                flash("; ".join(errors), "warning")
+            else:
+                result = apply_bulk(filters, change)
+                flash(
+                    f"{result.changed} de {result.selected} riesgos modificados "
+                    f"({result.controls_added} controles agregados, {result.controls_removed} quitados) "
+                    f"en {result.elapsed_ms:.0f} ms",
+                    "success",
+                )
+                return redirect(url_for("risks_list", **filters.to_args()))
+
+        fill_catalog_field(form.add_controls, "controls")
+        fill_catalog_field(form.remove_controls, "controls")
+        return render_template("risks/bulk.html", form=form, filters=filters, selected=count_selected(filters))
+
     @app.route("/risks/<int:risk_id>/delete", methods=["POST"])
     def risks_delete(risk_id: int):
-        risk = RiskScenario.query.get_or_404(risk_id)
+        risk = get_risk_or_404(risk_id, "bare")
         db.session.delete(risk)
         db.session.commit()
         flash("Riesgo eliminado", "info")
@@ -364,7 +473,7 @@ def create_app() -> Flask:
     # ------------------- Incidentes -------------------
     @app.route("/risks/<int:risk_id>/incidents/new", methods=["GET", "POST"])
     def incidents_new(risk_id: int):
-        risk = RiskScenario.query.get_or_404(risk_id)
+        risk = get_risk_or_404(risk_id, "bare")
         form = IncidentForm()
         if form.validate_on_submit():
             incident = Incident(
@@ -388,20 +497,275 @@ def create_app() -> Flask:
         flash("Incidente eliminado", "info")
         return redirect(url_for("risks_detail", risk_id=rid))
 
+    # ------------------- Busqueda en catalogos (typeahead) -------------------
+    @app.route("/catalog/<kind>/search")
+    def catalog_search(kind: str):
+        if kind not in CATALOGS:
+            abort(404)
+        return jsonify(search_catalog(kind, request.args.get("q", "")))
+
+    # ------------------- Busqueda -------------------
+    SEARCH_LABELS = {
+        "assets": "Activo", "threats": "Amenaza", "vulnerabilities": "Vulnerabilidad",
+        "controls": "Control", "risks": "Riesgo", "incidents": "Incidente",
+    }
+
+    def search_url(hit) -> str:
+        if hit.kind == "assets":
+            return url_for("assets_edit", asset_id=hit.id)
+        if hit.kind in ("threats", "vulnerabilities", "controls"):
+            return url_for(f"{hit.kind}_edit", item_id=hit.id)
+        return url_for("risks_detail", risk_id=hit.risk_id if hit.kind == "incidents" else hit.id)
+
+    @app.route("/search")
+    def search_page():
+        q = request.args.get("q", "").strip()
+        kind = request.args.get("kind") if request.args.get("kind") in SEARCH_KINDS else None
+        page = max(1, request.args.get("page", 1, type=int))
+        per_page = 20
+        hits = search(q, [kind] if kind else None, limit=per_page + 1, offset=(page - 1) * per_page) if q else []
+        return render_template(
+            "search.html", q=q, kind=kind, page=page, hits=hits[:per_page], has_more=len(hits) > per_page,
+            labels=SEARCH_LABELS, search_url=search_url, title="Buscar",
+        )
+
+    # ------------------- Analisis (contadores agregados) -------------------
+    @app.route("/analysis")
+    def analysis_dashboard():
+        counters = read_counters()
+        views = {name: view(counters) for name, view in COUNTER_VIEWS.items()}
+        return render_template("analysis/dashboard.html", views=views, title="Analisis")
+
+    @app.route("/analysis/<name>.json")
+    def analysis_view(name: str):
+        view = COUNTER_VIEWS.get(name)
+        if view is None:
+            abort(404)
+        return jsonify(view(read_counters()))
+
+    # ------------------- Fotos del registro y tendencias -------------------
+    TREND_METRICS = {
+        "risks": "Riesgos (total)",
+        "high": "Riesgos Alto/Critico",
+        "pct_with_plan": "% Alto/Critico con plan",
+        "pct_on_time": "% acciones a tiempo",
+        "reduced": "Riesgos que bajaron de categoria",
+        "avg_residual_score": "Score residual promedio",
+        "incidents": "Incidentes registrados",
+    }
+
+    @app.route("/analysis/trends")
+    def analysis_trends():
+        series = kpi_series(list(TREND_METRICS))
+        charts = [(label, svg_polyline(series[name])) for name, label in TREND_METRICS.items()]
+        return render_template("analysis/trends.html", charts=charts, snapshots=list_snapshots(),
+                               n_points=len(series["risks"]), title="Tendencias")
+
+    @app.route("/analysis/trends.json")
+    def analysis_trends_json():
+        metrics = [m for m in request.args.get("metrics", "").split(",") if m] or None
+        since = request.args.get("since")
+        try:
+            since = datetime.fromisoformat(since) if since else None
+        except ValueError:
+            return jsonify(error="since debe ser una fecha ISO 8601"), 400
+        return jsonify(kpi_series(metrics, since))
+
+    @app.route("/analysis/snapshots", methods=["POST"])
+    def analysis_snapshot_new():
+        snapshot = take_snapshot((request.form.get("label") or "").strip()[:60])
+        flash(f"Foto #{snapshot.id} guardada ({snapshot.changed_rows} filas nuevas o modificadas)", "success")
+        return redirect(url_for("analysis_trends"))
+
+    @app.route("/analysis/snapshots.json")
+    def analysis_snapshots_json():
+        return jsonify(list_snapshots())
+
+    @app.route("/analysis/snapshots/<int:from_id>/diff/<int:to_id>.json")
+    def analysis_snapshot_diff(from_id: int, to_id: int):
+        result = snapshot_diff(from_id, to_id, limit=min(request.args.get("limit", 1000, type=int), 50_000))
+        if result is None:
+            abort(404)
+        return jsonify(result)
+
+    # ------------------- Analisis what-if -------------------
+    @app.route("/analysis/what-if")
+    def what_if():
+        # p. ej. ?control_id=3&probability_delta=-1 : "si el control 3 bajara en
+        # 1 la probabilidad de cada riesgo donde esta propuesto"
+        from scoring import WhatIf, run_what_if  # numpy: solo al usarlo
+
+        try:
+            return jsonify(run_what_if(WhatIf.from_args(request.args)))
+        except ValueError as exc:
+            return jsonify(error=str(exc)), 400
+        except RuntimeError as exc:
+            return jsonify(error=str(exc)), 501
+
+    # ------------------- Cobertura de controles -------------------
+    def _coverage_args() -> dict:
+        return {
+            "order": request.args.get("sort", "coverage"),
+            "theme": request.args.get("theme") or None,
+            "limit": max(1, min(request.args.get("limit", 50, type=int), 1000)),
+            "offset": max(0, request.args.get("offset", 0, type=int)),
+        }
+
+    @app.route("/analysis/controls")
+    def analysis_controls():
+        from control_analytics import ISO_THEMES, NO_CODE, SORTS, coverage_report  # numpy: solo al usarlo
+
+        args = _coverage_args()
+        try:
+            report = coverage_report(**args)
+        except ValueError as exc:
+            abort(400, description=str(exc))
+        except RuntimeError as exc:
+            abort(501, description=str(exc))
+        return render_template("analysis/controls.html", report=report, args=args, sorts=SORTS,
+                               themes={**ISO_THEMES, NO_CODE: NO_CODE}, title="Cobertura de controles")
+
+    @app.route("/analysis/controls.json")
+    def analysis_controls_json():
+        from control_analytics import coverage_report  # numpy: solo al usarlo
+
+        try:
+            return jsonify(coverage_report(**_coverage_args()))
+        except ValueError as exc:
+            return jsonify(error=str(exc)), 400
+        except RuntimeError as exc:
+            return jsonify(error=str(exc)), 501
+
+    @app.route("/analysis/controls/<int:control_id>.json")
+    def analysis_control_risks(control_id: int):
+        from control_analytics import current_matrix  # numpy: solo al usarlo
+
+        args = _coverage_args()
+        try:
+            result = current_matrix().covered_risks(control_id, args["limit"], args["offset"])
+        except RuntimeError as exc:
+            return jsonify(error=str(exc)), 501
+        if result is None:
+            abort(404)
+        return jsonify(result)
+
+    @app.route("/analysis/loss-simulation")
+    def loss_simulation():
+        # numpy: solo al usarlo
+        from simulation import DEFAULT_TRIALS, MAX_TRIALS, require_numpy, run_simulation, simulation_key
+
+        try:
+            require_numpy()
+        except RuntimeError as exc:
+            return jsonify(error=str(exc)), 501
+        params = {
+            "trials": max(1, min(request.args.get("trials", DEFAULT_TRIALS, type=int), MAX_TRIALS)),
+            "seed": request.args.get("seed", 1, type=int),
+            "residual": request.args.get("target") == "residual",
+        }
+        workers = app.config["SIMULATION_WORKERS"]
+        # Corre en la cola de reportes; el id incluye la version de los datos,
+        # asi que repetir la consulta sin cambios devuelve el resultado ya calculado.
+        try:
+            job = report_jobs.submit_task(simulation_key(**params),
+                                          lambda: run_simulation(workers=workers, **params).to_dict())
+        except TaskQueueFull as exc:
+            return jsonify(error=str(exc)), 503
+        return _simulation_response(job)
+
+    @app.route("/analysis/loss-simulation/jobs/<job_id>")
+    def loss_simulation_job(job_id: str):
+        job = report_jobs.get(job_id)
+        if job is None or not job_id.startswith("sim-"):
+            abort(404)
+        return _simulation_response(job)
+
+    def _simulation_response(job):
+        """200 con el resultado si ya termino; si no, 202 con la URL para consultar."""
+        if job.status == "done":
+            return jsonify(job.result)
+        data = job.to_dict()
+        data["status_url"] = url_for("loss_simulation_job", job_id=job.key)
+        return jsonify(data), 500 if job.status == "error" else 202
+
+    # ------------------- Importacion masiva -------------------
+    @app.route("/import", methods=["GET", "POST"])
+    def bulk_import():
+        form = ImportForm()
+        result = None
+        if form.validate_on_submit():
+            upload = form.file.data
+            try:
+                result = import_rows(form.kind.data, read_rows(upload.stream, upload.filename))
+            except (ValueError, KeyError, UnicodeDecodeError) as exc:
+                flash(f"No se pudo leer el archivo: {exc}", "danger")
+            else:
+                category = "success" if not result.failed else "warning"
+                flash(f"{result.inserted} filas importadas, {result.failed} con error", category)
+        return render_template("import/form.html", form=form, result=result, title="Importar datos")
+
+    @app.route("/cache/stats")
+    def cache_stats():
+        return jsonify(backend=app.config["RESPONSE_CACHE"], **cache.metrics.snapshot())
+
     # ------------------- Reportes -------------------
     @app.route("/reports/risk-register.pdf")
     def report_risk_register():
-        risks = RiskScenario.query.all()
-        pdf_path = build_risk_register_pdf(risks)
-        return send_file(pdf_path, as_attachment=True, download_name="registro_riesgos.pdf")
+        # Si el registro no cambio desde el ultimo PDF, se sirve desde cache;
+        # si no, se encola y la pagina de estado espera al worker.
+        key = register_key()
+        path = report_jobs.cached(key)
+        if path:
+            return send_file(path, mimetype="application/pdf", as_attachment=True, download_name="registro_riesgos.pdf")
+        job = report_jobs.submit(key)
+        return render_template("reports/status.html", job=job, title="Generando reporte")
+
+    @app.route("/reports/risk-register.<any(parquet, arrows):extension>")
+    def report_risk_register_columnar(extension: str):
+        from register_export import FORMATS as EXPORT_FORMATS, export_register  # pyarrow: solo al usarlo
+
+        fmt = next(name for name, ext in EXPORT_FORMATS.items() if ext == "." + extension)
+        try:
+            since = datetime.fromisoformat(request.args["since"]) if request.args.get("since") else None
+        except ValueError:
+            return jsonify(error="since debe ser una fecha ISO 8601"), 400
+        # Archivo temporal anonimo: se borra al cerrarlo despues de enviarlo.
+        out = tempfile.TemporaryFile()
+        try:
+            export_register(out, fmt, since)
+        except RuntimeError as exc:
+            out.close()
+            return jsonify(error=str(exc)), 501
+        out.seek(0)
+        return send_file(out, mimetype="application/octet-stream", as_attachment=True,
+                         download_name=f"registro_riesgos.{extension}")
+
+    @app.route("/reports/jobs/<job_id>")
+    def report_job_status(job_id: str):
+        job = report_jobs.get(job_id)
+        if job is None:
+            abort(404)
+        data = job.to_dict()
+        if job.status == "done":
+            data["download_url"] = url_for("report_job_download", job_id=job.artifact)
+        return jsonify(data)
+
+    @app.route("/reports/jobs/<job_id>/download")
+    def report_job_download(job_id: str):
+        path = report_jobs.cached(job_id)
+        if not path:
+            abort(404)
+        return send_file(path, mimetype="application/pdf", as_attachment=True, download_name="registro_riesgos.pdf")
 
     return app
 
 
-def pct(a: int, b: int) -> str:
-    if b <= 0:
-        return "0%"
-    return f"{round((a / b) * 100)}%"
+def fill_catalog_field(field, kind: str) -> None:
+    """Opciones cacheadas; en catalogos grandes, solo lo seleccionado + typeahead."""
+    selected = field.data if isinstance(field.data, list) else [field.data] if field.data else []
+    field.choices = catalog_choices(kind, selected)
+    if is_large(kind):
+        field.render_kw = {"data-typeahead": url_for("catalog_search", kind=kind)}
 
 
 if __name__ == "__main__":
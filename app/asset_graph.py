@@ -0,0 +1,592 @@
+"""Dependencias entre activos y propagacion del impacto.
+
+asset_dependency guarda aristas dirigidas: (asset_id, depends_on_id) = "el
+activo asset_id depende de depends_on_id" (un servicio depende de su base de
+datos). Una caida de la base de datos afecta a todo lo que depende de ella,
+directa o indirectamente, asi que el impacto de un activo es el mayor entre
+el de su CID y el de cualquier activo que dependa de el:
+
+    impacto(X) = max(impacto CID(X), impacto(D) para cada D que depende de X)
+
+El maximo que llega de los dependientes se materializa en
+Asset.inherited_impact (NULL si nadie depende del activo) y entra en los
+scores de sus riesgos igual que el CID (Asset.impact_value,
+models.asset_impact_sql).
+
+DependencyGraph tiene en memoria solo los activos con alguna dependencia,
+con un orden topologico (dependientes antes que sus dependencias) que se
+mantiene arista por arista (Pearce-Kelly):
+
+- agregar una arista que respeta el orden no cuesta nada; si no, se
+  reordena solo la region entre sus extremos, y esa misma busqueda detecta
+  el ciclo (DependencyCycleError: no se admiten ciclos);
+- un cambio de CID o de aristas recalcula el impacto heredado en orden
+  topologico, y solo sigue por los activos cuyo impacto cambio.
+
+Las aristas y los CID se cambian con el ORM (Asset.depends_on /
+Asset.dependents). Al final de cada flush el listener aplica los cambios al
+grafo y escribe con sentencias directas lo derivado, como bulk_treatment:
+inherited_impact, scores materializados de los riesgos, contadores y
+versiones de datos. Cada transaccion cambia su propia copia del grafo y la
+publica para el resto del proceso recien en el commit (un rollback la
+descarta). El grafo del proceso se recarga si otro proceso cambio las
+dependencias (version de datos de asset_dependency).
+
+Uso:
+    python asset_graph.py --check          # compara inherited_impact con un recalculo completo
+    python asset_graph.py --check --repair # ademas corrige las diferencias
+    python asset_graph.py --bench 100000   # grafo sintetico, sin base de datos
+"""
+from __future__ import annotations
+
+import heapq
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session
+
+from counters import apply_delta, count_cells
+from models import (
+    db, Asset, DataVersion, RiskScenario, CID_FIELDS, _changed, asset_dependency, backfill_stored_scores,
+)
+from response_cache import _bump
+from utils import cid_to_impact_sql, in_ids
+
+STORED_SCORES = ("stored_inherent_score", "stored_inherent_level", "stored_residual_score", "stored_residual_level")
+
+
+class DependencyCycleError(ValueError):
+    """La dependencia cerraria un ciclo; `path` = [a, b, ..., a] (a depende de b ...)."""
+
+    def __init__(self, path: list[int]):
+        self.path = path
+        super().__init__("La dependencia crea un ciclo: " + " -> ".join(str(n) for n in path))
+
+
+# ------------------- Grafo -------------------
+@dataclass
+class DependencyGraph:
+    depends_on: dict[int, set[int]] = field(default_factory=dict)  # activo -> activos de los que depende
+    dependents: dict[int, set[int]] = field(default_factory=dict)  # activo -> activos que dependen de el
+    own: dict[int, int] = field(default_factory=dict)  # impacto del CID propio
+    inherited: dict[int, int] = field(default_factory=dict)  # impacto heredado (0 = ninguno)
+    order: dict[int, int] = field(default_factory=dict)  # posicion topologica
+    version: int | None = None  # version de datos de asset_dependency que refleja
+    _next: int = 0
+
+    def copy(self) -> "DependencyGraph":
+        """Copia de los indices; los conjuntos de vecinos se comparten (ver _link/_unlink)."""
+        return DependencyGraph(dict(self.depends_on), dict(self.dependents), dict(self.own),
+                               dict(self.inherited), dict(self.order), self.version, self._next)
+
+    def __contains__(self, node: int) -> bool:
+        return node in self.order
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    @property
+    def edge_count(self) -> int:
+        return sum(len(targets) for targets in self.depends_on.values())
+
+    def effective(self, node: int) -> int:
+        return max(self.own[node], self.inherited[node])
+
+    @classmethod
+    def from_edges(cls, edges, own: dict[int, int], inherited: dict[int, int] | None = None) -> "DependencyGraph":
+        """Arma el grafo y su orden topologico (Kahn); DependencyCycleError si hay ciclos."""
+        graph = cls()
+        for a, b in edges:
+            for node in (a, b):
+                if node not in graph.depends_on:
+                    graph.depends_on[node], graph.dependents[node] = set(), set()
+                    graph.own[node] = own[node]
+                    graph.inherited[node] = (inherited or {}).get(node) or 0
+            graph.depends_on[a].add(b)
+            graph.dependents[b].add(a)
+        pending = {node: len(deps) for node, deps in graph.dependents.items()}
+        queue = deque(sorted(node for node, n in pending.items() if not n))
+        while queue:
+            node = queue.popleft()
+            graph.order[node] = graph._next
+            graph._next += 1
+            for target in graph.depends_on[node]:
+                pending[target] -= 1
+                if not pending[target]:
+                    queue.append(target)
+        if len(graph.order) < len(pending):
+            raise DependencyCycleError(graph._some_cycle(set(pending) - set(graph.order)))
+        return graph
+
+    def _some_cycle(self, remaining: set[int]) -> list[int]:
+        # Todo nodo que quedo sin orden tiene alguna dependencia que tambien quedo.
+        node, seen = min(remaining), {}
+        while node not in seen:
+            seen[node] = len(seen)
+            node = min(target for target in self.depends_on[node] if target in remaining)
+        path = sorted(seen, key=seen.get)[seen[node]:]
+        return [*path, node]
+
+    # ------------------- Cambios -------------------
+    def _add_node(self, node: int, own: int) -> None:
+        if node not in self.order:
+            self.order[node], self._next = self._next, self._next + 1
+            self.depends_on[node], self.dependents[node] = set(), set()
+            self.own[node], self.inherited[node] = own, 0
+
+    # Los conjuntos de vecinos se reemplazan, nunca se modifican: copy() los comparte.
+    def _link(self, a: int, b: int) -> None:
+        self.depends_on[a] = self.depends_on[a] | {b}
+        self.dependents[b] = self.dependents[b] | {a}
+
+    def _unlink(self, a: int, b: int) -> None:
+        self.depends_on[a] = self.depends_on[a] - {b}
+        self.dependents[b] = self.dependents[b] - {a}
+
+    def _drop_if_isolated(self, node: int) -> None:
+        if node in self.order and not self.depends_on[node] and not self.dependents[node]:
+            for index in (self.order, self.own, self.inherited, self.depends_on, self.dependents):
+                del index[node]
+
+    def cycle_if_added(self, a: int, b: int) -> list[int] | None:
+        """El ciclo que cerraria "a depende de b", sin modificar el grafo."""
+        if a == b:
+            return [a, a]
+        if a not in self.order or b not in self.order or self.order[a] < self.order[b]:
+            return None
+        # Un camino b -> a solo pasa por posiciones entre las de b y a.
+        limit, parents, stack = self.order[a], {b: None}, [b]
+        while stack:
+            node = stack.pop()
+            for target in self.depends_on[node]:
+                if target == a:
+                    return [a, *self._path_to(parents, node), a]
+                if target not in parents and self.order[target] < limit:
+                    parents[target] = node
+                    stack.append(target)
+        return None
+
+    @staticmethod
+    def _path_to(parents: dict, node: int) -> list[int]:
+        path = [node]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        return path[::-1]
+
+    def add_edge(self, a: int, b: int, own_a: int, own_b: int) -> dict[int, int]:
+        """a depende de b. Devuelve {activo: impacto heredado} de los que cambiaron."""
+        if a == b:
+            raise DependencyCycleError([a, a])
+        self._add_node(a, own_a)
+        self._add_node(b, own_b)
+        if b in self.depends_on[a]:
+            return {}
+        if self.order[a] > self.order[b]:
+            try:
+                self._reorder(a, b)
+            except DependencyCycleError:
+                self._drop_if_isolated(a)
+                self._drop_if_isolated(b)
+                raise
+        self._link(a, b)
+        return self._propagate([b])
+
+    def _reorder(self, a: int, b: int) -> None:
+        """Pearce-Kelly: mueve b y lo que depende de b detras de a y sus dependientes."""
+        lower, upper = self.order[b], self.order[a]
+        forward, parents, stack = [], {b: None}, [b]
+        while stack:
+            node = stack.pop()
+            forward.append(node)
+            for target in self.depends_on[node]:
+                if target == a:
+                    raise DependencyCycleError([a, *self._path_to(parents, node), a])
+                if target not in parents and self.order[target] < upper:
+                    parents[target] = node
+                    stack.append(target)
+        backward, seen, stack = [], {a}, [a]
+        while stack:
+            node = stack.pop()
+            backward.append(node)
+            for source in self.dependents[node]:
+                if source not in seen and self.order[source] > lower:
+                    seen.add(source)
+                    stack.append(source)
+        nodes = sorted(backward, key=self.order.get) + sorted(forward, key=self.order.get)
+        for node, slot in zip(nodes, sorted(self.order[n] for n in nodes)):
+            self.order[node] = slot
+
+    def remove_edge(self, a: int, b: int) -> dict[int, int]:
+        if a not in self.order or b not in self.depends_on[a]:
+            return {}
+        self._unlink(a, b)
+        changed = self._propagate([b])
+        self._drop_if_isolated(a)
+        self._drop_if_isolated(b)
+        return changed
+
+    def remove_node(self, node: int) -> dict[int, int]:
+        """Activo borrado: sus dependencias dejan de heredar de el."""
+        if node not in self.order:
+            return {}
+        sources, targets = self.dependents[node], self.depends_on[node]
+        for source in sources:
+            self._unlink(source, node)
+        for target in targets:
+            self._unlink(node, target)
+        self._drop_if_isolated(node)
+        changed = self._propagate(targets)
+        for neighbor in (*sources, *targets):
+            self._drop_if_isolated(neighbor)
+        return changed
+
+    def set_own(self, node: int, own: int) -> dict[int, int]:
+        """Nuevo impacto de CID de un activo."""
+        if node not in self.order:
+            return {}
+        before = self.effective(node)
+        self.own[node] = own
+        return self._propagate(self.depends_on[node]) if self.effective(node) != before else {}
+
+    def _propagate(self, start) -> dict[int, int]:
+        """Recalcula el impacto heredado desde `start`, en orden topologico.
+
+        Un activo sale de la cola despues de todos sus dependientes, asi que
+        se calcula una sola vez; solo se siguen las dependencias de los que
+        cambiaron de impacto efectivo.
+        """
+        heap = [(self.order[node], node) for node in set(start)]
+        heapq.heapify(heap)
+        queued = {node for _, node in heap}
+        changed = {}
+        while heap:
+            _, node = heapq.heappop(heap)
+            value = max((self.effective(source) for source in self.dependents[node]), default=0)
+            if value == self.inherited[node]:
+                continue
+            before = self.effective(node)
+            self.inherited[node] = changed[node] = value
+            if self.effective(node) == before:
+                continue
+            for target in self.depends_on[node]:
+                if target not in queued:
+                    queued.add(target)
+                    heapq.heappush(heap, (self.order[target], target))
+        return changed
+
+    def recompute(self) -> dict[int, int]:
+        """Recalculo completo (para --check y el benchmark); devuelve las diferencias y las aplica."""
+        changed = {}
+        for node in sorted(self.order, key=self.order.get):
+            value = max((self.effective(source) for source in self.dependents[node]), default=0)
+            if value != self.inherited[node]:
+                self.inherited[node] = changed[node] = value
+        return changed
+
+    def ancestors(self, node: int, limit: int = 1000) -> list[int]:
+        """Activos que dependen de `node`, directa o indirectamente (BFS)."""
+        if node not in self.order:
+            return []
+        seen, queue = {node}, deque([node])
+        while queue and len(seen) <= limit:
+            for source in self.dependents[queue.popleft()]:
+                if source not in seen:
+                    seen.add(source)
+                    queue.append(source)
+        seen.discard(node)
+        return sorted(seen)[:limit]
+
+
+# ------------------- Carga -------------------
+def _graph_version(connection) -> int:
+    return connection.execute(
+        select(DataVersion.version).where(DataVersion.table_name == asset_dependency.name)
+    ).scalar() or 0
+
+
+def _own_impacts(connection, ids) -> dict[int, tuple[int, int]]:
+    rows = connection.execute(
+        select(Asset.id, cid_to_impact_sql(Asset.confidentiality + Asset.integrity + Asset.availability),
+               Asset.inherited_impact).where(in_ids(Asset.id, ids))
+    )
+    return {aid: (own, inherited or 0) for aid, own, inherited in rows}
+
+
+def load_graph(connection) -> DependencyGraph:
+    edges = connection.execute(select(asset_dependency.c.asset_id, asset_dependency.c.depends_on_id)).all()
+    impacts = _own_impacts(connection, {n for edge in edges for n in edge}) if edges else {}
+    graph = DependencyGraph.from_edges(
+        edges, {aid: own for aid, (own, _) in impacts.items()}, {aid: inh for aid, (_, inh) in impacts.items()},
+    )
+    graph.version = _graph_version(connection)
+    return graph
+
+
+# Grafo commiteado del proceso. No se modifica una vez publicado: las
+# transacciones trabajan sobre una copia (session.info[_PENDING]).
+def _outside_graph(connection, graph: DependencyGraph) -> dict[int, int]:
+    """inherited_impact guardado de activos que no estan en el grafo (no deberian heredar nada)."""
+    rows = connection.execute(select(Asset.id, Asset.inherited_impact).where(Asset.inherited_impact.isnot(None)))
+    return {aid: value for aid, value in rows if aid not in graph}
+
+
+_graph: DependencyGraph | None = None
+_lock = threading.RLock()
+_PENDING = "asset_graph_pending"  # (grafo de la transaccion, version al commitear)
+
+
+def current_graph(session=None) -> DependencyGraph:
+    """Grafo que ve la sesion: su copia si cambio dependencias sin commitear, si no el del proceso.
+
+    El del proceso se recarga si otro proceso cambio las dependencias.
+    """
+    global _graph
+    session = session or db.session
+    pending = session.info.get(_PENDING)
+    if pending is not None:
+        return pending[0]
+    connection = session.connection()
+    with _lock:
+        if _graph is None or _graph.version != _graph_version(connection):
+            _graph = load_graph(connection)
+        return _graph
+
+
+def check_dependencies(asset_id: int | None, depends_on: list[int]) -> list[str]:
+    """Errores de validacion de las dependencias de un activo (ciclos), sin modificar nada."""
+    if asset_id is None:
+        return []  # un activo nuevo no tiene dependientes: no puede cerrar un ciclo
+    graph = current_graph()
+    errors = []
+    with _lock:
+        for target in depends_on:
+            cycle = graph.cycle_if_added(asset_id, target)
+            if cycle:
+                errors.append(str(DependencyCycleError(cycle)))
+    return errors
+
+
+# ------------------- Sincronizacion con el ORM -------------------
+def _pending_changes(session):
+    added, removed, impacts = {}, set(), {}
+    for obj in (*session.new, *session.dirty):
+        if not isinstance(obj, Asset):
+            continue
+        state = inspect(obj)
+        for attr in ("depends_on", "dependents"):
+            history = state.attrs[attr].history
+            for other in history.added:
+                a, b = (obj, other) if attr == "depends_on" else (other, obj)
+                added[(a.id, b.id)] = (a.own_impact, b.own_impact)
+            for other in history.deleted:
+                removed.add((obj.id, other.id) if attr == "depends_on" else (other.id, obj.id))
+        if obj in session.dirty and any(_changed(obj, f) for f in CID_FIELDS):
+            impacts[obj.id] = obj.own_impact
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Asset)]
+    return {k: v for k, v in added.items() if k not in removed}, removed - set(added), impacts, deleted
+
+
+def _write_inherited(session, changed: dict[int, int]) -> None:
+    """inherited_impact, scores de los riesgos y contadores de los activos que cambiaron."""
+    conn = session.connection()
+    ids = list(changed)
+    before = count_cells(conn, asset_ids=ids)
+    by_value: dict[int, list[int]] = {}
+    for aid, value in changed.items():
+        by_value.setdefault(value, []).append(aid)
+    table = Asset.__table__
+    for value, aids in by_value.items():
+        conn.execute(update(table).where(in_ids(table.c.id, aids)).values(inherited_impact=value or None))
+    backfill_stored_scores(session, ids)
+    delta = count_cells(conn, asset_ids=ids)
+    delta.subtract(before)
+    apply_delta(conn, delta)
+    _bump(conn, [table.name, RiskScenario.__tablename__])
+    # Los objetos cargados en la sesion releen los valores nuevos.
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Asset) and obj.id in changed:
+            session.expire(obj, ["inherited_impact"])
+        elif isinstance(obj, RiskScenario) and obj.asset_id in changed:
+            session.expire(obj, list(STORED_SCORES))
+
+
+@event.listens_for(Session, "after_flush")
+def _propagate_after_flush(session, flush_context):
+    added, removed, impacts, deleted = _pending_changes(session)
+    if not (added or removed or deleted or impacts):
+        return
+    conn = session.connection()
+    pending = session.info.pop(_PENDING, None)
+    changed: dict[int, int] | None = None
+    if pending:
+        graph = pending[0]
+    else:
+        with _lock:
+            graph = _graph if _graph is not None and _graph.version == _graph_version(conn) else None
+        if graph is None:
+            # Sin grafo al dia: se lee de la transaccion, que ya incluye este
+            # flush, y se recalcula completo. No se publica hasta el commit.
+            graph = load_graph(conn)
+            changed = graph.recompute()
+            changed.update({aid: 0 for aid in _outside_graph(conn, graph)})
+        elif not (added or removed or deleted) and not any(aid in graph for aid in impacts):
+            return  # CID de activos sin dependencias: nada que propagar
+        else:
+            graph = graph.copy()  # el del proceso no se toca hasta el commit
+    if changed is None:
+        # Si hay un ciclo la copia queda a medio aplicar y se descarta (ya no esta en session.info).
+        changed = {}
+        for aid in deleted:
+            changed.update(graph.remove_node(aid))
+        for a, b in removed:
+            changed.update(graph.remove_edge(a, b))
+        for aid, own in impacts.items():
+            changed.update(graph.set_own(aid, own))
+        for (a, b), (own_a, own_b) in added.items():
+            changed.update(graph.add_edge(a, b, own_a, own_b))
+        for aid in deleted:
+            changed.pop(aid, None)
+    if changed:
+        _write_inherited(session, changed)
+    _bump(conn, [asset_dependency.name])
+    session.info[_PENDING] = (graph, _graph_version(conn))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_graph(session):
+    global _graph
+    pending = session.info.pop(_PENDING, None)
+    if pending is None:
+        return
+    graph, version = pending
+    graph.version = version
+    with _lock:
+        # SQLite serializa a los escritores: la copia refleja exactamente lo
+        # commiteado en `version`. Si ya se publico una version posterior, gana
+        # esa (y si no coincide con la base, current_graph recarga).
+        if _graph is None or _graph.version is None or _graph.version < version:
+            _graph = graph
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_graph(session):
+    session.info.pop(_PENDING, None)
+
+
+# ------------------- Consultas -------------------
+def dependencies_of(asset: Asset) -> dict:
+    """Dependencias directas, dependientes e impacto de un activo."""
+    graph = current_graph()
+    with _lock:
+        ancestors = graph.ancestors(asset.id)
+    return {
+        "id": asset.id,
+        "own_impact": asset.own_impact,
+        "inherited_impact": asset.inherited_impact,
+        "impact": asset.impact_value,
+        "depends_on": [{"id": a.id, "name": a.name, "impact": a.impact_value} for a in asset.depends_on],
+        "dependents": [{"id": a.id, "name": a.name, "impact": a.impact_value} for a in asset.dependents],
+        "affected_by": ancestors,  # todos los que dependen de el, transitivamente
+    }
+
+
+# ------------------- CLI -------------------
+def _check(repair: bool) -> int:
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        conn = db.session.connection()
+        try:
+            graph = load_graph(conn)
+        except DependencyCycleError as exc:
+            print(exc)
+            return 1
+        stored = dict(graph.inherited)
+        diffs = graph.recompute()
+        # Activos fuera del grafo (sin dependencias) no heredan nada.
+        stale = _outside_graph(conn, graph)
+        stored.update(stale)
+        diffs.update({aid: 0 for aid in stale})
+        for aid, value in sorted(diffs.items()):
+            print(f"DIFERENCIA activo {aid}: guardado {stored.get(aid) or None}, esperado {value or None}")
+        print(f"{len(graph)} activos con dependencias, {graph.edge_count} aristas; {len(diffs)} diferencias"
+              + (" (reparadas)" if diffs and repair else ""))
+        if diffs and repair:
+            _write_inherited(db.session, diffs)
+            db.session.commit()
+    return 1 if diffs else 0
+
+
+def _synthetic(n: int, degree: int, rng: random.Random) -> tuple[list, dict]:
+    """DAG por capas (servicios -> aplicaciones -> bases de datos -> infraestructura)."""
+    edges = set()
+    for a in range(1, n):
+        for _ in range(rng.randint(0, 2 * degree)):
+            edges.add((a, rng.randint(a + 1, min(n, a + n // 10 + 1))))
+    own = {i: rng.choice((1, 1, 3, 3, 5)) for i in range(1, n + 1)}
+    return sorted(edges), own
+
+
+def _bench(n: int, degree: int = 2) -> int:
+    rng = random.Random(1)
+    edges, own = _synthetic(n, degree, rng)
+
+    def timed(label, fn, repeat=1):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            value = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{label}: {elapsed:.1f} ms" + (f" ({elapsed / repeat:.3f} ms c/u)" if repeat > 1 else ""))
+        return value
+
+    graph = timed(f"grafo {n} activos, {len(edges)} aristas (orden topologico)",
+                  lambda: DependencyGraph.from_edges(edges, own))
+    timed("recalculo completo del impacto heredado", graph.recompute)
+    timed("copia del grafo (una por transaccion que cambia dependencias)", graph.copy)
+    nodes = list(graph.order)
+    ops, touched = 1000, Counter()
+
+    def cid_changes():
+        for _ in range(ops):
+            node = rng.choice(nodes)
+            touched["cid"] += len(graph.set_own(node, rng.choice((1, 3, 5))))
+    timed(f"{ops} cambios de CID incrementales", cid_changes)
+
+    def edge_adds():
+        for _ in range(ops):
+            a, b = rng.choice(nodes), rng.choice(nodes)
+            try:
+                touched["add"] += len(graph.add_edge(a, b, graph.own.get(a, 1), graph.own.get(b, 1)))
+            except DependencyCycleError:
+                touched["cycles"] += 1
+    timed(f"{ops} aristas agregadas al azar (con deteccion de ciclos)", edge_adds)
+
+    def edge_removals():
+        for a, b in rng.sample(edges, ops):
+            touched["remove"] += len(graph.remove_edge(a, b))
+    timed(f"{ops} aristas quitadas", edge_removals)
+    print(f"activos con impacto heredado modificado: {dict(touched)}")
+    ok = not graph.recompute()
+    print("incremental == recalculo completo:", "OK" if ok else "DIFERENCIAS")
+    return 0 if ok else 1
+
+
+def main() -> int:
+    if "--check" in sys.argv:
+        return _check(repair="--repair" in sys.argv)
+    if "--bench" in sys.argv:
+        idx = sys.argv.index("--bench")
+        n = int(sys.argv[idx + 1]) if len(sys.argv) > idx + 1 and sys.argv[idx + 1].isdigit() else 100_000
+        return _bench(n)
+    print(__doc__)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""Historial de cambios (append-only) de todos los modelos.
+
+- after_flush: por cada objeto nuevo, modificado o borrado se arma el diff
+  por campo ({columna: [antes, despues]}) desde el historial de atributos
+  del ORM, incluidas las colecciones muchos-a-muchos (lista de IDs). Los
+  diffs se acumulan en la sesion.
+- before_commit: se escriben todos juntos con un solo INSERT executemany
+  (un rollback los descarta).
+- Sentencias masivas del ORM (insert/update/delete): una entrada por
+  sentencia (action bulk_*) con la cantidad de filas o la sentencia y sus
+  parametros. Para diffs por fila en una operacion masiva, usar record().
+
+Compactacion: las modificaciones de una misma fila en un mismo dia,
+anteriores a N dias, se fusionan en una sola entrada (primer "antes",
+ultimo "despues"). La retencion borra todo lo anterior a M dias.
+
+Uso:
+    python audit.py                                   # compacta lo anterior a 30 dias
+    python audit.py --compact-after 90 --retain-days 730
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+from flask import has_request_context, request
+from sqlalchemy import bindparam, delete, event, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from models import db, ChangeLog, DataVersion, RegisterSnapshot, RiskCounter
+
+# Tablas derivadas o propias del historial: no se auditan.
+SKIP_TABLES = {ChangeLog.__tablename__, DataVersion.__tablename__, RegisterSnapshot.__tablename__,
+               RiskCounter.__tablename__}
+# Columnas que cambian en cada escritura y no aportan al diff.
+SKIP_COLUMNS = {"updated_at"}
+COMPACT_AFTER_DAYS = 30
+_PENDING = "audit_pending"
+
+
+def _jsonable(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _context() -> str:
+    if has_request_context():
+        return f"{request.method} {request.endpoint or request.path}"[:120]
+    return os.path.basename(sys.argv[0] or "python")[:120]
+
+
+def _entry(table_name: str, row_id: int | None, action: str, changes: dict) -> dict:
+    return {
+        "changed_at": datetime.utcnow(),
+        "table_name": table_name,
+        "row_id": row_id,
+        "action": action,
+        "changes": json.dumps(changes, default=str, ensure_ascii=False),
+        "context": _context(),
+    }
+
+
+def record(session, table_name: str, row_id: int | None, action: str, changes: dict) -> None:
+    """Agrega una entrada al lote de la transaccion actual."""
+    session.info.setdefault(_PENDING, []).append(_entry(table_name, row_id, action, changes))
+
+
+# ------------------- Diffs -------------------
+def object_diff(obj, action: str) -> dict:
+    """{columna: [antes, despues]} de un objeto en after_flush."""
+    state = inspect(obj)
+    changes = {}
+    for prop in state.mapper.column_attrs:
+        name = prop.columns[0].name
+        if name in SKIP_COLUMNS:
+            continue
+        if action == "update":
+            hist = state.attrs[prop.key].history
+            if not hist.has_changes():
+                continue
+            old = hist.deleted[0] if hist.deleted else None
+            new = hist.added[0] if hist.added else None
+        elif action == "insert":
+            old, new = None, state.dict.get(prop.key)
+        else:
+            old, new = state.dict.get(prop.key), None
+        if old != new:
+            changes[name] = [_jsonable(old), _jsonable(new)]
+    for prop in state.mapper.relationships:
+        if prop.secondary is None:
+            continue  # las filas hijas tienen su propio historial
+        hist = state.attrs[prop.key].history
+        if not hist.has_changes():
+            continue
+        old = sorted(o.id for o in (*hist.unchanged, *hist.deleted))
+        new = sorted(o.id for o in (*hist.unchanged, *hist.added)) if action != "delete" else []
+        if old != new:
+            changes[prop.key] = [old, new]
+    return changes
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_diffs(session, flush_context):
+    entries = []
+    for action, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            table = obj.__table__.name
+            if table in SKIP_TABLES:
+                continue
+            changes = object_diff(obj, action)
+            if changes or action != "update":
+                # Los objetos nuevos todavia no tienen identity key en after_flush.
+                row_id = inspect(obj).mapper.primary_key_from_instance(obj)[0]
+                entries.append(_entry(table, row_id, action, changes))
+    if entries:
+        session.info.setdefault(_PENDING, []).extend(entries)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk(orm_execute_state):
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = state.statement.table.name
+    if table in SKIP_TABLES:
+        return
+    if state.is_insert:
+        params = state.parameters
+        changes = {"rows": len(params) if isinstance(params, list) else int(bool(params))}
+        action = "bulk_insert"
+    else:
+        compiled = state.statement.compile()
+        changes = {"statement": str(compiled), "params": {k: _jsonable(v) for k, v in compiled.params.items()}}
+        action = "bulk_update" if state.is_update else "bulk_delete"
+    record(state.session, table, None, action, changes)
+
+
+@event.listens_for(Session, "before_commit")
+def _write_pending(session):
+    # El flush final del commit corre despues de before_commit: se adelanta
+    # para que sus diffs entren en este mismo INSERT.
+    session.flush()
+    pending = session.info.pop(_PENDING, None)
+    if pending:
+        session.connection().execute(insert(ChangeLog.__table__), pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(_PENDING, None)
+
+
+# ------------------- Consultas -------------------
+_COLUMNS = (ChangeLog.id, ChangeLog.changed_at, ChangeLog.table_name, ChangeLog.row_id,
+            ChangeLog.action, ChangeLog.changes, ChangeLog.context)
+
+
+def _as_dict(row) -> dict:
+    cid, changed_at, table, row_id, action, changes, context = row
+    return {"id": cid, "changed_at": changed_at.isoformat(), "table": table, "row_id": row_id,
+            "action": action, "changes": json.loads(changes), "context": context}
+
+
+def timeline(table: str, row_id: int, limit: int = 200) -> list[dict]:
+    """Cambios de una fila, del mas reciente al mas viejo (indice ix_change_log_row)."""
+    rows = db.session.execute(
+        select(*_COLUMNS)
+        .where(ChangeLog.table_name == table, ChangeLog.row_id == row_id)
+        .order_by(ChangeLog.changed_at.desc(), ChangeLog.id.desc())
+        .limit(limit)
+    )
+    return [_as_dict(row) for row in rows]
+
+
+def changes_since(since: datetime, table: str | None = None, after_id: int | None = None,
+                  limit: int = 500) -> list[dict]:
+    """Cambios posteriores a `since` en orden de escritura; `after_id` pagina."""
+    stmt = select(*_COLUMNS).where(ChangeLog.changed_at > since).order_by(ChangeLog.id).limit(limit)
+    if table:
+        stmt = stmt.where(ChangeLog.table_name == table)
+    if after_id is not None:
+        stmt = stmt.where(ChangeLog.id > after_id)
+    return [_as_dict(row) for row in db.session.execute(stmt)]
+
+
+def field_series(entries: list[dict], field: str) -> list[dict]:
+    """Valores sucesivos de un campo a partir de una linea de tiempo (p. ej. residual_score)."""
+    points = [{"changed_at": e["changed_at"], "value": e["changes"][field][1]}
+              for e in entries if field in e["changes"]]
+    return sorted(points, key=lambda p: p["changed_at"])
+
+
+# ------------------- Compactacion y retencion -------------------
+def _merge(entries: list[tuple[int, dict]]) -> dict:
+    merged: dict[str, list] = {}
+    for _, changes in entries:
+        for name, (old, new) in changes.items():
+            if name in merged:
+                merged[name][1] = new
+            else:
+                merged[name] = [old, new]
+    return {name: pair for name, pair in merged.items() if pair[0] != pair[1]}
+
+
+def compact(older_than: datetime, session=None) -> dict:
+    """Fusiona las modificaciones de una misma fila en un mismo dia anteriores a `older_than`."""
+    session = session or db.session
+    conn = session.connection()
+    rows = conn.execute(
+        select(ChangeLog.id, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.changed_at, ChangeLog.changes)
+        .where(ChangeLog.action == "update", ChangeLog.row_id.isnot(None), ChangeLog.changed_at < older_than)
+        .order_by(ChangeLog.table_name, ChangeLog.row_id, ChangeLog.changed_at, ChangeLog.id)
+        .execution_options(yield_per=5000)
+    )
+    to_delete: list[int] = []
+    to_update: list[dict] = []
+
+    def close(group):
+        if len(group) < 2:
+            return
+        merged = _merge(group)
+        keep = group[-1][0]
+        to_delete.extend(cid for cid, _ in group[:-1])
+        if merged:
+            to_update.append({"entry_id": keep, "merged": json.dumps(merged, ensure_ascii=False)})
+        else:
+            to_delete.append(keep)  # los cambios se anularon entre si
+
+    group: list[tuple[int, dict]] = []
+    key = None
+    for cid, table, row_id, changed_at, changes in rows:
+        current = (table, row_id, changed_at.date())
+        if current != key:
+            close(group)
+            group, key = [], current
+        group.append((cid, json.loads(changes)))
+    close(group)
+
+    for start in range(0, len(to_delete), 500):
+        conn.execute(delete(ChangeLog.__table__).where(ChangeLog.id.in_(to_delete[start:start + 500])))
+    if to_update:
+        table = ChangeLog.__table__
+        conn.execute(
+            update(table).where(table.c.id == bindparam("entry_id")).values(changes=bindparam("merged")),
+            to_update,
+        )
+    session.commit()
+    return {"merged_entries": len(to_update), "deleted_entries": len(to_delete)}
+
+
+def purge(before: datetime, session=None) -> int:
+    """Retencion: borra las entradas anteriores a `before`."""
+    session = session or db.session
+    n = session.connection().execute(delete(ChangeLog.__table__).where(ChangeLog.changed_at < before)).rowcount
+    session.commit()
+    return n
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--compact-after", type=int, default=COMPACT_AFTER_DAYS, help="dias")
+    parser.add_argument("--retain-days", type=int, default=None, help="borrar lo anterior (por defecto, nada)")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+    now = datetime.utcnow()
+    with app.app_context():
+        result = compact(now - timedelta(days=args.compact_after))
+        if args.retain_days is not None:
+            result["purged_entries"] = purge(now - timedelta(days=args.retain_days))
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
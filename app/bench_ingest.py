@@ -0,0 +1,178 @@
+"""Prueba de carga de la ingesta de incidentes (/api/v1/incidents/ingest).
+
+Varios clientes concurrentes envian lotes de incidentes (una parte con
+external_id repetido) y reintentan ante 429 respetando Retry-After. Al final
+espera a que la cola se vacie y reporta throughput aceptado y escrito,
+rechazos por contrapresion y las metricas por lote del escritor.
+
+Sin --url crea una base temporal con datos sinteticos y usa el cliente de
+pruebas de Flask (la cola y el escritor corren en este proceso). Con --url
+apunta a un servidor en marcha.
+
+Uso:
+    python bench_ingest.py [--incidents 20000] [--batch 100] [--clients 4] [--duplicates 0.1]
+    python bench_ingest.py --url http://localhost:5000 --format ndjson
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from datetime import date, timedelta
+
+
+class _HttpClient:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method: str, path: str, body: bytes | None = None, content_type: str = "application/json"):
+        req = urllib.request.Request(self.base_url + path, data=body, method=method,
+                                     headers={"Content-Type": content_type})
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return resp.status, dict(resp.headers), resp.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, dict(exc.headers), exc.read()
+
+
+class _FlaskClient:
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method: str, path: str, body: bytes | None = None, content_type: str = "application/json"):
+        resp = self.app.test_client().open(path, method=method, data=body, content_type=content_type)
+        return resp.status_code, dict(resp.headers), resp.get_data()
+
+
+def _payloads(n: int, batch: int, risk_ids: list[int], duplicates: float, fmt: str, seed: int = 1):
+    rnd = random.Random(seed)
+    today = date.today()
+    sent_ids: list[str] = []
+    for start in range(0, n, batch):
+        items = []
+        for i in range(start, min(n, start + batch)):
+            if sent_ids and rnd.random() < duplicates:
+                external_id = rnd.choice(sent_ids)
+            else:
+                external_id = f"siem-{i}"
+                sent_ids.append(external_id)
+            items.append({
+                "external_id": external_id,
+                "risk_id": rnd.choice(risk_ids),
+                "date": (today - timedelta(days=rnd.randint(0, 700))).isoformat(),
+                "severity": rnd.choice(["Baja", "Media", "Alta"]),
+                "description": f"Alerta {i}",
+            })
+        if fmt == "ndjson":
+            yield "\n".join(json.dumps(item) for item in items).encode(), "application/x-ndjson"
+        else:
+            yield json.dumps(items).encode(), "application/json"
+
+
+def run_load(client, risk_ids: list[int], incidents: int, batch: int, clients: int, duplicates: float,
+             fmt: str, max_backoff: float) -> dict:
+    payloads = list(_payloads(incidents, batch, risk_ids, duplicates, fmt))
+    lock = threading.Lock()
+    statuses: Counter = Counter()
+    accepted = 0
+
+    def worker(mine):
+        nonlocal accepted
+        for body, content_type in mine:
+            while True:
+                status, headers, data = client.request("POST", "/api/v1/incidents/ingest", body, content_type)
+                with lock:
+                    statuses[status] += 1
+                if status != 429:
+                    break
+                time.sleep(min(max_backoff, float(headers.get("Retry-After", "1"))))
+            if status == 202:
+                with lock:
+                    accepted += json.loads(data)["accepted"]
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(payloads[i::clients],)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sent_seconds = time.perf_counter() - start
+
+    while True:  # esperar a que el escritor vacie la cola
+        stats = json.loads(client.request("GET", "/api/v1/incidents/ingest/stats")[2])
+        if stats["queue_depth"] == 0:
+            break
+        time.sleep(0.05)
+    total_seconds = time.perf_counter() - start
+    return {
+        "incidents": incidents,
+        "batch": batch,
+        "clients": clients,
+        "format": fmt,
+        "requests": dict(statuses),
+        "accepted": accepted,
+        "send_seconds": round(sent_seconds, 3),
+        "drain_seconds": round(total_seconds, 3),
+        "accepted_per_sec": round(accepted / sent_seconds, 1),
+        "written_per_sec": round(stats["inserted"] / total_seconds, 1),
+        "ingest": stats,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="servidor en marcha (por defecto, en proceso)")
+    parser.add_argument("--incidents", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=100, help="incidentes por request")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--duplicates", type=float, default=0.1, help="fraccion con external_id repetido")
+    parser.add_argument("--format", choices=["json", "ndjson"], default="json")
+    parser.add_argument("--max-backoff", type=float, default=0.5, help="tope de espera ante 429 (s)")
+    args = parser.parse_args()
+
+    if args.url:
+        client = _HttpClient(args.url)
+        risks = json.loads(client.request("GET", "/api/v1/risks?fields=id&limit=1000")[2])["items"]
+        result = run_load(client, [r["id"] for r in risks], args.incidents, args.batch, args.clients,
+                          args.duplicates, args.format, args.max_backoff)
+        print(json.dumps(result, indent=2))
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.sqlite3')}"
+        os.environ["EXPORTS_DIR"] = os.path.join(tmp, "exports")
+        from app import create_app
+        from models import db, Incident, RiskScenario
+        from seed import generate
+        from sqlalchemy import func, select
+
+        app = create_app()
+        with app.app_context():
+            generate(n_assets=100, n_catalog=20, n_risks=1000)
+            before = db.session.execute(select(func.count(Incident.id))).scalar_one()
+            risk_ids = list(db.session.execute(select(RiskScenario.id)).scalars())
+        result = run_load(_FlaskClient(app), risk_ids, args.incidents, args.batch, args.clients,
+                          args.duplicates, args.format, args.max_backoff)
+        with app.app_context():
+            stored = db.session.execute(select(func.count(Incident.id))).scalar_one() - before
+            distinct = db.session.execute(
+                select(func.count(func.distinct(Incident.external_id))).where(Incident.external_id.isnot(None))
+            ).scalar_one()
+        app.extensions["incident_ingestor"].stop()
+        # Cada external_id distinto aceptado queda exactamente una vez.
+        result["stored"] = stored
+        result["no_duplicates"] = stored == distinct
+        print(json.dumps(result, indent=2))
+        return 0 if result["no_duplicates"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Benchmark del reporte PDF: tiempo y memoria pico vs. numero de riesgos.
+
+Cada tamano corre en un subproceso propio para que la memoria pico (RSS)
+de un caso no contamine al siguiente. El resultado se imprime como JSON.
+
+Uso:
+    python bench_report.py [--sizes 1000 5000 20000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _peak_rss_kb() -> int | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(n_risks: int) -> dict:
+    tmp = tempfile.mkdtemp(prefix="riskguard-bench-")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "bench.sqlite3")
+
+    from app import create_app
+    from models import db
+    from reports import build_risk_register_pdf, iter_register_rows
+    from seed import generate
+
+    app = create_app()
+    with app.app_context():
+        generate(n_assets=max(1, n_risks // 10), n_catalog=50, n_risks=n_risks)
+        rss_before = _peak_rss_kb()
+        out = os.path.join(tmp, "registro.pdf")
+        start = time.perf_counter()
+        build_risk_register_pdf(iter_register_rows(db.session), out)
+        elapsed = time.perf_counter() - start
+    return {
+        "risks": n_risks,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(n_risks / elapsed, 1) if elapsed else None,
+        "peak_rss_kb_before": rss_before,
+        "peak_rss_kb": _peak_rss_kb(),
+        "pdf_bytes": os.path.getsize(out),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one is not None:
+        print(json.dumps(measure(args.one)))
+        return
+
+    results = []
+    for n in args.sizes:
+        proc = subprocess.run([sys.executable, __file__, "--one", str(n)], capture_output=True, text=True, check=True)
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
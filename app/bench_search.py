@@ -0,0 +1,160 @@
+"""Benchmark de la busqueda de texto completo (search.py) sobre ~1M de documentos.
+
+Crea una base temporal con datos sinteticos (seed.generate) y agrega
+incidentes con descripciones generadas (vocabulario con distribucion de
+Zipf, como el texto real: pocas palabras muy frecuentes y muchas raras)
+hasta llegar a --docs documentos indexados. Los triggers mantienen el
+indice durante la carga, asi que tambien se mide el costo de indexar.
+
+Despues ejecuta consultas de varios tipos (palabra, dos palabras, prefijo,
+frase, filtrada por tipo) con terminos de frecuencia baja, media y alta, y
+reporta p50/p95/max en ms de search() (ranking bm25 + resaltado, 20
+resultados). Termina con codigo 1 si el p95 supera --target-ms.
+
+Uso:
+    python bench_search.py [--docs 1000000] [--queries 50] [--target-ms 50]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from itertools import accumulate
+
+DOMAIN_WORDS = (
+    "acceso no autorizado phishing ransomware malware credenciales robadas fuga datos servidor firewall "
+    "vpn backup restauracion inyeccion sql denegacion servicio parche vulnerabilidad critica correo "
+    "usuario privilegiado contrasena cifrado certificado expirado portal web api base clientes "
+    "facturacion proveedor nube bucket publico escaneo puertos fuerza bruta alerta siem endpoint "
+    "antivirus registro auditoria configuracion incorrecta error humano perdida dispositivo"
+).split()
+INCIDENT_BATCH = 10_000
+
+
+def _vocabulary(size: int, rnd: random.Random) -> list[str]:
+    letters = "abcdefghilmnoprstuv"
+    words = set(DOMAIN_WORDS)
+    while len(words) < size:
+        words.add("".join(rnd.choice(letters) for _ in range(rnd.randint(4, 10))))
+    # Las palabras del dominio quedan entre las mas frecuentes.
+    return list(DOMAIN_WORDS) + sorted(words - set(DOMAIN_WORDS))
+
+
+def _zipf_weights(n: int, s: float = 1.05) -> list[float]:
+    return list(accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def _descriptions(n: int, vocab: list[str], cum_weights: list[float], rnd: random.Random):
+    for _ in range(n):
+        yield " ".join(rnd.choices(vocab, cum_weights=cum_weights, k=rnd.randint(8, 24)))
+
+
+def load(n_docs: int, vocab_size: int, seed: int = 1) -> dict:
+    """Llena la base actual hasta n_docs documentos indexados."""
+    from sqlalchemy import insert, select, text
+
+    from models import db, Incident, RiskScenario
+    from seed import generate
+
+    rnd = random.Random(seed)
+    vocab = _vocabulary(vocab_size, rnd)
+    weights = _zipf_weights(len(vocab))
+    start = time.perf_counter()
+    generate(n_assets=2000, n_catalog=200, n_risks=min(100_000, n_docs // 10))
+    docs = db.session.execute(text("SELECT count(*) FROM search_index")).scalar_one()
+    risk_ids = list(db.session.execute(select(RiskScenario.id)).scalars())
+    today = date.today()
+    texts = _descriptions(max(0, n_docs - docs), vocab, weights, rnd)
+    while docs < n_docs:
+        batch = [
+            {"risk_id": rnd.choice(risk_ids), "date": today - timedelta(days=rnd.randint(0, 700)),
+             "severity": rnd.choice(("Baja", "Media", "Alta")), "description": description}
+            for description, _ in zip(texts, range(INCIDENT_BATCH))
+        ]
+        if not batch:
+            break
+        db.session.execute(insert(Incident), batch)
+        db.session.commit()
+        docs += len(batch)
+    load_seconds = time.perf_counter() - start
+    db.session.execute(text("INSERT INTO search_index(search_index) VALUES ('optimize')"))
+    db.session.commit()
+    return {"docs": docs, "load_seconds": round(load_seconds, 1),
+            "docs_per_sec": round(docs / load_seconds), "vocab": vocab}
+
+
+def _term_bands(vocab: list[str]) -> dict[str, list[str]]:
+    """Palabras por frecuencia: alta (top 20), media y baja (cola)."""
+    return {"alta": vocab[:20], "media": vocab[200:2000], "baja": vocab[-20000:]}
+
+
+def _queries(vocab: list[str], n: int, rnd: random.Random) -> list[tuple[str, str, list | None]]:
+    bands = _term_bands(vocab)
+    queries = []
+    for _ in range(n):
+        common, medium, rare = (rnd.choice(bands[b]) for b in ("alta", "media", "baja"))
+        queries += [
+            ("palabra frecuente", common, None),
+            ("palabra media", medium, None),
+            ("palabra rara", rare, None),
+            ("dos palabras", f"{common} {medium}", None),
+            ("prefijo", medium[:3] + "*", None),
+            ("frase", f'"{rnd.choice(DOMAIN_WORDS)} {rnd.choice(DOMAIN_WORDS)}"', None),
+            ("solo riesgos", medium, ["risks"]),
+        ]
+    return queries
+
+
+def run_queries(queries, repeat: int = 1) -> dict:
+    from search import search
+
+    timings: dict[str, list[float]] = {}
+    for kind, q, kinds in queries:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            search(q, kinds)
+            timings.setdefault(kind, []).append((time.perf_counter() - start) * 1000)
+
+    def summary(values: list[float]) -> dict:
+        values = sorted(values)
+        return {"n": len(values), "p50_ms": round(statistics.median(values), 2),
+                "p95_ms": round(values[int(0.95 * (len(values) - 1))], 2), "max_ms": round(values[-1], 2)}
+
+    result = {kind: summary(values) for kind, values in timings.items()}
+    result["total"] = summary([v for values in timings.values() for v in values])
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=1_000_000)
+    parser.add_argument("--vocab", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=50, help="consultas por tipo")
+    parser.add_argument("--target-ms", type=float, default=50.0, help="p95 maximo")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.sqlite3')}"
+        os.environ["EXPORTS_DIR"] = os.path.join(tmp, "exports")
+        from app import create_app
+
+        app = create_app()
+        with app.app_context():
+            loaded = load(args.docs, args.vocab)
+            queries = _queries(loaded.pop("vocab"), args.queries, random.Random(2))
+            run_queries(queries[:20])  # calentar la cache de paginas de SQLite
+            timings = run_queries(queries)
+    result = {**loaded, "queries": timings, "target_ms": args.target_ms,
+              "ok": timings["total"]["p95_ms"] <= args.target_ms}
+    print(json.dumps(result, indent=2))
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+"""Benchmark de la simulacion Monte Carlo: tiempo y speedup vs. numero de workers.
+
+Usa un modelo de perdidas sintetico (sin base de datos) y la misma semilla en
+cada corrida, por lo que ademas verifica que el resultado no cambie con el
+numero de procesos. El resultado se imprime como JSON.
+
+Uso:
+    python bench_simulation.py [--risks 5000] [--trials 20000] [--workers 1 2 4 8]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from simulation import LossModel, simulate
+
+
+def synthetic_model(n_risks: int, seed: int = 1) -> LossModel:
+    rng = np.random.default_rng(seed)
+    asset_id = np.sort(rng.integers(1, max(2, n_risks // 10), n_risks))
+    asset_ids, asset_starts = np.unique(asset_id, return_index=True)
+    return LossModel(
+        frequency=rng.choice([0.05, 0.2, 0.5, 1.0, 3.0], n_risks),
+        loss_mu=np.log(rng.choice([1_000, 25_000, 500_000], n_risks)),
+        asset_ids=asset_ids,
+        asset_starts=asset_starts,
+    )
+
+
+def main() -> None:
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--risks", type=int, default=5000)
+    parser.add_argument("--trials", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, *(w for w in (2, 4, 8, 16) if w <= cpus), cpus}))
+    args = parser.parse_args()
+
+    model = synthetic_model(args.risks)
+    results, reference, base = [], None, None
+    for workers in args.workers:
+        start = time.perf_counter()
+        portfolio, assets = simulate(model, args.trials, seed=1, workers=workers)
+        seconds = time.perf_counter() - start
+        base = base or seconds
+        if reference is None:
+            reference = (portfolio, assets)
+        results.append({
+            "workers": workers,
+            "seconds": round(seconds, 3),
+            "speedup": round(base / seconds, 2),
+            "efficiency": round(base / seconds / workers, 2),
+            "same_result": bool(np.array_equal(reference[0], portfolio)
+                                and np.array_equal(reference[1].cents, assets.cents)
+                                and np.array_equal(reference[1].counts, assets.counts)),
+        })
+    print(json.dumps({"cpus": cpus, "risks": args.risks, "trials": args.trials, "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark de arranque en frio: import, create_app() y primer request.
+
+Prepara una base temporal migrada (python migrate.py, que tambien
+precompila las plantillas) con datos sinteticos y despues lanza --runs
+procesos nuevos, cada uno mide:
+
+- import_ms: `import app` (modulos y dependencias).
+- create_app_ms: configuracion, engine y chequeo de esquema.
+- first_request_ms: primer GET (compila o carga la plantilla, calienta el pool).
+- process_ms: el proceso completo, visto desde afuera (incluye el interprete).
+
+Compara las medianas con la linea base guardada en startup_baseline.json y
+termina con codigo 1 si alguna empeora mas de --tolerance. La linea base
+depende de la maquina: regenerarla con --update-baseline en la maquina de
+referencia cuando un cambio la mueva a proposito.
+
+Uso:
+    python bench_startup.py [--runs 7] [--path /risks]
+    python bench_startup.py --update-baseline
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+BASELINE_PATH = os.path.join(BASE_DIR, "startup_baseline.json")
+METRICS = ("import_ms", "create_app_ms", "first_request_ms", "process_ms")
+HEAVY_MODULES = ("reportlab", "numpy", "pyarrow", "openpyxl")
+
+_PREPARE = """
+from app import create_app
+from seed import generate
+with create_app().app_context():
+    generate(n_assets=200, n_catalog=50, n_risks=2000)
+"""
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app as module
+t1 = time.perf_counter()
+application = module.create_app()
+t2 = time.perf_counter()
+status = application.test_client().get(sys.argv[1]).status_code
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "status": status,
+    "heavy_modules": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def _python(code: str, env: dict, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-c", code, *args], cwd=BASE_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def measure(runs: int, path: str) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ,
+               "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'startup.sqlite3')}",
+               "EXPORTS_DIR": os.path.join(tmp, "exports")}
+        subprocess.run([sys.executable, "migrate.py"], cwd=BASE_DIR, env=env, capture_output=True, check=True)
+        _python(_PREPARE, env)
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            out = _python(_PROBE, env, path)
+            sample = json.loads(out.stdout.strip().splitlines()[-1])
+            sample["process_ms"] = (time.perf_counter() - start) * 1000
+            samples.append(sample)
+    result = {name: round(statistics.median(s[name] for s in samples), 1) for name in METRICS}
+    result["status"] = samples[-1]["status"]
+    result["heavy_modules"] = samples[-1]["heavy_modules"]
+    return result
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Metricas que empeoraron mas de `tolerance` (fraccion) respecto de la linea base."""
+    regressions = []
+    for name in METRICS:
+        if name in baseline and result[name] > baseline[name] * (1 + tolerance):
+            regressions.append(f"{name}: {result[name]} ms (base {baseline[name]} ms)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--path", default="/risks", help="ruta del primer request")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="empeoramiento admitido (0.3 = 30%%)")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    result = measure(args.runs, args.path)
+    if args.update_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as fh:
+            json.dump({**{name: result[name] for name in METRICS}, "path": args.path, "runs": args.runs},
+                      fh, indent=2)
+            fh.write("\n")
+        print(json.dumps(result, indent=2))
+        return 0
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+    regressions = compare(result, baseline, args.tolerance)
+    print(json.dumps({**result, "baseline": baseline, "regressions": regressions}, indent=2))
+    return 1 if regressions or result["status"] != 200 or result["heavy_modules"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
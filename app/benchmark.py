@@ -0,0 +1,160 @@
+"""Benchmark de rutas a varias escalas con baseline JSON para regresiones.
+
+Para cada escala genera una base temporal con seed.generate(), recorre
+/, /risks, /risks/<id> y el reporte PDF con el cliente de pruebas de Flask y
+registra percentiles de latencia, consultas SQL por request y memoria pico.
+Cada escala corre en un subproceso propio para aislar la memoria.
+
+Uso:
+    python benchmark.py --scales 1000 10000 --save baseline.json
+    python benchmark.py --scales 1000 10000 --compare baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROUTES = ["/", "/risks", "/risks?level=Critico", "/risks/{risk_id}"]
+REPORT_ROUTE = "/reports/risk-register.pdf"
+# Una ruta regresa si su p95 empeora mas que este factor respecto del baseline.
+TOLERANCE = 1.5
+
+
+def _peak_rss_kb() -> int | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _summary(latencies: list[float], queries: list[int]) -> dict:
+    ms = [v * 1000 for v in latencies]
+    return {
+        "n": len(ms),
+        "p50_ms": round(_percentile(ms, 50), 2),
+        "p95_ms": round(_percentile(ms, 95), 2),
+        "p99_ms": round(_percentile(ms, 99), 2),
+        "mean_ms": round(statistics.fmean(ms), 2),
+        "queries": max(queries),
+    }
+
+
+def measure(n_risks: int, repeat: int) -> dict:
+    tmp = tempfile.mkdtemp(prefix="riskguard-bench-")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "bench.sqlite3")
+    os.environ["EXPORTS_DIR"] = os.path.join(tmp, "exports")
+
+    from sqlalchemy import event
+
+    from app import create_app
+    from models import db
+    from seed import generate
+
+    app = create_app()
+    counter = {"n": 0}
+    with app.app_context():
+        start = time.perf_counter()
+        generate(n_assets=max(1, n_risks // 10), n_catalog=max(10, n_risks // 100), n_risks=n_risks)
+        seed_seconds = time.perf_counter() - start
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            counter["n"] += 1
+
+    client = app.test_client()
+    rnd = random.Random(1)
+    routes = {}
+    for route in ROUTES:
+        latencies, queries = [], []
+        for _ in range(repeat):
+            url = route.format(risk_id=rnd.randint(1, n_risks))
+            counter["n"] = 0
+            start = time.perf_counter()
+            resp = client.get(url)
+            latencies.append(time.perf_counter() - start)
+            queries.append(counter["n"])
+            assert resp.status_code == 200, (url, resp.status_code)
+        routes[route] = _summary(latencies, queries)
+
+    # El PDF se genera en segundo plano: se mide desde el click hasta la descarga.
+    start = time.perf_counter()
+    counter["n"] = 0
+    resp = client.get(REPORT_ROUTE)
+    if resp.mimetype != "application/pdf":
+        job_id = resp.get_data(as_text=True).split("<code>")[1].split("</code>")[0]
+        while (job := client.get(f"/reports/jobs/{job_id}").get_json())["status"] not in ("done", "error"):
+            time.sleep(0.05)
+        resp = client.get(job["download_url"])
+    resp.close()
+    routes[REPORT_ROUTE] = _summary([time.perf_counter() - start], [counter["n"]])
+
+    return {"risks": n_risks, "seed_seconds": round(seed_seconds, 2), "peak_rss_kb": _peak_rss_kb(), "routes": routes}
+
+
+def compare(results: list[dict], baseline: list[dict]) -> list[str]:
+    """Lista de regresiones (p95 o consultas) respecto del baseline."""
+    base = {b["risks"]: b for b in baseline}
+    problems = []
+    for res in results:
+        ref = base.get(res["risks"])
+        if not ref:
+            continue
+        for route, cur in res["routes"].items():
+            old = ref["routes"].get(route)
+            if not old:
+                continue
+            if cur["p95_ms"] > old["p95_ms"] * TOLERANCE:
+                problems.append(f"{res['risks']} {route}: p95 {old['p95_ms']} -> {cur['p95_ms']} ms")
+            if cur["queries"] > old["queries"]:
+                problems.append(f"{res['risks']} {route}: consultas {old['queries']} -> {cur['queries']}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--save", help="guardar resultados como baseline JSON")
+    parser.add_argument("--compare", help="comparar contra un baseline JSON")
+    parser.add_argument("--one", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.one is not None:
+        print(json.dumps(measure(args.one, args.repeat)))
+        return 0
+
+    results = []
+    for n in args.scales:
+        proc = subprocess.run([sys.executable, __file__, "--one", str(n), "--repeat", str(args.repeat)],
+                              capture_output=True, text=True, check=True)
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            problems = compare(results, json.load(fh))
+        for p in problems:
+            print("REGRESION", p)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
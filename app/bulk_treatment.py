@@ -0,0 +1,249 @@
+"""Cambios masivos de tratamiento sobre los riesgos que cumplen un filtro.
+
+Aplica los mismos valores (estrategia, responsable, fecha limite, estado,
+valores residuales) y agrega o quita controles propuestos en todos los
+riesgos seleccionados, con sentencias por conjunto y en una sola
+transaccion:
+
+- un UPDATE de risk_scenario, que recalcula en SQL los scores residuales
+  materializados si cambian los valores residuales;
+- un INSERT OR IGNORE y un DELETE sobre risk_controls.
+
+Los IDs seleccionados viajan como un solo parametro JSON (utils.in_ids):
+no hay un UPDATE por fila ni limite de variables de SQLite. Las sentencias
+van directo a la conexion, asi que este modulo hace lo que en el ORM hacen
+los listeners: resta y suma las celdas de los contadores, sube las
+versiones de datos del cache de paginas, marca updated_at y deja en el
+historial un diff por riesgo modificado (audit.record). El indice de
+busqueda lo mantienen sus triggers.
+"""
+from __future__ import annotations
+
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field, fields
+from datetime import date, datetime
+
+from sqlalchemy import delete, func, insert, select, true, update
+
+from audit import record
+from catalog_cache import exists
+from counters import apply_delta, count_cells
+from forms import STATUS, TREATMENT_STRATEGIES
+from models import db, Asset, RiskScenario, _stored_scores_values, asset_impact_sql, risk_controls, touch_risks
+from queries import RiskFilters
+from response_cache import _bump
+from utils import in_ids, json_ids
+
+FIELDS = ("treatment_strategy", "responsible", "due_date", "status",
+          "residual_probability", "residual_impact", "completed_at")
+FILTER_FIELDS = tuple(f.name for f in fields(RiskFilters))
+RESIDUAL_FIELDS = {"residual_probability", "residual_impact"}
+# Campos que definen celdas de los contadores.
+COUNTED_FIELDS = {"status", "treatment_strategy", *RESIDUAL_FIELDS}
+STORED_RESIDUAL = ("residual_score", "residual_level")
+MAX_CONTROLS = 200
+
+
+@dataclass
+class BulkChange:
+    values: dict = field(default_factory=dict)  # columna -> valor (None = vaciar)
+    add_controls: list[int] = field(default_factory=list)
+    remove_controls: list[int] = field(default_factory=list)
+
+    @property
+    def empty(self) -> bool:
+        return not (self.values or self.add_controls or self.remove_controls)
+
+
+@dataclass
+class BulkResult:
+    selected: int = 0  # riesgos que cumplen el filtro
+    updated: int = 0  # filas de risk_scenario escritas por el UPDATE
+    changed: int = 0  # riesgos con algun valor o control distinto (entradas del historial)
+    controls_added: int = 0
+    controls_removed: int = 0
+    elapsed_ms: float = 0.0
+    dry_run: bool = False
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+# ------------------- Validacion -------------------
+def _parse_value(name: str, value):
+    """Valor enviado (formulario o JSON) -> valor de la columna; ValueError si no es valido."""
+    if value is None or value == "":
+        if name == "status":
+            raise ValueError("status: no se puede vaciar")
+        return None
+    if name == "treatment_strategy" and value not in dict(TREATMENT_STRATEGIES):
+        raise ValueError(f"treatment_strategy: debe ser {', '.join(dict(TREATMENT_STRATEGIES))}")
+    if name == "status" and value not in dict(STATUS):
+        raise ValueError(f"status: debe ser {', '.join(dict(STATUS))}")
+    if name == "responsible":
+        if not isinstance(value, str) or len(value.strip()) > 120:
+            raise ValueError("responsible: texto de hasta 120 caracteres")
+        return value.strip() or None
+    if name in RESIDUAL_FIELDS:
+        try:
+            number = int(value) if not isinstance(value, bool) else 0
+        except (TypeError, ValueError):
+            number = 0
+        if not 1 <= number <= 5:
+            raise ValueError(f"{name}: entero de 1 a 5")
+        return number
+    if name in ("due_date", "completed_at"):
+        if isinstance(value, date):
+            return value
+        try:
+            return date.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name}: fecha ISO (AAAA-MM-DD)") from None
+    return value
+
+
+def parse_change(values: dict, add_controls=(), remove_controls=()) -> tuple[BulkChange, list[str]]:
+    """Valida y convierte los cambios pedidos; devuelve el cambio y los errores."""
+    change, errors = BulkChange(), []
+    for name, value in values.items():
+        if name not in FIELDS:
+            errors.append(f"{name}: campo desconocido o no editable en lote")
+            continue
+        try:
+            change.values[name] = _parse_value(name, value)
+        except ValueError as exc:
+            errors.append(str(exc))
+    for name, ids in (("add_controls", add_controls), ("remove_controls", remove_controls)):
+        if not isinstance(ids, (list, tuple)) or len(ids) > MAX_CONTROLS \
+                or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            errors.append(f"{name}: lista de hasta {MAX_CONTROLS} IDs de controles")
+        elif not exists("controls", ids):
+            errors.append(f"{name}: hay controles inexistentes")
+        else:
+            setattr(change, name, sorted(set(ids)))
+    if set(change.add_controls) & set(change.remove_controls):
+        errors.append("Un control no puede agregarse y quitarse a la vez")
+    if not errors and change.empty:
+        errors.append("No hay cambios para aplicar")
+    return change, errors
+
+
+def parse_filters(args) -> tuple[RiskFilters, list[str]]:
+    """Como RiskFilters.from_args, pero un valor invalido es un error: ignorarlo ampliaria la seleccion."""
+    filters = RiskFilters.from_args(args)
+    errors = [f"{name}: valor de filtro invalido" for name in FILTER_FIELDS
+              if args.get(name) not in (None, "") and getattr(filters, name) is None]
+    return filters, errors
+
+
+# ------------------- Seleccion -------------------
+def _selection(filters: RiskFilters, ids=None):
+    stmt = filters.apply(select(RiskScenario.id))
+    if ids is not None:
+        stmt = stmt.where(in_ids(RiskScenario.id, ids))
+    return stmt
+
+
+def count_selected(filters: RiskFilters, ids=None) -> int:
+    stmt = select(func.count()).select_from(_selection(filters, ids).subquery())
+    return db.session.execute(stmt).scalar_one()
+
+
+# ------------------- Aplicacion -------------------
+def _rows(connection, risk_ids: list[int], columns: list[str]) -> dict[int, tuple]:
+    table = RiskScenario.__table__
+    rows = connection.execute(
+        select(table.c.id, *(table.c[name] for name in columns)).where(in_ids(table.c.id, risk_ids))
+    )
+    return {rid: tuple(values) for rid, *values in rows}
+
+
+def _controls(connection, risk_ids: list[int]) -> dict[int, list[int]]:
+    rows = connection.execute(
+        select(risk_controls.c.risk_id, risk_controls.c.control_id)
+        .where(in_ids(risk_controls.c.risk_id, risk_ids))
+        .order_by(risk_controls.c.risk_id, risk_controls.c.control_id)
+    )
+    by_risk: dict[int, list[int]] = {}
+    for rid, cid in rows:
+        by_risk.setdefault(rid, []).append(cid)
+    return by_risk
+
+
+def _apply(session, risk_ids: list[int], change: BulkChange, result: BulkResult) -> None:
+    conn = session.connection()
+    table = RiskScenario.__table__
+    values = change.values
+    residual = bool(RESIDUAL_FIELDS & set(values))
+    columns = [*values, *(STORED_RESIDUAL if residual else ())]
+    counted = bool(COUNTED_FIELDS & set(values))
+    moves_controls = bool(change.add_controls or change.remove_controls)
+
+    before_cells = count_cells(conn, risk_ids) if counted else Counter()
+    before = _rows(conn, risk_ids, columns) if columns else {}
+    old_controls = _controls(conn, risk_ids) if moves_controls else {}
+
+    if values:
+        stmt = update(table).where(in_ids(table.c.id, risk_ids)).values(**values, updated_at=datetime.utcnow())
+        if residual:
+            # Scores residuales materializados en el mismo UPDATE (UPDATE ... FROM asset).
+            stored = _stored_scores_values(asset_impact_sql(), values)
+            stmt = stmt.where(table.c.asset_id == Asset.id).values(
+                {name: stored[name] for name in STORED_RESIDUAL}
+            )
+        result.updated = conn.execute(stmt).rowcount
+    if change.remove_controls:
+        result.controls_removed = conn.execute(
+            delete(risk_controls).where(in_ids(risk_controls.c.risk_id, risk_ids),
+                                        risk_controls.c.control_id.in_(change.remove_controls))
+        ).rowcount
+    if change.add_controls:
+        risks, controls = json_ids(risk_ids, "r"), json_ids(change.add_controls, "c")
+        result.controls_added = conn.execute(
+            insert(risk_controls).prefix_with("OR IGNORE")
+            .from_select(["risk_id", "control_id"],
+                         select(risks.c.value, controls.c.value).select_from(risks.join(controls, true())))
+        ).rowcount
+
+    # Historial: un diff por riesgo, con el mismo formato que audit.object_diff.
+    after = _rows(conn, risk_ids, columns) if columns else {}
+    add, remove = set(change.add_controls), set(change.remove_controls)
+    moved = []
+    for rid in risk_ids:
+        changes = {name: [old, new] for name, old, new in zip(columns, before.get(rid, ()), after.get(rid, ()))
+                   if old != new}
+        if moves_controls:
+            old = old_controls.get(rid, [])
+            new = sorted((set(old) - remove) | add)
+            if old != new:
+                changes["proposed_controls"] = [old, new]
+                moved.append(rid)
+        if changes:
+            record(session, table.name, rid, "update", changes)
+            result.changed += 1
+
+    if moved and not values:
+        touch_risks(conn, moved)  # con values, el UPDATE ya marco updated_at
+    if counted:
+        delta = count_cells(conn, risk_ids)
+        delta.subtract(before_cells)
+        apply_delta(conn, delta)
+    touched = [table.name] if values or moved else []
+    if result.controls_added or result.controls_removed:
+        touched.append(risk_controls.name)
+    _bump(conn, touched)
+
+
+def apply_bulk(filters: RiskFilters, change: BulkChange, ids=None, dry_run: bool = False,
+               session=None) -> BulkResult:
+    """Aplica `change` a los riesgos que cumplen `filters` (y estan en `ids`) y commitea."""
+    session = session or db.session
+    start = time.perf_counter()
+    risk_ids = list(session.execute(_selection(filters, ids)).scalars())
+    result = BulkResult(selected=len(risk_ids), dry_run=dry_run)
+    if risk_ids and not dry_run:
+        _apply(session, risk_ids, change, result)
+        session.commit()
+    result.elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    return result
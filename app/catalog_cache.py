@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+from flask import g, has_app_context
+from sqlalchemy import collate, event, func, select
+from sqlalchemy.orm import Session
+
+from models import db, Asset, Threat, Vulnerability, Control
+from response_cache import data_versions
+
+# Con catalogos mas grandes que esto el <select> se llena por busqueda
+# (typeahead) en vez de renderizar todas las opciones.
+CHOICES_INLINE_MAX = 500
+SEARCH_LIMIT = 20
+
+
+@dataclass(frozen=True)
+class Catalog:
+    model: type
+    columns: tuple
+    label: Callable[..., str]
+
+
+def _control_label(cid, name, iso_reference):
+    return name + (f" [{iso_reference}]" if iso_reference else "")
+
+
+CATALOGS = {
+    "assets": Catalog(Asset, (Asset.id, Asset.name, Asset.asset_type), lambda i, n, t: f"{n} ({t})"),
+    "threats": Catalog(Threat, (Threat.id, Threat.name, Threat.category), lambda i, n, c: f"{n} ({c})"),
+    "vulnerabilities": Catalog(Vulnerability, (Vulnerability.id, Vulnerability.name, Vulnerability.category),
+                               lambda i, n, c: f"{n} ({c})"),
+    "controls": Catalog(Control, (Control.id, Control.name, Control.iso_reference), _control_label),
+}
+_TABLES = [c.model.__tablename__ for c in CATALOGS.values()]
+
+# Clave: version de datos de la tabla (ver response_cache.data_versions), que
+# sube con cualquier escritura commiteada de cualquier worker.
+_cache: dict[str, tuple[tuple, int, list | None]] = {}
+_lock = threading.Lock()
+
+
+def _versions() -> dict:
+    """Versiones de las tablas de catalogo: una consulta por request (se relee despues de un flush)."""
+    if not has_app_context():
+        return data_versions(_TABLES)
+    if "catalog_versions" not in g:
+        g.catalog_versions = data_versions(_TABLES)
+    return g.catalog_versions
+
+
+def _load(kind: str) -> tuple[int, list | None]:
+    cat = CATALOGS[kind]
+    # La version se lee antes que las filas: si entre medio se commitea un
+    # cambio, queda guardado con la version vieja y la proxima lectura recarga.
+    version = _versions()[cat.model.__tablename__]
+    with _lock:
+        entry = _cache.get(kind)
+    if entry and entry[0] == version:
+        return entry[1], entry[2]
+
+    count = db.session.execute(select(func.count(cat.model.id))).scalar_one()
+    choices = None
+    if count <= CHOICES_INLINE_MAX:
+        rows = db.session.execute(select(*cat.columns).order_by(collate(cat.model.name, "NOCASE")))
+        choices = [(row[0], cat.label(*row)) for row in rows]
+    with _lock:
+        _cache[kind] = (version, count, choices)
+    return count, choices
+
+
+def catalog_count(kind: str) -> int:
+    return _load(kind)[0]
+
+
+def is_large(kind: str) -> bool:
+    return _load(kind)[1] is None
+
+
+def catalog_choices(kind: str, selected: list[int] | None = None) -> list[tuple[int, str]]:
+    """Opciones (id, etiqueta) cacheadas por version del catalogo.
+
+    Si el catalogo es grande solo se devuelven las opciones seleccionadas;
+    el resto se busca con search_catalog().
+    """
+    choices = _load(kind)[1]
+    if choices is not None:
+        return choices
+    return labels_for(kind, selected or [])
+
+
+def labels_for(kind: str, ids: list[int]) -> list[tuple[int, str]]:
+    if not ids:
+        return []
+    cat = CATALOGS[kind]
+    rows = db.session.execute(select(*cat.columns).where(cat.model.id.in_(ids)))
+    return [(row[0], cat.label(*row)) for row in rows]
+
+
+def search_catalog(kind: str, q: str, limit: int = SEARCH_LIMIT) -> list[dict]:
+    """Busqueda por prefijo de nombre sin distinguir mayusculas (indice ix_<tabla>_name_nocase) o por ID exacto."""
+    cat = CATALOGS[kind]
+    q = q.strip()
+    name = collate(cat.model.name, "NOCASE")
+    stmt = select(*cat.columns).order_by(name).limit(limit)
+    if q.isdigit():
+        stmt = stmt.where(cat.model.id == int(q))
+    elif q:
+        # Rango con la misma collation que el indice (NOCASE solo pliega ASCII).
+        stmt = stmt.where(name >= q, name < q + "\uffff")
+    return [{"id": row[0], "label": cat.label(*row)} for row in db.session.execute(stmt)]
+
+
+def exists(kind: str, ids: list[int]) -> bool:
+    """Validacion por busqueda puntual (no carga el catalogo)."""
+    ids = set(ids)
+    if not ids:
+        return True
+    model = CATALOGS[kind].model
+    found = db.session.execute(select(func.count(model.id)).where(model.id.in_(ids))).scalar_one()
+    return found == len(ids)
+
+
+
+@event.listens_for(Session, "after_flush")
+def _forget_versions(session, flush_context):
+    if has_app_context():
+        g.pop("catalog_versions", None)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _forget_versions_bulk(orm_execute_state):
+    if (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete) \
+            and has_app_context():
+        g.pop("catalog_versions", None)
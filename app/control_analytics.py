@@ -0,0 +1,499 @@
+"""Cobertura y efectividad de controles sobre una matriz dispersa riesgo x control (requiere numpy).
+
+risk_controls se carga como matriz de incidencia CSR en arreglos de numpy:
+filas = riesgos ordenados por id, columnas = controles ordenados por id,
+`indptr`/`indices` sin valores (todas las entradas valen 1). Junto a cada
+fila van el score inherente y el residual (0 si no hay evaluacion) de las
+columnas materializadas.
+
+Actualizacion incremental: cada consulta lee las versiones de datos
+(data_version, una consulta). Si cambiaron, se releen solo los riesgos con
+updated_at posterior a la ultima lectura (menos un margen) junto con sus
+controles, y se reemplazan esas filas; updated_at cambia tambien cuando
+cambian los controles propuestos (ORM y bulk_treatment). Los riesgos
+borrados se detectan por conteo. Controles nuevos agregan columnas; otro
+cambio en el catalogo de controles, o en mas de REBUILD_FRACTION de los
+riesgos, reconstruye la matriz completa.
+
+Sobre la matriz (calculado una vez por version):
+- cobertura de cada control (riesgos donde esta propuesto), por nivel inherente;
+- reduccion media inherente -> residual de los riesgos cubiertos con
+  evaluacion residual;
+- riesgos Alto/Critico (inherente) sin ningun control propuesto;
+- agregados por tema y por referencia ISO 27002 (Control.iso_reference).
+
+Uso:
+    python control_analytics.py --check                       # compara con agregados SQL
+    python control_analytics.py --bench 1000000 --controls 10000  # sin base de datos
+"""
+from __future__ import annotations
+
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from models import db, Control, RiskScenario, risk_controls
+from response_cache import data_versions
+from scoring import LEVEL_NAMES, level_codes, np, require_numpy
+from utils import in_ids
+
+TABLES = ("risk_scenario", "risk_controls", "control", "asset")
+# Mas de esta fraccion de riesgos cambiados: se recarga todo.
+REBUILD_FRACTION = 0.25
+# Margen sobre updated_at: cubre transacciones que escribieron antes de la
+# ultima lectura y commitearon despues. Releer de mas no cambia el resultado.
+OVERLAP = timedelta(minutes=2)
+HIGH_LEVELS = (2, 3)  # Alto, Critico
+ISO_THEMES = {"5": "Organizacionales", "6": "Personas", "7": "Fisicos", "8": "Tecnologicos"}
+NO_CODE = "Sin codigo"
+NO_REFERENCE = "Sin referencia"
+SORTS = ("coverage", "reduction", "high", "id")
+_CHUNK = 50_000
+_ISO_STANDARD = re.compile(r"iso(/iec)?\s*2700[12](:\d{4})?\s*-?\s*", re.IGNORECASE)
+_ISO_CODE = re.compile(r"(?<![\d.])([5-8])\.(\d{1,2})(?![\d.])")
+
+
+def iso_parts(reference: str | None) -> tuple[str, str]:
+    """(tema, referencia) de un control: ("8", "8.13") o (NO_CODE, texto) si no trae codigo."""
+    if not reference or not reference.strip():
+        return NO_CODE, NO_REFERENCE
+    rest = _ISO_STANDARD.sub("", reference).strip()
+    match = _ISO_CODE.search(rest)
+    if match:
+        return match.group(1), f"{match.group(1)}.{int(match.group(2))}"
+    return NO_CODE, rest or reference.strip()
+
+
+# ------------------- Matriz -------------------
+@dataclass
+class CoverageMatrix:
+    risk_ids: "np.ndarray"  # int32, ordenados
+    inherent: "np.ndarray"  # int8
+    residual: "np.ndarray"  # int8, 0 = sin evaluacion residual
+    indptr: "np.ndarray"  # int64, n_riesgos + 1
+    indices: "np.ndarray"  # int32, posicion del control de cada entrada
+    control_ids: "np.ndarray"  # int32, ordenados
+    control_names: list[str]
+    iso_references: list[str | None]
+    versions: dict = field(default_factory=dict)
+    loaded_at: datetime | None = None
+    _cache: dict = field(default_factory=dict, repr=False)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self.risk_ids), len(self.control_ids)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.indices)
+
+    @property
+    def level(self) -> "np.ndarray":
+        """Codigo de nivel inherente (0-3) por fila."""
+        if "level" not in self._cache:
+            self._cache["level"] = level_codes(self.inherent)
+        return self._cache["level"]
+
+    @property
+    def entry_rows(self) -> "np.ndarray":
+        """Fila de cada entrada (el complemento de `indices`)."""
+        if "rows" not in self._cache:
+            counts = np.diff(self.indptr)
+            self._cache["rows"] = np.repeat(np.arange(len(self.risk_ids), dtype=np.int32), counts)
+        return self._cache["rows"]
+
+    @classmethod
+    def from_pairs(cls, risk_ids, inherent, residual, pair_risk, pair_control, control_ids, control_names,
+                   iso_references, **extra) -> "CoverageMatrix":
+        rows, cols = _positions(risk_ids, pair_risk, control_ids, pair_control)
+        if len(rows) and np.any(np.diff(rows) < 0):
+            order = np.argsort(rows, kind="stable")
+            rows, cols = rows[order], cols[order]
+        counts = np.bincount(rows, minlength=len(risk_ids))
+        return cls(risk_ids, inherent, residual, _indptr(counts), cols.astype(np.int32), control_ids,
+                   control_names, iso_references, **extra)
+
+    def with_rows(self, ids, inherent, residual, pair_risk, pair_control) -> "CoverageMatrix":
+        """Copia con las filas `ids` (nuevas o existentes) reemplazadas por estos valores y controles."""
+        risk_ids, inh, res = self.risk_ids, self.inherent.copy(), self.residual.copy()
+        counts = np.diff(self.indptr)
+        pos = np.searchsorted(risk_ids, ids)
+        new = ~_found(risk_ids, ids, pos)
+        if new.any():
+            # Filas nuevas vacias en su lugar (casi siempre al final).
+            at = np.searchsorted(risk_ids, ids[new])
+            risk_ids = np.insert(risk_ids, at, ids[new])
+            inh, res, counts = np.insert(inh, at, 0), np.insert(res, at, 0), np.insert(counts, at, 0)
+        rows = np.searchsorted(risk_ids, ids)
+        inh[rows], res[rows] = inherent, residual
+
+        # Quitar las entradas actuales de esas filas...
+        indptr = _indptr(counts)
+        lens = counts[rows]
+        drop = np.repeat(indptr[rows], lens) + (np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens))
+        indices = np.delete(self.indices, drop)
+        counts[rows] = 0
+        # ...e insertar las nuevas al comienzo de cada fila (ahora vacia).
+        prow, pcol = _positions(risk_ids, pair_risk, self.control_ids, pair_control)
+        order = np.argsort(prow, kind="stable")
+        prow, pcol = prow[order], pcol[order]
+        indices = np.insert(indices, _indptr(counts)[prow], pcol.astype(np.int32))
+        counts += np.bincount(prow, minlength=len(risk_ids))
+        return CoverageMatrix(risk_ids, inh, res, _indptr(counts), indices, self.control_ids, self.control_names,
+                              self.iso_references)
+
+    def without_rows(self, ids) -> "CoverageMatrix":
+        """Copia sin las filas `ids` (riesgos borrados)."""
+        empty = np.empty(0, dtype=np.int32)
+        ids = ids[_found(self.risk_ids, ids, np.searchsorted(self.risk_ids, ids))]
+        m = self.with_rows(ids, np.zeros(len(ids), np.int8), np.zeros(len(ids), np.int8), empty, empty)
+        keep = ~np.isin(m.risk_ids, ids)
+        return CoverageMatrix(m.risk_ids[keep], m.inherent[keep], m.residual[keep],
+                              _indptr(np.diff(m.indptr)[keep]), m.indices, m.control_ids, m.control_names,
+                              m.iso_references)
+
+    def with_controls(self, control_ids, names, iso_references) -> "CoverageMatrix | None":
+        """Copia con el catalogo de controles actualizado, o None si hay que recargar todo.
+
+        Solo se admiten nombres/referencias cambiados y controles nuevos al final:
+        las posiciones de las columnas existentes no se mueven.
+        """
+        n = len(self.control_ids)
+        if len(control_ids) < n or not np.array_equal(control_ids[:n], self.control_ids):
+            return None
+        return CoverageMatrix(self.risk_ids, self.inherent, self.residual, self.indptr, self.indices,
+                              control_ids, names, iso_references)
+
+    # ------------------- Calculos -------------------
+    def summary(self) -> dict:
+        """Agregados por control (arreglos alineados con control_ids)."""
+        if "summary" not in self._cache:
+            rows, cols, n = self.entry_rows, self.indices, len(self.control_ids)
+            evaluated = self.residual[rows] > 0
+            reduction = np.where(evaluated, self.inherent[rows].astype(np.int16) - self.residual[rows], 0)
+            self._cache["summary"] = {
+                "coverage": np.bincount(cols, minlength=n),
+                "by_level": np.bincount(cols.astype(np.int64) * 4 + self.level[rows], minlength=n * 4).reshape(n, 4),
+                "evaluated": np.bincount(cols, weights=evaluated, minlength=n).astype(np.int64),
+                "reduction": np.bincount(cols, weights=reduction, minlength=n),
+            }
+        return self._cache["summary"]
+
+    def uncovered_high(self, limit: int = 20) -> dict:
+        """Riesgos Alto/Critico sin controles propuestos: conteos y los de mayor score."""
+        if "uncovered" not in self._cache:
+            rows = np.flatnonzero((np.diff(self.indptr) == 0) & (self.level >= HIGH_LEVELS[0]))
+            self._cache["uncovered"] = rows[np.lexsort((-self.risk_ids[rows], -self.inherent[rows]))]
+        rows = self._cache["uncovered"]
+        top = rows[:limit]
+        by_level = np.bincount(self.level[rows], minlength=4)
+        return {
+            **{LEVEL_NAMES[code]: int(by_level[code]) for code in HIGH_LEVELS},
+            "total": len(rows),
+            "top": [{"id": int(self.risk_ids[r]), "inherent_score": int(self.inherent[r])} for r in top],
+        }
+
+    def control_rows(self, order: str = "coverage", theme: str | None = None) -> "np.ndarray":
+        """Posiciones de los controles ordenadas (y filtradas por tema ISO)."""
+        key = ("order", order, theme)
+        if key not in self._cache:
+            s = self.summary()
+            positions = np.arange(len(self.control_ids))
+            if theme:
+                themes = np.array([iso_parts(ref)[0] for ref in self.iso_references])
+                positions = positions[themes == theme] if len(themes) else positions[:0]
+            ids = self.control_ids[positions]
+            if order == "id":
+                ranked = np.argsort(ids, kind="stable")
+            elif order == "reduction":
+                evaluated, reduction = s["evaluated"][positions], s["reduction"][positions]
+                mean = np.divide(reduction, evaluated, out=np.full(len(ids), -1.0), where=evaluated > 0)
+                ranked = np.lexsort((ids, -mean))
+            elif order == "high":
+                ranked = np.lexsort((ids, -s["by_level"][positions][:, 2:].sum(axis=1)))
+            else:
+                ranked = np.lexsort((ids, -s["coverage"][positions]))
+            self._cache[key] = positions[ranked]
+        return self._cache[key]
+
+    def control_item(self, col: int) -> dict:
+        s = self.summary()
+        evaluated = int(s["evaluated"][col])
+        return {
+            "id": int(self.control_ids[col]),
+            "name": self.control_names[col],
+            "iso_reference": self.iso_references[col],
+            "coverage": int(s["coverage"][col]),
+            "by_level": dict(zip(LEVEL_NAMES, s["by_level"][col].tolist())),
+            "evaluated": evaluated,
+            "mean_reduction": round(float(s["reduction"][col]) / evaluated, 2) if evaluated else None,
+        }
+
+    def covered_risks(self, control_id: int, limit: int = 100, offset: int = 0) -> dict | None:
+        """Riesgos donde el control esta propuesto, de mayor a menor score inherente."""
+        col = int(np.searchsorted(self.control_ids, control_id))
+        if col >= len(self.control_ids) or self.control_ids[col] != control_id:
+            return None
+        rows = self.entry_rows[self.indices == col]
+        rows = rows[np.lexsort((-self.risk_ids[rows], -self.inherent[rows]))]
+        page = rows[offset:offset + limit]
+        return {
+            **self.control_item(col),
+            "items": [{"id": int(self.risk_ids[r]), "inherent_score": int(self.inherent[r]),
+                       "inherent_level": LEVEL_NAMES[self.level[r]],
+                       "residual_score": int(self.residual[r]) or None} for r in page],
+            "next_offset": offset + limit if offset + limit < len(rows) else None,
+        }
+
+    def iso_rollup(self, by: str = "theme") -> list[dict]:
+        """Controles, riesgos distintos cubiertos (total y Alto/Critico) y reduccion media por grupo ISO."""
+        key = ("iso", by)
+        if key not in self._cache:
+            part = 0 if by == "theme" else 1
+            labels = [iso_parts(ref)[part] for ref in self.iso_references]
+            groups = sorted(set(labels), key=lambda g: (g in (NO_CODE, NO_REFERENCE), _natural(g)))
+            group_of = np.array([groups.index(g) for g in labels], dtype=np.int64)
+            n_groups = len(groups)
+            # Un riesgo cubierto por dos controles del mismo grupo cuenta una vez.
+            pairs = _distinct(self.entry_rows.astype(np.int64) * max(n_groups, 1) + group_of[self.indices]) \
+                if n_groups else np.empty(0, dtype=np.int64)
+            rows, gids = pairs // max(n_groups, 1), pairs % max(n_groups, 1)
+            evaluated = self.residual[rows] > 0
+            reduction = np.where(evaluated, self.inherent[rows].astype(np.int16) - self.residual[rows], 0)
+            risks = np.bincount(gids, minlength=n_groups)
+            high = np.bincount(gids, weights=np.isin(self.level[rows], HIGH_LEVELS), minlength=n_groups)
+            n_eval = np.bincount(gids, weights=evaluated, minlength=n_groups)
+            total_reduction = np.bincount(gids, weights=reduction, minlength=n_groups)
+            controls = np.bincount(group_of, minlength=n_groups)
+            self._cache[key] = [
+                {
+                    "group": g,
+                    "label": ISO_THEMES.get(g, g) if by == "theme" else g,
+                    "controls": int(controls[i]),
+                    "risks": int(risks[i]),
+                    "high_risks": int(high[i]),
+                    "mean_reduction": round(float(total_reduction[i] / n_eval[i]), 2) if n_eval[i] else None,
+                }
+                for i, g in enumerate(groups)
+            ]
+        return self._cache[key]
+
+
+def _natural(label: str) -> tuple:
+    return tuple(int(p) if p.isdigit() else p for p in re.split(r"(\d+)", label))
+
+
+def _distinct(keys: "np.ndarray") -> "np.ndarray":
+    """np.unique por ordenamiento: las claves llegan casi ordenadas (por fila) y
+    el unique por hash de numpy es mucho mas lento con millones de enteros."""
+    keys = np.sort(keys)
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))] if len(keys) else keys
+
+
+def _indptr(counts: "np.ndarray") -> "np.ndarray":
+    indptr = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr
+
+
+def _found(sorted_ids, ids, pos) -> "np.ndarray":
+    if not len(sorted_ids):
+        return np.zeros(len(ids), dtype=bool)
+    return (pos < len(sorted_ids)) & (sorted_ids[np.minimum(pos, len(sorted_ids) - 1)] == ids)
+
+
+def _positions(risk_ids, pair_risk, control_ids, pair_control):
+    """(fila, columna) de cada par; se descartan pares de riesgos o controles desconocidos."""
+    rows, cols = np.searchsorted(risk_ids, pair_risk), np.searchsorted(control_ids, pair_control)
+    valid = _found(risk_ids, pair_risk, rows) & _found(control_ids, pair_control, cols)
+    return rows[valid], cols[valid]
+
+
+# ------------------- Carga -------------------
+def _int_array(session, stmt, width: int) -> "np.ndarray":
+    chunks = [np.array([tuple(row) for row in part], dtype=np.int32)
+              for part in session.execute(stmt.execution_options(yield_per=_CHUNK)).partitions()]
+    return np.concatenate(chunks) if chunks else np.empty((0, width), dtype=np.int32)
+
+
+def _read_controls(session):
+    rows = session.execute(select(Control.id, Control.name, Control.iso_reference).order_by(Control.id)).all()
+    return np.array([r[0] for r in rows], dtype=np.int32), [r[1] for r in rows], [r[2] for r in rows]
+
+
+def _read_risks(session, where=None):
+    r = RiskScenario
+    stmt = select(r.id, func.coalesce(r.stored_inherent_score, 0), func.coalesce(r.stored_residual_score, 0))
+    if where is not None:
+        stmt = stmt.where(where)
+    data = _int_array(session, stmt.order_by(r.id), 3)
+    return data[:, 0].copy(), data[:, 1].astype(np.int8), data[:, 2].astype(np.int8)
+
+
+def _read_pairs(session, where=None):
+    stmt = select(risk_controls.c.risk_id, risk_controls.c.control_id)
+    if where is not None:
+        stmt = stmt.where(where)
+    data = _int_array(session, stmt.order_by(risk_controls.c.risk_id, risk_controls.c.control_id), 2)
+    return data[:, 0].copy(), data[:, 1].copy()
+
+
+def load_matrix(session) -> CoverageMatrix:
+    """Lee el registro completo y arma la matriz."""
+    require_numpy()
+    loaded_at = datetime.utcnow() - OVERLAP
+    versions = data_versions(TABLES)
+    controls = _read_controls(session)
+    return CoverageMatrix.from_pairs(*_read_risks(session), *_read_pairs(session), *controls,
+                                     versions=versions, loaded_at=loaded_at)
+
+
+def refresh(matrix: CoverageMatrix, session) -> CoverageMatrix:
+    """Matriz al dia: la misma si no cambio nada, parcheada si cambiaron pocos riesgos, o recargada."""
+    versions = data_versions(TABLES)
+    if versions == matrix.versions:
+        return matrix
+    loaded_at = datetime.utcnow() - OVERLAP
+    m = matrix
+    if versions["control"] != matrix.versions.get("control"):
+        m = matrix.with_controls(*_read_controls(session))
+        if m is None:
+            return load_matrix(session)
+
+    changed = RiskScenario.updated_at >= matrix.loaded_at
+    n_changed = session.execute(select(func.count()).where(changed)).scalar_one()
+    if n_changed > REBUILD_FRACTION * max(len(matrix.risk_ids), 1):
+        return load_matrix(session)
+    if n_changed:
+        ids, inherent, residual = _read_risks(session, changed)
+        m = m.with_rows(ids, inherent, residual, *_read_pairs(session, in_ids(risk_controls.c.risk_id, ids.tolist())))
+
+    # Borrados: no dejan updated_at; se detectan porque sobran filas.
+    total = session.execute(select(func.count(RiskScenario.id))).scalar_one()
+    if total != len(m.risk_ids):
+        existing = _int_array(session, select(RiskScenario.id).order_by(RiskScenario.id), 1)[:, 0]
+        m = m.without_rows(np.setdiff1d(m.risk_ids, existing, assume_unique=True))
+        if len(m.risk_ids) != total:
+            return load_matrix(session)
+    m.versions, m.loaded_at = versions, loaded_at
+    return m
+
+
+_current: CoverageMatrix | None = None
+_lock = threading.Lock()
+
+
+def current_matrix(session=None) -> CoverageMatrix:
+    """Matriz vigente del proceso (una consulta si no hubo escrituras)."""
+    global _current
+    require_numpy()
+    session = session or db.session
+    with _lock:
+        _current = load_matrix(session) if _current is None else refresh(_current, session)
+        return _current
+
+
+# ------------------- Vistas -------------------
+def coverage_report(order: str = "coverage", theme: str | None = None, limit: int = 50, offset: int = 0,
+                    matrix: CoverageMatrix | None = None) -> dict:
+    """Resumen, pagina de controles, riesgos Alto/Critico sin cubrir y agregados ISO."""
+    if order not in SORTS:
+        raise ValueError(f"sort debe ser uno de: {', '.join(SORTS)}")
+    if theme and theme not in (*ISO_THEMES, NO_CODE):
+        raise ValueError(f"theme debe ser uno de: {', '.join((*ISO_THEMES, NO_CODE))}")
+    start = time.perf_counter()
+    m = matrix if matrix is not None else current_matrix()
+    positions = m.control_rows(order, theme)
+    return {
+        "risks": m.shape[0],
+        "controls": m.shape[1],
+        "links": m.nnz,
+        "covered_risks": m.shape[0] - int(np.count_nonzero(np.diff(m.indptr) == 0)),
+        "uncovered_high": m.uncovered_high(),
+        "sort": order,
+        "theme": theme,
+        "total": len(positions),
+        "offset": offset,
+        "items": [m.control_item(col) for col in positions[offset:offset + limit]],
+        "themes": m.iso_rollup("theme"),
+        "references": m.iso_rollup("reference"),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+# ------------------- CLI -------------------
+def _check() -> int:
+    """Compara la matriz con agregados SQL (cobertura y Alto/Critico sin controles)."""
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        m = load_matrix(db.session)
+        expected = dict(db.session.execute(
+            select(risk_controls.c.control_id, func.count()).group_by(risk_controls.c.control_id)
+        ).all())
+        uncovered = db.session.execute(
+            select(func.count(RiskScenario.id)).where(
+                RiskScenario.stored_inherent_level.in_(("Alto", "Critico")),
+                ~select(risk_controls.c.risk_id).where(risk_controls.c.risk_id == RiskScenario.id).exists(),
+            )
+        ).scalar_one()
+    coverage = dict(zip(m.control_ids.tolist(), m.summary()["coverage"].tolist()))
+    bad = [cid for cid in set(expected) | set(coverage) if expected.get(cid, 0) != coverage.get(cid, 0)]
+    print(f"{m.shape[0]} riesgos x {m.shape[1]} controles, {m.nnz} vinculos; "
+          f"{len(bad)} controles con diferencias; sin cubrir Alto/Critico {m.uncovered_high()['total']} (SQL {uncovered})")
+    return 1 if bad or m.uncovered_high()["total"] != uncovered else 0
+
+
+def _bench(n: int, n_controls: int) -> int:
+    rng = np.random.default_rng(1)
+    risk_ids = np.arange(1, n + 1, dtype=np.int32)
+    per_risk = rng.choice(np.array([0, 1, 1, 2, 3]), n)
+    pair_risk = np.repeat(risk_ids, per_risk)
+    pair_control = rng.integers(1, n_controls + 1, len(pair_risk), dtype=np.int32)
+    inherent = rng.integers(1, 26, n).astype(np.int8)
+    residual = np.where(rng.random(n) < 0.4, np.maximum(1, inherent - rng.integers(0, 8, n)), 0).astype(np.int8)
+    control_ids = np.arange(1, n_controls + 1, dtype=np.int32)
+    refs = [f"ISO 27002:2022 - {rng.integers(5, 9)}.{rng.integers(1, 38)}" for _ in range(n_controls)]
+    names = [f"Control {i}" for i in range(1, n_controls + 1)]
+
+    def timed(label, fn):
+        start = time.perf_counter()
+        value = fn()
+        print(f"{label}: {(time.perf_counter() - start) * 1000:.1f} ms")
+        return value
+
+    m = timed(f"matriz {n} x {n_controls} ({len(pair_risk)} vinculos)",
+              lambda: CoverageMatrix.from_pairs(risk_ids, inherent, residual, pair_risk, pair_control,
+                                                control_ids, names, refs))
+    timed("agregados por control", m.summary)
+    timed("pagina de la vista (50 controles por cobertura)", lambda: coverage_report(matrix=m))
+    timed("pagina en cache", lambda: coverage_report(order="coverage", offset=50, matrix=m))
+    timed("riesgos cubiertos por un control", lambda: m.covered_risks(1))
+    changed = rng.choice(risk_ids, 500, replace=False)
+    timed("parche incremental (500 riesgos)",
+          lambda: m.with_rows(np.sort(changed), inherent[:500], residual[:500],
+                              np.repeat(np.sort(changed), 2), rng.integers(1, n_controls + 1, 1000)))
+    return 0
+
+
+def main() -> int:
+    require_numpy()
+    if "--check" in sys.argv:
+        return _check()
+    if "--bench" in sys.argv:
+        idx = sys.argv.index("--bench")
+        n = int(sys.argv[idx + 1]) if len(sys.argv) > idx + 1 and sys.argv[idx + 1].isdigit() else 1_000_000
+        n_controls = int(sys.argv[sys.argv.index("--controls") + 1]) if "--controls" in sys.argv else 10_000
+        return _bench(n, n_controls)
+    print(__doc__)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+"""Contadores agregados del registro (mapa de calor y distribuciones).
+
+La tabla risk_counter guarda cuantos riesgos hay en cada celda de cada
+dimension, asi las vistas de analisis leen O(celdas) en vez de O(riesgos).
+Se mantiene de forma incremental:
+
+- Flush del ORM: antes del flush se restan las celdas de los riesgos
+  afectados (segun lo que hay en la base) y despues se suman con los valores
+  nuevos. Un cambio de CID o tipo de un activo afecta a todos sus riesgos,
+  que se agregan con una sola consulta.
+- insert() masivo de riesgos (seed, importador): se suman las filas nuevas.
+- update()/delete() masivos sobre riesgos o activos: se marca la sesion y
+  los contadores se reconstruyen antes del commit.
+- Cambios masivos de tratamiento (bulk_treatment.py): restan y suman las
+  celdas de los riesgos seleccionados con count_cells/apply_delta.
+
+Uso:
+    python counters.py           # reconcilia: reconstruye en memoria y compara
+    python counters.py --repair  # ademas reescribe la tabla si hay diferencias
+"""
+from __future__ import annotations
+
+import sys
+from collections import Counter
+
+from sqlalchemy import case, delete, event, func, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import (
+    db, Asset, RiskCounter, RiskScenario, CID_FIELDS, _changed, _stored_scores_values, asset_impact_sql,
+    stored_scores,
+)
+from utils import cid_to_impact, in_ids
+
+NOT_EVALUATED = "Sin evaluar"
+NO_STRATEGY = "Sin estrategia"
+LEVELS = ["Bajo", "Medio", "Alto", "Critico"]
+
+RISK_FIELDS = (
+    "probability", "impact_override", "residual_probability", "residual_impact", "asset_id", "asset",
+    "status", "treatment_strategy",
+)
+ASSET_FIELDS = (*CID_FIELDS, "asset_type")
+_STALE = "risk_counters_stale"
+_PENDING = "risk_counters_pending"
+
+
+# ------------------- Celdas -------------------
+def _cells(probability, impact, inherent_level, residual_level, status, strategy, asset_type) -> list[tuple]:
+    """Celdas (dimension, key1, key2) a las que aporta un riesgo."""
+    return [
+        ("heatmap", str(probability), str(impact)),
+        ("inherent_level", inherent_level, ""),
+        ("residual_level", residual_level or NOT_EVALUATED, ""),
+        ("status_strategy", status, strategy or NO_STRATEGY),
+        ("asset_type", asset_type, inherent_level),
+    ]
+
+
+def _grouped_stmt():
+    """Riesgos agrupados por todos los ejes, calculado desde las columnas base."""
+    r = RiskScenario
+    impact = asset_impact_sql()
+    values = _stored_scores_values(impact)
+    has_override = (r.impact_override.isnot(None)) & (r.impact_override != 0)
+    eff_impact = case((has_override, r.impact_override), else_=impact)
+    columns = (r.probability, eff_impact, values["inherent_level"], values["residual_level"],
+               r.status, r.treatment_strategy, Asset.asset_type)
+    return select(*columns, func.count()).join(Asset, Asset.id == r.asset_id).group_by(*columns)
+
+
+def count_cells(connection, risk_ids=(), asset_ids=(), everything: bool = False) -> Counter:
+    stmt = _grouped_stmt()
+    if not everything:
+        conds = []
+        if risk_ids:
+            conds.append(in_ids(RiskScenario.id, risk_ids))
+        if asset_ids:
+            conds.append(in_ids(RiskScenario.asset_id, asset_ids))
+        if not conds:
+            return Counter()
+        stmt = stmt.where(or_(*conds))
+    totals: Counter = Counter()
+    for *keys, n in connection.execute(stmt):
+        for cell in _cells(*keys):
+            totals[cell] += n
+    return totals
+
+
+def apply_delta(connection, delta: Counter) -> None:
+    rows = [{"dimension": d, "key1": k1, "key2": k2, "count": n} for (d, k1, k2), n in delta.items() if n]
+    if not rows:
+        return
+    stmt = sqlite_insert(RiskCounter.__table__)
+    connection.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["dimension", "key1", "key2"],
+            set_={"count": RiskCounter.__table__.c.count + stmt.excluded.count},
+        ),
+        rows,
+    )
+
+
+def rebuild(connection) -> Counter:
+    """Reescribe la tabla completa desde el registro."""
+    totals = count_cells(connection, everything=True)
+    connection.execute(delete(RiskCounter.__table__))
+    apply_delta(connection, totals)
+    return totals
+
+
+def stored_counts(connection) -> Counter:
+    rows = connection.execute(select(RiskCounter.dimension, RiskCounter.key1, RiskCounter.key2, RiskCounter.count))
+    return Counter({(d, k1, k2): n for d, k1, k2, n in rows if n})
+
+
+def ensure_built(connection) -> None:
+    """Arma la tabla si esta vacia y ya hay riesgos (bases anteriores a esta version)."""
+    has_counters = connection.execute(select(RiskCounter.count).limit(1)).first()
+    has_risks = connection.execute(select(RiskScenario.id).limit(1)).first()
+    if has_risks and not has_counters:
+        rebuild(connection)
+
+
+# ------------------- Mantenimiento incremental -------------------
+def _affected(session) -> tuple[set, set]:
+    risk_ids, asset_ids = set(), set()
+    for obj in session.dirty:
+        if isinstance(obj, RiskScenario) and any(_changed(obj, f) for f in RISK_FIELDS):
+            risk_ids.add(obj.id)
+        elif isinstance(obj, Asset) and any(_changed(obj, f) for f in ASSET_FIELDS):
+            asset_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, RiskScenario):
+            risk_ids.add(obj.id)
+        elif isinstance(obj, Asset):
+            asset_ids.add(obj.id)
+    return risk_ids, asset_ids
+
+
+@event.listens_for(Session, "before_flush")
+def _subtract_before_flush(session, flush_context, instances):
+    risk_ids, asset_ids = _affected(session)
+    new_risks = [obj for obj in session.new if isinstance(obj, RiskScenario)]
+    if not (risk_ids or asset_ids or new_risks):
+        return
+    conn = session.connection()
+    before = count_cells(conn, risk_ids, asset_ids)
+    apply_delta(conn, Counter({cell: -n for cell, n in before.items()}))
+    session.info[_PENDING] = (risk_ids, asset_ids, new_risks)
+
+
+@event.listens_for(Session, "after_flush")
+def _add_after_flush(session, flush_context):
+    pending = session.info.pop(_PENDING, None)
+    if pending is None:
+        return
+    risk_ids, asset_ids, new_risks = pending
+    risk_ids = risk_ids | {obj.id for obj in new_risks}
+    conn = session.connection()
+    # Lo borrado ya no esta en la base, asi que no suma.
+    apply_delta(conn, count_cells(conn, risk_ids, asset_ids))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bulk_statement(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    model = mapper.class_ if mapper is not None else None
+    if model not in (RiskScenario, Asset):
+        return
+    session = orm_execute_state.session
+    params = orm_execute_state.parameters
+    if orm_execute_state.is_insert and model is RiskScenario and params:
+        _add_inserted(session, params if isinstance(params, list) else [params])
+    elif orm_execute_state.is_insert and model is RiskScenario or orm_execute_state.is_update \
+            or orm_execute_state.is_delete:
+        # insert().values(), update() o delete(): no se conocen las filas.
+        session.info[_STALE] = True
+
+
+def _add_inserted(session, rows: list[dict]) -> None:
+    asset_ids = {row["asset_id"] for row in rows}
+    assets = {
+        aid: (max(cid_to_impact(c + i + a), inherited or 0), asset_type)
+        for aid, c, i, a, inherited, asset_type in session.connection().execute(
+            select(Asset.id, Asset.confidentiality, Asset.integrity, Asset.availability, Asset.inherited_impact,
+                   Asset.asset_type)
+            .where(Asset.id.in_(asset_ids))
+        )
+    }
+    delta: Counter = Counter()
+    for row in rows:
+        asset_impact, asset_type = assets[row["asset_id"]]
+        values = stored_scores(row.get("probability", 3), row.get("impact_override"),
+                               row.get("residual_probability"), row.get("residual_impact"), asset_impact)
+        impact = row.get("impact_override") or asset_impact
+        for cell in _cells(row.get("probability", 3), impact, values["stored_inherent_level"],
+                           values["stored_residual_level"], row.get("status") or "Pendiente",
+                           row.get("treatment_strategy"), asset_type):
+            delta[cell] += 1
+    apply_delta(session.connection(), delta)
+
+
+@event.listens_for(Session, "before_commit")
+def _rebuild_if_stale(session):
+    if session.info.pop(_STALE, False):
+        rebuild(session.connection())
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_pending(session):
+    session.info.pop(_STALE, None)
+    session.info.pop(_PENDING, None)
+
+
+# ------------------- Lectura -------------------
+def read_counters() -> dict[str, Counter]:
+    """Todas las dimensiones en una consulta."""
+    by_dimension: dict[str, Counter] = {}
+    rows = db.session.execute(
+        select(RiskCounter.dimension, RiskCounter.key1, RiskCounter.key2, RiskCounter.count).where(RiskCounter.count > 0)
+    )
+    for dimension, k1, k2, n in rows:
+        by_dimension.setdefault(dimension, Counter())[(k1, k2)] = n
+    return by_dimension
+
+
+def heatmap(counters: dict[str, Counter]) -> dict:
+    """Matriz 5x5: filas = probabilidad (5 -> 1), columnas = impacto (1 -> 5)."""
+    cells = counters.get("heatmap", Counter())
+    return {
+        "probability": [5, 4, 3, 2, 1],
+        "impact": [1, 2, 3, 4, 5],
+        "counts": [[cells[(str(p), str(i))] for i in range(1, 6)] for p in range(5, 0, -1)],
+    }
+
+
+def level_distribution(counters: dict[str, Counter]) -> dict:
+    inherent = counters.get("inherent_level", Counter())
+    residual = counters.get("residual_level", Counter())
+    return {
+        "inherent": {level: inherent[(level, "")] for level in LEVELS},
+        "residual": {level: residual[(level, "")] for level in [*LEVELS, NOT_EVALUATED]},
+    }
+
+
+def status_by_strategy(counters: dict[str, Counter]) -> dict:
+    result: dict[str, dict[str, int]] = {}
+    for (status, strategy), n in sorted(counters.get("status_strategy", Counter()).items()):
+        result.setdefault(status, {})[strategy] = n
+    return result
+
+
+def asset_type_breakdown(counters: dict[str, Counter]) -> dict:
+    result: dict[str, dict[str, int]] = {}
+    for (asset_type, level), n in sorted(counters.get("asset_type", Counter()).items()):
+        result.setdefault(asset_type, {lv: 0 for lv in LEVELS})[level] = n
+    return result
+
+
+VIEWS = {
+    "heatmap": heatmap,
+    "levels": level_distribution,
+    "status-by-strategy": status_by_strategy,
+    "asset-types": asset_type_breakdown,
+}
+
+
+# ------------------- Reconciliacion -------------------
+def reconcile(repair: bool = False) -> list[str]:
+    """Compara la tabla con un recalculo completo. Debe correr en un app context."""
+    conn = db.session.connection()
+    expected = count_cells(conn, everything=True)
+    actual = stored_counts(conn)
+    problems = [
+        f"{'/'.join(cell)}: guardado {actual[cell]}, esperado {expected[cell]}"
+        for cell in sorted(set(expected) | set(actual))
+        if expected[cell] != actual[cell]
+    ]
+    if problems and repair:
+        rebuild(conn)
+        db.session.commit()
+    return problems
+
+
+def run() -> int:
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        problems = reconcile(repair="--repair" in sys.argv)
+    for line in problems:
+        print("DIFERENCIA", line)
+    print(f"{len(problems)} celdas con diferencias" + (" (reparadas)" if problems and "--repair" in sys.argv else ""))
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
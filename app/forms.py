@@ -3,8 +3,12 @@ from __future__ import annotations
 from datetime import date
 
 from flask_wtf import FlaskForm
-from wtforms import StringField, TextAreaField, SelectField, IntegerField, DateField, SubmitField, SelectMultipleField
-from wtforms.validators import DataRequired, Length, NumberRange, Optional
+from flask_wtf.file import FileAllowed, FileField, FileRequired
+from wtforms import Form, StringField, TextAreaField, SelectField, IntegerField, DateField, SubmitField, SelectMultipleField
+from wtforms.fields.core import UnboundField
+from wtforms.validators import DataRequired, Length, NumberRange, Optional, ValidationError
+
+from catalog_cache import exists
 
 ASSET_TYPES = [
     ("Hardware", "Hardware"),
@@ -51,6 +55,39 @@ CONTROL_TYPES = [
 ]
 
 
+class CatalogSelectField(SelectField):
+    """SelectField cuyas opciones vienen de un catalogo (ver catalog_cache).
+
+    El valor enviado se valida con una busqueda puntual por ID, asi que el
+    POST no necesita cargar todas las opciones del catalogo.
+    """
+
+    def __init__(self, label=None, validators=None, catalog=None, **kwargs):
+        super().__init__(label, validators, coerce=int, choices=[], **kwargs)
+        self.catalog = catalog
+
+    def pre_validate(self, form):
+        if self.data is None or not exists(self.catalog, [self.data]):
+            raise ValidationError(self.gettext("Not a valid choice."))
+
+
+class CatalogMultipleField(SelectMultipleField):
+    def __init__(self, label=None, validators=None, catalog=None, **kwargs):
+        super().__init__(label, validators, coerce=int, choices=[], **kwargs)
+        self.catalog = catalog
+
+    def process_formdata(self, valuelist):
+        super().process_formdata(valuelist)
+        if not valuelist:
+            # Sin opciones marcadas el navegador no envia el campo: la seleccion
+            # queda vacia (y no la del objeto con que se creo el formulario).
+            self.data = []
+
+    def pre_validate(self, form):
+        if self.data and not exists(self.catalog, self.data):
+            raise ValidationError(self.gettext("'%(value)s' is not a valid choice for this field.") % {"value": self.data})
+
+
 class AssetForm(FlaskForm):
     name = StringField("Nombre del activo", validators=[DataRequired(), Length(max=120)])
     asset_type = SelectField("Tipo", choices=ASSET_TYPES, validators=[DataRequired()])
@@ -61,6 +98,7 @@ class AssetForm(FlaskForm):
     confidentiality = IntegerField("Confidencialidad (1-3)", validators=[DataRequired(), NumberRange(min=1, max=3)])
     integrity = IntegerField("Integridad (1-3)", validators=[DataRequired(), NumberRange(min=1, max=3)])
     availability = IntegerField("Disponibilidad (1-3)", validators=[DataRequired(), NumberRange(min=1, max=3)])
+    depends_on = CatalogMultipleField("Depende de (opcional)", catalog="assets", validators=[Optional()])
     submit = SubmitField("Guardar")
 
 
@@ -87,9 +125,9 @@ class ControlForm(FlaskForm):
 
 
 class RiskForm(FlaskForm):
-    asset_id = SelectField("Activo", coerce=int, validators=[DataRequired()])
-    threat_id = SelectField("Amenaza", coerce=int, validators=[DataRequired()])
-    vulnerability_id = SelectField("Vulnerabilidad", coerce=int, validators=[DataRequired()])
+    asset_id = CatalogSelectField("Activo", catalog="assets", validators=[DataRequired()])
+    threat_id = CatalogSelectField("Amenaza", catalog="threats", validators=[DataRequired()])
+    vulnerability_id = CatalogSelectField("Vulnerabilidad", catalog="vulnerabilities", validators=[DataRequired()])
 
     probability = SelectField("Probabilidad (1-5)", choices=PROB_SCALE, validators=[DataRequired()])
     impact_override = SelectField("Impacto (opcional, 1-5). Si se deja vacio, usa impacto del activo.", choices=[("", "(usar impacto del activo)")] + IMPACT_SCALE, validators=[Optional()])
@@ -102,7 +140,7 @@ class RiskForm(FlaskForm):
 
 class TreatmentForm(FlaskForm):
     treatment_strategy = SelectField("Estrategia", choices=[("", "(seleccionar)")] + TREATMENT_STRATEGIES, validators=[Optional()])
-    proposed_controls = SelectMultipleField("Controles propuestos", coerce=int, validators=[Optional()])
+    proposed_controls = CatalogMultipleField("Controles propuestos", catalog="controls", validators=[Optional()])
     responsible = StringField("Responsable (opcional)", validators=[Optional(), Length(max=120)])
     due_date = DateField("Fecha limite (opcional)", validators=[Optional()])
     status = SelectField("Estado", choices=STATUS, validators=[DataRequired()])
@@ -121,8 +159,69 @@ class ResidualForm(FlaskForm):
     submit = SubmitField("Guardar riesgo residual")
 
 
+# Opciones de los selects del cambio masivo: "" no cambia el campo, CLEAR lo vacia.
+CLEAR = "-"
+KEEP_CHOICE = [("", "(sin cambios)")]
+
+
+class BulkTreatmentForm(FlaskForm):
+    treatment_strategy = SelectField("Estrategia", choices=KEEP_CHOICE + [(CLEAR, "(vaciar)")] + TREATMENT_STRATEGIES, validators=[Optional()])
+    status = SelectField("Estado", choices=KEEP_CHOICE + STATUS, validators=[Optional()])
+    responsible = StringField("Responsable (vacio = sin cambios)", validators=[Optional(), Length(max=120)])
+    due_date = DateField("Fecha limite (vacio = sin cambios)", validators=[Optional()])
+    residual_probability = SelectField("Probabilidad residual", choices=KEEP_CHOICE + [(CLEAR, "(sin evaluar)")] + PROB_SCALE, validators=[Optional()])
+    residual_impact = SelectField("Impacto residual", choices=KEEP_CHOICE + [(CLEAR, "(sin evaluar)")] + IMPACT_SCALE, validators=[Optional()])
+    completed_at = DateField("Fecha de implementacion (vacio = sin cambios)", validators=[Optional()])
+    add_controls = CatalogMultipleField("Agregar controles propuestos", catalog="controls", validators=[Optional()])
+    remove_controls = CatalogMultipleField("Quitar controles propuestos", catalog="controls", validators=[Optional()])
+    submit = SubmitField("Aplicar a los riesgos filtrados")
+
+    def bulk_values(self) -> dict:
+        """Campos a cambiar ({campo: valor}, None = vaciar), en el formato de bulk_treatment.parse_change."""
+        values = {}
+        for name in ("treatment_strategy", "status", "residual_probability", "residual_impact"):
+            data = self[name].data
+            if data:
+                values[name] = None if data == CLEAR else data
+        for name in ("responsible", "due_date", "completed_at"):
+            if self[name].data:
+                values[name] = self[name].data
+        return values
+
+
 class IncidentForm(FlaskForm):
     date = DateField("Fecha", default=date.today, validators=[DataRequired()])
     severity = SelectField("Severidad (opcional)", choices=[("", "(sin)") , ("Baja", "Baja"), ("Media", "Media"), ("Alta", "Alta")], validators=[Optional()])
     description = TextAreaField("Descripcion", validators=[DataRequired()])
     submit = SubmitField("Registrar incidente")
+
+
+IMPORT_KINDS = [
+    ("assets", "Activos"),
+    ("threats", "Amenazas"),
+    ("vulnerabilities", "Vulnerabilidades"),
+    ("controls", "Controles"),
+    ("risks", "Escenarios de riesgo"),
+]
+
+
+class ImportForm(FlaskForm):
+    kind = SelectField("Tipo de datos", choices=IMPORT_KINDS, validators=[DataRequired()])
+    file = FileField("Archivo (CSV o XLSX)", validators=[FileRequired(), FileAllowed(["csv", "xlsx"], "Solo CSV o XLSX")])
+    submit = SubmitField("Importar")
+
+
+# ------------------- Formularios por fila (importacion y API) -------------------
+def row_form(*form_classes, exclude: tuple[str, ...] = ()) -> type[Form]:
+    """Form sin CSRF con los mismos campos/validadores que los formularios web."""
+    fields = {
+        name: getattr(form_cls, name)
+        for form_cls in form_classes
+        for name in dir(form_cls)
+        if isinstance(getattr(form_cls, name, None), UnboundField) and name not in exclude + ("submit",)
+    }
+    return type(f"{form_classes[0].__name__}Row", (Form,), fields)
+
+
+def error_messages(form) -> list[str]:
+    return [f"{name}: {msg}" for name, msgs in form.errors.items() for msg in msgs]
@@ -0,0 +1,250 @@
+"""Importacion masiva (CSV/XLSX) de activos, catalogos y escenarios de riesgo.
+
+Uso:
+    python importer.py assets inventario.csv
+    python importer.py risks escenarios.xlsx --batch 5000
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import os
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+
+from sqlalchemy import insert, select
+from werkzeug.datastructures import MultiDict
+
+from forms import AssetForm, ThreatForm, VulnerabilityForm, ControlForm, RiskForm, error_messages, row_form
+from models import db, Asset, Threat, Vulnerability, Control, RiskScenario, stored_scores
+from utils import cid_to_impact
+
+BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 200
+
+
+@dataclass
+class ImportSpec:
+    model: type
+    form: type[Form]
+    # columna del archivo -> campo del formulario
+    aliases: dict[str, str] = field(default_factory=dict)
+
+
+SPECS = {
+    "assets": ImportSpec(Asset, row_form(AssetForm, exclude=("depends_on",)), {"process": "process_area"}),
+    "threats": ImportSpec(Threat, row_form(ThreatForm)),
+    "vulnerabilities": ImportSpec(Vulnerability, row_form(VulnerabilityForm)),
+    "controls": ImportSpec(Control, row_form(ControlForm)),
+    "risks": ImportSpec(
+        RiskScenario,
+        row_form(RiskForm, exclude=("asset_id", "threat_id", "vulnerability_id")),
+        {"asset_id": "asset", "threat_id": "threat", "vulnerability_id": "vulnerability"},
+    ),
+}
+
+
+@dataclass
+class RowError:
+    line: int
+    messages: list[str]
+
+
+@dataclass
+class ImportResult:
+    kind: str
+    inserted: int = 0
+    failed: int = 0
+    errors: list[RowError] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        total = self.inserted + self.failed
+        return total / self.seconds if self.seconds else 0.0
+
+    def add_error(self, line: int, messages: list[str]) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, messages))
+
+
+# ------------------- Lectura -------------------
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def read_rows(stream, filename: str) -> Iterator[dict[str, str]]:
+    """Lee filas (stream binario) como dicts de texto; CSV o XLSX segun la extension."""
+    if filename.lower().endswith(".xlsx"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError as exc:
+            raise ValueError("Para importar XLSX instala openpyxl (pip install openpyxl)") from exc
+        sheet = load_workbook(stream, read_only=True, data_only=True).active
+        rows = sheet.iter_rows(values_only=True)
+        header = [_cell(h).lower() for h in next(rows, ())]
+        for values in rows:
+            yield {h: _cell(v) for h, v in zip(header, values)}
+        return
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    for row in csv.DictReader(text):
+        yield {(k or "").strip().lower(): _cell(v) for k, v in row.items()}
+
+
+# ------------------- Resolucion de catalogos -------------------
+class _Lookup:
+    """Nombre (o id) -> id, cargado una sola vez en memoria."""
+
+    def __init__(self, model, label: str):
+        self.label = label
+        self.by_id: dict[int, int] = {}
+        self.by_name: dict[str, int | None] = {}
+        for rid, name in db.session.execute(select(model.id, model.name)):
+            self.by_id[rid] = rid
+            key = name.strip().lower()
+            # None marca nombres repetidos (ambiguos).
+            self.by_name[key] = None if key in self.by_name else rid
+
+    def resolve(self, value: str, errors: list[str]) -> int | None:
+        if not value:
+            errors.append(f"{self.label}: campo obligatorio")
+            return None
+        if value.isdigit() and int(value) in self.by_id:
+            return int(value)
+        key = value.lower()
+        if key not in self.by_name:
+            errors.append(f"{self.label}: '{value}' no existe")
+            return None
+        if self.by_name[key] is None:
+            errors.append(f"{self.label}: '{value}' es ambiguo, usa el ID")
+            return None
+        return self.by_name[key]
+
+
+# ------------------- Conversion fila -> valores -------------------
+def _asset_values(form) -> dict:
+    return {
+        "name": form.name.data,
+        "asset_type": form.asset_type.data,
+        "process": form.process_area.data or None,
+        "owner": form.owner.data or None,
+        "description": form.description.data or None,
+        "confidentiality": form.confidentiality.data,
+        "integrity": form.integrity.data,
+        "availability": form.availability.data,
+    }
+
+
+def _catalog_values(form) -> dict:
+    return {"name": form.name.data, "category": form.category.data, "description": form.description.data or None}
+
+
+def _control_values(form) -> dict:
+    return {
+        "name": form.name.data,
+        "iso_reference": form.iso_reference.data or None,
+        "control_type": form.control_type.data or None,
+        "description": form.description.data or None,
+    }
+
+
+def import_rows(kind: str, rows: Iterable[dict[str, str]], batch_size: int = BATCH_SIZE) -> ImportResult:
+    """Valida e inserta filas por lotes (un INSERT executemany + commit por lote).
+
+    Debe ejecutarse dentro de un app context.
+    """
+    spec = SPECS[kind]
+    result = ImportResult(kind)
+    start = time.perf_counter()
+
+    if kind == "risks":
+        assets = _Lookup(Asset, "Activo")
+        threats = _Lookup(Threat, "Amenaza")
+        vulns = _Lookup(Vulnerability, "Vulnerabilidad")
+        asset_impact = {
+            aid: max(cid_to_impact(c + i + a), inherited or 0)
+            for aid, c, i, a, inherited in db.session.execute(
+                select(Asset.id, Asset.confidentiality, Asset.integrity, Asset.availability, Asset.inherited_impact)
+            )
+        }
+
+    batch: list[dict] = []
+
+    def flush() -> None:
+        if batch:
+            db.session.execute(insert(spec.model), batch)
+            db.session.commit()
+            result.inserted += len(batch)
+            batch.clear()
+
+    for line, row in enumerate(rows, start=2):  # linea 1 = encabezado
+        data = MultiDict({spec.aliases.get(k, k): v for k, v in row.items()})
+        form = spec.form(formdata=data)
+        errors = [] if form.validate() else error_messages(form)
+
+        if kind == "risks":
+            asset_id = assets.resolve(data.get("asset", ""), errors)
+            threat_id = threats.resolve(data.get("threat", ""), errors)
+            vuln_id = vulns.resolve(data.get("vulnerability", ""), errors)
+        if errors:
+            result.add_error(line, errors)
+            continue
+
+        if kind == "assets":
+            values = _asset_values(form)
+        elif kind == "controls":
+            values = _control_values(form)
+        elif kind == "risks":
+            probability = int(form.probability.data)
+            impact_override = int(form.impact_override.data) if form.impact_override.data else None
+            values = {
+                "asset_id": asset_id,
+                "threat_id": threat_id,
+                "vulnerability_id": vuln_id,
+                "probability": probability,
+                "impact_override": impact_override,
+                "existing_controls": form.existing_controls.data or None,
+                "observations": form.observations.data or None,
+                # Los inserts masivos no pasan por before_flush.
+                **stored_scores(probability, impact_override, None, None, asset_impact[asset_id]),
+            }
+        else:
+            values = _catalog_values(form)
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Importacion masiva CSV/XLSX")
+    parser.add_argument("kind", choices=sorted(SPECS))
+    parser.add_argument("path")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context(), open(args.path, "rb") as fh:
+        result = import_rows(args.kind, read_rows(fh, os.path.basename(args.path)), args.batch)
+
+    print(f"{result.kind}: {result.inserted} insertados, {result.failed} con error "
+          f"en {result.seconds:.2f}s ({result.rows_per_sec:.0f} filas/s)")
+    for err in result.errors:
+        print(f"  linea {err.line}: " + "; ".join(err.messages))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,217 @@
+"""Ingesta asincrona de incidentes (p. ej. desde un SIEM), por lotes y con contrapresion.
+
+POST /api/v1/incidents/ingest acepta un objeto, una lista JSON o NDJSON.
+Cada incidente se valida en el request (mismos validadores que la API mas
+la existencia del riesgo) y los validos pasan a una cola acotada en memoria.
+Un hilo escritor vacia la cola en transacciones de hasta `batch_max`
+incidentes: espera hasta `linger` segundos a que el lote se llene para no
+commitear de a uno en rafagas chicas.
+
+- Contrapresion: si la cola no tiene lugar para todo el request, responde
+  429 con Retry-After y no encola nada (el cliente reintenta el request
+  entero).
+- Deduplicacion: `external_id` es unico en la base; los repetidos (en el
+  mismo lote, en la cola o ya guardados) se descartan con
+  INSERT ... ON CONFLICT DO NOTHING. Vale tambien con varios workers.
+- La cola vive en el proceso: lo encolado y no escrito se pierde si el
+  proceso muere sin apagarse (al salir normalmente se vacia).
+"""
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from instrumentation import Histogram, _histogram_lines
+from models import db, Incident
+
+QUEUE_MAX = 10_000
+BATCH_MAX = 500
+LINGER_SECONDS = 0.2
+WRITE_RETRIES = 3
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 5000)
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+@dataclass
+class _Pending:
+    values: dict
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class IngestMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {name: 0 for name in
+                       ("accepted", "rejected", "invalid", "inserted", "duplicates", "failed", "batches")}
+        self.batch_seconds = Histogram()
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        self.lag = Histogram(LAG_BUCKETS)  # encolado -> commit
+
+    def add(self, **counts: int) -> None:
+        with self.lock:
+            for name, n in counts.items():
+                self.counts[name] += n
+
+    def observe_batch(self, size: int, seconds: float, lags: list[float]) -> None:
+        with self.lock:
+            self.counts["batches"] += 1
+            self.batch_size.observe(size)
+            self.batch_seconds.observe(seconds)
+            for lag in lags:
+                self.lag.observe(lag)
+
+    def snapshot(self, depth: int) -> dict:
+        with self.lock:
+            recent_rows = sum(self.batch_size.recent)
+            recent_seconds = sum(self.batch_seconds.recent)
+            return {
+                **self.counts,
+                "queue_depth": depth,
+                # Filas por segundo de escritura, sobre los ultimos lotes.
+                "rows_per_sec": round(recent_rows / recent_seconds, 1) if recent_seconds else None,
+                "batch_p95_seconds": self.batch_seconds.quantile(0.95),
+                "lag_p95_seconds": self.lag.quantile(0.95),
+            }
+
+    def prometheus_lines(self, depth: int) -> list[str]:
+        with self.lock:
+            lines = ["# HELP riskguard_ingest_queue_depth Incidentes encolados sin escribir.",
+                     "# TYPE riskguard_ingest_queue_depth gauge",
+                     f"riskguard_ingest_queue_depth {depth}",
+                     "# HELP riskguard_ingest_incidents_total Incidentes por resultado de la ingesta.",
+                     "# TYPE riskguard_ingest_incidents_total counter"]
+            lines += [f'riskguard_ingest_incidents_total{{outcome="{name}"}} {n}'
+                      for name, n in self.counts.items() if name != "batches"]
+            for name, hist, help_text in (
+                ("riskguard_ingest_batch_seconds", self.batch_seconds, "Duracion de cada transaccion de ingesta."),
+                ("riskguard_ingest_batch_size", self.batch_size, "Incidentes por transaccion."),
+                ("riskguard_ingest_lag_seconds", self.lag, "Demora entre encolar y commitear."),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                lines += _histogram_lines(name, hist)
+        return lines
+
+
+class IncidentIngestor:
+    """Cola acotada + hilo escritor. El hilo arranca con el primer envio."""
+
+    def __init__(self, app, capacity: int = QUEUE_MAX, batch_max: int = BATCH_MAX,
+                 linger: float = LINGER_SECONDS):
+        self.app = app
+        self.capacity = capacity
+        self.batch_max = batch_max
+        self.linger = linger
+        self.metrics = IngestMetrics()
+        self._pending: deque[_Pending] = deque()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+
+    @property
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def offer(self, rows: list[dict]) -> bool:
+        """Encola todas las filas o ninguna (False si no hay lugar)."""
+        with self._cond:
+            if self._stopping or len(self._pending) + self._in_flight + len(rows) > self.capacity:
+                self.metrics.add(rejected=len(rows))
+                return False
+            self._pending.extend(_Pending(row) for row in rows)
+            self._ensure_started()
+            self._cond.notify_all()
+        self.metrics.add(accepted=len(rows))
+        return True
+
+    def stats(self) -> dict:
+        return self.metrics.snapshot(self.depth)
+
+    def prometheus_lines(self) -> list[str]:
+        return self.metrics.prometheus_lines(self.depth)
+
+    def retry_after(self) -> int:
+        """Segundos estimados para que se libere la cola, segun el ritmo reciente."""
+        stats = self.stats()
+        rate = stats["rows_per_sec"]
+        return max(1, min(30, int(stats["queue_depth"] / rate) + 1)) if rate else 1
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Espera a que la cola quede vacia (para scripts y pruebas)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="riskguard-ingest", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def _next_batch(self) -> list[_Pending] | None:
+        with self._cond:
+            while not self._pending and not self._stopping:
+                self._cond.wait()
+            if not self._pending:
+                return None  # detenido y vacio
+            # Rafaga en curso: esperar un poco a que el lote se llene.
+            deadline = time.monotonic() + self.linger
+            while len(self._pending) < self.batch_max and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._pending.popleft() for _ in range(min(self.batch_max, len(self._pending)))]
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                self._write(batch)
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
+
+    def _write(self, batch: list[_Pending]) -> None:
+        rows = [p.values for p in batch]
+        stmt = sqlite_insert(Incident).on_conflict_do_nothing(index_elements=["external_id"]).returning(Incident.id)
+        for attempt in range(1, WRITE_RETRIES + 1):
+            start = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    inserted = len(db.session.execute(stmt, rows).all())
+                    db.session.commit()
+            except Exception:
+                if attempt == WRITE_RETRIES:
+                    self.app.logger.exception("Ingesta: se descarta un lote de %d incidentes", len(rows))
+                    self.metrics.add(failed=len(rows))
+                    return
+                time.sleep(0.1 * attempt)
+                continue
+            done = time.monotonic()
+            self.metrics.observe_batch(len(rows), time.perf_counter() - start, [done - p.enqueued_at for p in batch])
+            self.metrics.add(inserted=inserted, duplicates=len(rows) - inserted)
+            return
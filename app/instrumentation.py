@@ -0,0 +1,269 @@
+"""Instrumentacion por request: SQL, render Jinja y latencia total.
+
+- Cada respuesta lleva un header `Server-Timing` (sql, render, total).
+- El PDF se arma en un worker de ReportJobs, fuera del request: su duracion
+  va solo al histograma `riskguard_pdf_build_seconds` (`observe_pdf`).
+- Se acumulan histogramas por endpoint y una ventana movil de latencias
+  para percentiles; `/metrics` los expone en formato de texto Prometheus.
+- Perfilado opcional (PROFILE_SLOW_MS): un hilo muestrea la pila del
+  request cada PROFILE_INTERVAL_MS y, si el request supera el umbral, guarda
+  las pilas en formato "folded" (flamegraph.pl, speedscope) en PROFILE_DIR.
+"""
+from __future__ import annotations
+
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+
+# Limites de los buckets (segundos), como los de los clientes Prometheus.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PDF_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+WINDOW_SIZE = 1000
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Histograma acumulado (buckets, suma y cuenta) mas ventana movil."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window: int = WINDOW_SIZE):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.recent: deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        for i, limit in enumerate(self.buckets):
+            if value <= limit:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantile(self, q: float) -> float | None:
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    """Registro de metricas del proceso."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: dict[str, Histogram] = {}
+        self.pdf_build = Histogram(PDF_BUCKETS)
+        self.requests: Counter = Counter()  # (endpoint, status)
+        self.totals: Counter = Counter()  # (endpoint, fase) -> segundos o cuentas
+
+    def observe_request(self, endpoint: str, status: int, timings: Counter) -> None:
+        with self.lock:
+            self.latency.setdefault(endpoint, Histogram()).observe(timings["total"])
+            self.requests[(endpoint, status)] += 1
+            for phase in ("sql", "render", "sql_count"):
+                self.totals[(endpoint, phase)] += timings[phase]
+
+    def observe_pdf(self, seconds: float) -> None:
+        with self.lock:
+            self.pdf_build.observe(seconds)
+
+    def render_prometheus(self, collectors=()) -> str:
+        lines: list[str] = []
+        with self.lock:
+            lines += [
+                "# HELP riskguard_request_duration_seconds Latencia total por endpoint.",
+                "# TYPE riskguard_request_duration_seconds histogram",
+            ]
+            for endpoint, hist in sorted(self.latency.items()):
+                lines += _histogram_lines("riskguard_request_duration_seconds", hist, f'endpoint="{endpoint}"')
+            lines += [
+                "# HELP riskguard_request_duration_recent_seconds Percentiles de los ultimos requests.",
+                "# TYPE riskguard_request_duration_recent_seconds summary",
+            ]
+            for endpoint, hist in sorted(self.latency.items()):
+                for q in QUANTILES:
+                    lines.append(f'riskguard_request_duration_recent_seconds{{endpoint="{endpoint}",quantile="{q}"}} '
+                                 f"{hist.quantile(q):.6f}")
+            lines += ["# HELP riskguard_requests_total Requests por endpoint y status.",
+                      "# TYPE riskguard_requests_total counter"]
+            for (endpoint, status), n in sorted(self.requests.items()):
+                lines.append(f'riskguard_requests_total{{endpoint="{endpoint}",status="{status}"}} {n}')
+            for phase, name, help_text in (
+                ("sql_count", "riskguard_sql_queries_total", "Sentencias SQL ejecutadas."),
+                ("sql", "riskguard_sql_seconds_total", "Tiempo en SQL."),
+                ("render", "riskguard_template_render_seconds_total", "Tiempo renderizando Jinja."),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (endpoint, p), value in sorted(self.totals.items()):
+                    if p == phase:
+                        lines.append(f'{name}{{endpoint="{endpoint}"}} {value:g}')
+            lines += ["# HELP riskguard_pdf_build_seconds Duracion de build_risk_register_pdf.",
+                      "# TYPE riskguard_pdf_build_seconds histogram"]
+            lines += _histogram_lines("riskguard_pdf_build_seconds", self.pdf_build)
+        for collector in collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name: str, hist: Histogram, labels: str = "") -> list[str]:
+    sep = "," if labels else ""
+    lines, cumulative = [], 0
+    for limit, n in zip((*hist.buckets, "+Inf"), hist.counts):
+        cumulative += n
+        lines.append(f'{name}_bucket{{{labels}{sep}le="{limit}"}} {cumulative}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {hist.total:.6f}")
+    lines.append(f"{name}_count{suffix} {hist.count}")
+    return lines
+
+
+METRICS = Metrics()
+
+
+def _timings() -> Counter | None:
+    return g.get("perf_timings") if has_request_context() else None
+
+
+@contextmanager
+def timed(phase: str):
+    """Suma la duracion del bloque a la fase del request actual (si hay)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings = _timings()
+        if timings is not None:
+            timings[phase] += elapsed
+
+
+# ------------------- Perfilador por muestreo -------------------
+class StackSampler(threading.Thread):
+    """Muestrea la pila de un hilo y acumula pilas "folded"."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def write_folded(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as fh:
+            for stack, n in self.stacks.most_common():
+                fh.write(f"{stack} {n}\n")
+
+
+# ------------------- Integracion con Flask -------------------
+def install(app, collectors=()) -> None:
+    """Registra hooks de request, de plantillas y el endpoint /metrics.
+
+    `collectors`: callables que devuelven lineas Prometheus adicionales.
+    """
+    slow_ms = os.getenv("PROFILE_SLOW_MS")
+    app.config.setdefault("PROFILE_SLOW_MS", float(slow_ms) if slow_ms else None)
+    app.config.setdefault("PROFILE_SAMPLE_RATE", float(os.getenv("PROFILE_SAMPLE_RATE", "1.0")))
+    app.config.setdefault("PROFILE_INTERVAL_MS", float(os.getenv("PROFILE_INTERVAL_MS", "5")))
+    app.config.setdefault("PROFILE_DIR", os.getenv("PROFILE_DIR", os.path.join(app.config["EXPORTS_DIR"], "profiles")))
+
+    @app.before_request
+    def _start_request():
+        g.perf_timings = Counter()
+        g.perf_start = time.perf_counter()
+        if app.config["PROFILE_SLOW_MS"] is not None and random.random() < app.config["PROFILE_SAMPLE_RATE"]:
+            g.perf_sampler = StackSampler(threading.get_ident(), app.config["PROFILE_INTERVAL_MS"] / 1000)
+            g.perf_sampler.start()
+
+    @app.after_request
+    def _finish_request(response):
+        timings = _timings()
+        if timings is None or "perf_start" not in g:
+            return response
+        timings["total"] = time.perf_counter() - g.perf_start
+        endpoint = request.endpoint or "unmatched"
+        METRICS.observe_request(endpoint, response.status_code, timings)
+        response.headers["Server-Timing"] = server_timing(timings)
+        sampler = g.pop("perf_sampler", None)
+        if sampler is not None:
+            sampler.stop()
+            if timings["total"] * 1000 >= app.config["PROFILE_SLOW_MS"] and sampler.stacks:
+                _dump_profile(app.config["PROFILE_DIR"], endpoint, timings["total"], sampler)
+        return response
+
+    @app.teardown_request
+    def _stop_sampler(exc):
+        sampler = g.pop("perf_sampler", None)
+        if sampler is not None:
+            sampler.stop()
+
+    def _render_start(sender, template, context, **extra):
+        g.setdefault("perf_render_stack", []).append(time.perf_counter())
+
+    def _render_end(sender, template, context, **extra):
+        stack = g.get("perf_render_stack")
+        timings = _timings()
+        if stack and timings is not None:
+            timings["render"] += time.perf_counter() - stack.pop()
+
+    before_render_template.connect(_render_start, app, weak=False)
+    template_rendered.connect(_render_end, app, weak=False)
+
+    @app.route("/metrics")
+    def metrics():
+        return METRICS.render_prometheus(collectors), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+def install_engine(engine) -> None:
+    """Cuenta y mide cada sentencia SQL del request actual."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context.perf_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "perf_start", None)
+        timings = _timings()
+        if timings is not None and start is not None:
+            timings["sql"] += time.perf_counter() - start
+            timings["sql_count"] += 1
+
+
+def server_timing(timings: Counter) -> str:
+    parts = [f'sql;dur={timings["sql"] * 1000:.1f};desc="{timings["sql_count"]} consultas"']
+    if timings["render"]:
+        parts.append(f'render;dur={timings["render"] * 1000:.1f}')
+    parts.append(f'total;dur={timings["total"] * 1000:.1f}')
+    return ", ".join(parts)
+
+
+def _dump_profile(directory: str, endpoint: str, seconds: float, sampler: StackSampler) -> None:
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}_{re.sub(r'[^A-Za-z0-9_]', '_', endpoint)}_{int(seconds * 1000)}ms.folded"
+    sampler.write_folded(os.path.join(directory, name))
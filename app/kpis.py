@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from sqlalchemy import and_, case, func, select
+
+from models import db, RiskScenario, Incident
+from queries import risk_query
+from utils import KPI, pct, severity_rank_sql
+
+
+def _filled(col):
+    """Equivalente SQL de la "verdad" de Python para textos opcionales."""
+    return and_(col.isnot(None), col != "")
+
+
+def _count_if(cond):
+    return func.coalesce(func.sum(case((cond, 1), else_=0)), 0)
+
+
+def dashboard_counts() -> dict[str, int]:
+    """Conteos de los KPIs del panel, con agregados SQL sobre los scores materializados."""
+    inherent = RiskScenario.stored_inherent_score
+    residual = RiskScenario.stored_residual_score
+    high_or_crit = RiskScenario.stored_inherent_level.in_(("Alto", "Critico"))
+
+    stmt = (
+        select(
+            func.count(RiskScenario.id),
+            _count_if(high_or_crit),
+            _count_if(and_(
+                high_or_crit,
+                _filled(RiskScenario.treatment_strategy),
+                _filled(RiskScenario.responsible),
+                RiskScenario.due_date.isnot(None),
+            )),
+            _count_if(RiskScenario.due_date.isnot(None)),
+            _count_if(and_(
+                RiskScenario.due_date.isnot(None),
+                RiskScenario.status == "Implementado",
+                RiskScenario.completed_at.isnot(None),
+                RiskScenario.completed_at <= RiskScenario.due_date,
+            )),
+            _count_if(and_(residual.isnot(None), severity_rank_sql(residual) < severity_rank_sql(inherent))),
+            _count_if(and_(
+                RiskScenario.treatment_strategy == "Aceptar",
+                _filled(RiskScenario.acceptance_justification),
+                _filled(RiskScenario.acceptance_approved_by),
+            )),
+        )
+        .select_from(RiskScenario)
+    )
+    names = ("risks", "high", "with_plan", "due", "on_time", "reduced", "accepted")
+    counts = dict(zip(names, db.session.execute(stmt).one()))
+    counts["incidents"] = db.session.execute(select(func.count(Incident.id))).scalar_one()
+    return counts
+
+
+def dashboard_kpis() -> list[KPI]:
+    """KPIs del panel."""
+    c = dashboard_counts()
+    return [
+        KPI("Riesgos (total)", str(c["risks"])),
+        KPI("% Alto/Critico con plan", pct(c["with_plan"], c["high"]), "Plan = estrategia + responsable + fecha limite"),
+        KPI("% acciones a tiempo", pct(c["on_time"], c["due"]), "Implementado y dentro del plazo"),
+        KPI("Riesgos que bajaron de categoria", str(c["reduced"])),
+        KPI("Riesgos aceptados con justificacion", str(c["accepted"])),
+        KPI("Incidentes registrados", str(c["incidents"])),
+    ]
+
+
+def top_risks(limit: int = 8) -> list[RiskScenario]:
+    """Riesgos mas severos (nivel y score inherente) ordenados en SQL."""
+    return (
+        risk_query("row")
+        .order_by(RiskScenario.stored_inherent_score.desc(), RiskScenario.id.desc())
+        .limit(limit)
+        .all()
+    )
@@ -0,0 +1,105 @@
+"""Migracion del esquema (paso explicito de despliegue).
+
+create_app() no crea tablas: solo compara PRAGMA user_version con
+SCHEMA_VERSION (una lectura). Si difieren, en desarrollo migra solo
+(AUTO_MIGRATE=1, por defecto); con STORAGE_PROFILE=production falla y hay
+que ejecutar `python migrate.py`, que ademas precompila las plantillas.
+
+Subir SCHEMA_VERSION al cambiar modelos, indices o triggers de busqueda.
+"""
+from __future__ import annotations
+
+import sys
+
+from sqlalchemy import inspect, text
+
+from counters import ensure_built as ensure_counters
+from models import db, Asset, Control, Incident, RiskScenario, Threat, Vulnerability, backfill_stored_scores
+from search import ensure_index as ensure_search_index
+
+
+def _add_missing_columns(table) -> list[str]:
+    """ALTER TABLE ADD COLUMN para columnas nuevas del modelo (SQLite no tiene migraciones)."""
+    existing = {c["name"] for c in inspect(db.engine).get_columns(table.name)}
+    added = []
+    for col in table.columns:
+        if col.name in existing:
+            continue
+        col_type = col.type.compile(dialect=db.engine.dialect)
+        db.session.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{col.name}" {col_type}'))
+        added.append(col.name)
+    return added
+
+
+SCHEMA_VERSION = 3
+
+
+def schema_version(connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar_one()
+
+
+def check_schema(app) -> None:
+    """Chequeo de arranque: no hace nada si la base ya esta en SCHEMA_VERSION."""
+    version = schema_version(db.session.connection())
+    if version == SCHEMA_VERSION:
+        return
+    if version > SCHEMA_VERSION or not app.config["AUTO_MIGRATE"]:
+        raise RuntimeError(
+            f"La base esta en la version de esquema {version} y la aplicacion espera {SCHEMA_VERSION}: "
+            f"ejecutar python migrate.py"
+        )
+    upgrade()
+
+
+def precompile_templates(app) -> int:
+    """Compila todas las plantillas al cache de bytecode de Jinja (TEMPLATE_CACHE_DIR)."""
+    env = app.jinja_env
+    names = env.list_templates(filter_func=lambda name: name.endswith(".html"))
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+# Indices reemplazados por otros compuestos.
+OBSOLETE_INDEXES = ["ix_risk_scenario_inherent_level"]
+
+
+def upgrade(backfill: bool = False) -> None:
+    """Lleva una base existente al esquema actual. Es idempotente.
+
+    Debe ejecutarse dentro de un app context.
+    """
+    db.create_all()
+    added = _add_missing_columns(RiskScenario.__table__)
+    conn = db.session.connection()
+    for model in (RiskScenario, Asset, Threat, Vulnerability, Control, Incident):
+        columns = added if model is RiskScenario else _add_missing_columns(model.__table__)
+        if "updated_at" in columns and "created_at" in model.__table__.c:
+            # Sin historial: la fecha de alta hace de ultima modificacion.
+            conn.execute(text(f"UPDATE {model.__tablename__} SET updated_at = created_at"))
+    for name in OBSOLETE_INDEXES:
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    if ensure_search_index(conn):
+        print("Indice de busqueda creado")
+    if added or backfill:
+        n = backfill_stored_scores(db.session)
+        print(f"Scores materializados recalculados: {n} riesgos")
+    ensure_counters(conn)
+    conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    db.session.commit()
+
+
+def run():
+    from app import create_app
+
+    app = create_app(check_schema=False)
+    with app.app_context():
+        upgrade(backfill="--backfill" in sys.argv)
+    print(f"Esquema en version {SCHEMA_VERSION}; {precompile_templates(app)} plantillas precompiladas")
+
+
+if __name__ == "__main__":
+    run()
@@ -3,8 +3,10 @@ from __future__ import annotations
 from datetime import datetime, date
 
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, case, event, func, literal, update
+from sqlalchemy.orm import Session
 
-from utils import cid_to_impact, risk_level
+from utils import cid_to_impact, cid_to_impact_sql, in_ids, risk_level, risk_level_sql
 
 
 db = SQLAlchemy()
@@ -15,12 +17,25 @@ risk_controls = db.Table(
     "risk_controls",
     db.Column("risk_id", db.Integer, db.ForeignKey("risk_scenario.id"), primary_key=True),
     db.Column("control_id", db.Integer, db.ForeignKey("control.id"), primary_key=True),
+    # La PK cubre risk_id -> controles; este indice cubre control -> riesgos.
+    db.Index("ix_risk_controls_control_id", "control_id"),
+)
+
+# Dependencias entre activos: asset_id depende de depends_on_id (p. ej. un
+# servicio de su base de datos). Ver asset_graph.
+asset_dependency = db.Table(
+    "asset_dependency",
+    db.Column("asset_id", db.Integer, db.ForeignKey("asset.id", ondelete="CASCADE"), primary_key=True),
+    db.Column("depends_on_id", db.Integer, db.ForeignKey("asset.id", ondelete="CASCADE"), primary_key=True),
+    db.Index("ix_asset_dependency_depends_on_id", "depends_on_id"),
 )
 
 
 class Asset(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
+    name = db.Column(db.String(120), nullable=False, index=True)
+    # Busqueda por prefijo sin distinguir mayusculas (catalog_cache.search_catalog).
+    __table_args__ = (db.Index("ix_asset_name_nocase", db.collate(name, "NOCASE")),)
     asset_type = db.Column(db.String(50), nullable=False)
     description = db.Column(db.Text)
     owner = db.Column(db.String(120))
@@ -30,48 +45,81 @@ class Asset(db.Model):
     confidentiality = db.Column(db.Integer, nullable=False, default=1)
     integrity = db.Column(db.Integer, nullable=False, default=1)
     availability = db.Column(db.Integer, nullable=False, default=1)
+    # Mayor impacto de los activos que dependen de este, directa o
+    # indirectamente (NULL si ninguno). Lo mantiene asset_graph.
+    inherited_impact = db.Column(db.Integer, nullable=True)
 
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     risks = db.relationship("RiskScenario", back_populates="asset", cascade="all, delete-orphan")
+    depends_on = db.relationship(
+        "Asset", secondary=asset_dependency, backref="dependents",
+        primaryjoin=lambda: Asset.id == asset_dependency.c.asset_id,
+        secondaryjoin=lambda: Asset.id == asset_dependency.c.depends_on_id,
+    )
 
     @property
     def cid_total(self) -> int:
         return int(self.confidentiality) + int(self.integrity) + int(self.availability)
 
     @property
-    def impact_value(self) -> int:
+    def own_impact(self) -> int:
         return cid_to_impact(self.cid_total)
 
+    @property
+    def impact_value(self) -> int:
+        """Impacto efectivo: el del CID propio o el heredado de sus dependientes, el mayor."""
+        return max(self.own_impact, int(self.inherited_impact or 0))
+
 
 class Threat(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
+    name = db.Column(db.String(120), nullable=False, index=True)
+    # Busqueda por prefijo sin distinguir mayusculas (catalog_cache.search_catalog).
+    __table_args__ = (db.Index("ix_threat_name_nocase", db.collate(name, "NOCASE")),)
     category = db.Column(db.String(80), nullable=False)
     description = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class Vulnerability(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120), nullable=False)
+    name = db.Column(db.String(120), nullable=False, index=True)
+    # Busqueda por prefijo sin distinguir mayusculas (catalog_cache.search_catalog).
+    __table_args__ = (db.Index("ix_vulnerability_name_nocase", db.collate(name, "NOCASE")),)
     category = db.Column(db.String(80), nullable=False)
     description = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class Control(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(160), nullable=False)
+    name = db.Column(db.String(160), nullable=False, index=True)
+    # Busqueda por prefijo sin distinguir mayusculas (catalog_cache.search_catalog).
+    __table_args__ = (db.Index("ix_control_name_nocase", db.collate(name, "NOCASE")),)
     iso_reference = db.Column(db.String(120), nullable=True)
     control_type = db.Column(db.String(40), nullable=True)
     description = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class RiskScenario(db.Model):
+    # Indices compuestos para cada filtro del registro combinado con su orden
+    # (inherent_score desc, id desc); SQLite agrega el rowid al final de cada indice.
+    __table_args__ = (
+        db.Index("ix_risk_scenario_level_score", "inherent_level", "inherent_score"),
+        db.Index("ix_risk_scenario_status_score", "status", "inherent_score"),
+        db.Index("ix_risk_scenario_strategy_score", "treatment_strategy", "inherent_score"),
+        db.Index("ix_risk_scenario_asset_score", "asset_id", "inherent_score"),
+        db.Index("ix_risk_scenario_responsible_score", "responsible", "inherent_score"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     asset_id = db.Column(db.Integer, db.ForeignKey("asset.id"), nullable=False)
-    threat_id = db.Column(db.Integer, db.ForeignKey("threat.id"), nullable=False)
-    vulnerability_id = db.Column(db.Integer, db.ForeignKey("vulnerability.id"), nullable=False)
+    threat_id = db.Column(db.Integer, db.ForeignKey("threat.id"), nullable=False, index=True)
+    vulnerability_id = db.Column(db.Integer, db.ForeignKey("vulnerability.id"), nullable=False, index=True)
 
     existing_controls = db.Column(db.Text)
 
@@ -82,7 +130,7 @@ class RiskScenario(db.Model):
     # Tratamiento
     treatment_strategy = db.Column(db.String(20), nullable=True)  # Mitigar/Transferir/Aceptar/Evitar
     responsible = db.Column(db.String(120), nullable=True)
-    due_date = db.Column(db.Date, nullable=True)
+    due_date = db.Column(db.Date, nullable=True, index=True)
     status = db.Column(db.String(30), nullable=False, default="Pendiente")
     acceptance_justification = db.Column(db.Text, nullable=True)
     acceptance_approved_by = db.Column(db.String(120), nullable=True)
@@ -95,13 +143,23 @@ class RiskScenario(db.Model):
     # Comunicacion
     observations = db.Column(db.Text, nullable=True)
 
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_review_at = db.Column(db.DateTime, nullable=True)
+    # Ultima modificacion del riesgo, sus controles propuestos o sus incidentes
+    # (exports incrementales).
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    # Scores materializados (se sincronizan en before_flush, ver abajo) para
+    # poder ordenar/filtrar con ORDER BY ... LIMIT sin cargar cada activo.
+    stored_inherent_score = db.Column("inherent_score", db.Integer, index=True)
+    stored_inherent_level = db.Column("inherent_level", db.String(10))
+    stored_residual_score = db.Column("residual_score", db.Integer, index=True)
+    stored_residual_level = db.Column("residual_level", db.String(10), index=True)
 
     asset = db.relationship("Asset", back_populates="risks")
     threat = db.relationship("Threat")
     vulnerability = db.relationship("Vulnerability")
-    proposed_controls = db.relationship("Control", secondary=risk_controls, lazy="subquery")
+    proposed_controls = db.relationship("Control", secondary=risk_controls)
     incidents = db.relationship("Incident", back_populates="risk", cascade="all, delete-orphan")
 
     def impact_value(self) -> int:
@@ -127,12 +185,221 @@ class RiskScenario(db.Model):
         score = self.residual_score()
         return risk_level(score) if score is not None else None
 
+    def refresh_stored_scores(self, asset: Asset | None = None) -> None:
+        """Copia los scores calculados a las columnas materializadas."""
+        asset = asset or self.asset
+        values = stored_scores(self.probability, self.impact_override, self.residual_probability,
+                               self.residual_impact, asset.impact_value)
+        for key, value in values.items():
+            setattr(self, key, value)
+
+
+def stored_scores(probability: int, impact_override: int | None, residual_probability: int | None,
+                  residual_impact: int | None, asset_impact: int) -> dict:
+    """Valores de las columnas materializadas (para el ORM y para inserts masivos)."""
+    impact = int(impact_override) if impact_override else int(asset_impact)
+    inherent = int(probability) * impact
+    values = {
+        "stored_inherent_score": inherent,
+        "stored_inherent_level": risk_level(inherent),
+        "stored_residual_score": None,
+        "stored_residual_level": None,
+    }
+    if residual_probability is not None or residual_impact is not None:
+        rp = int(residual_probability) if residual_probability is not None else int(probability)
+        ri = int(residual_impact) if residual_impact is not None else impact
+        values["stored_residual_score"] = rp * ri
+        values["stored_residual_level"] = risk_level(rp * ri)
+    return values
+
 
 class Incident(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    risk_id = db.Column(db.Integer, db.ForeignKey("risk_scenario.id"), nullable=False)
-    date = db.Column(db.Date, nullable=False, default=date.today)
+    risk_id = db.Column(db.Integer, db.ForeignKey("risk_scenario.id"), nullable=False, index=True)
+    date = db.Column(db.Date, nullable=False, default=date.today, index=True)
     description = db.Column(db.Text, nullable=False)
     severity = db.Column(db.String(20), nullable=True)
+    # ID del sistema de origen (p. ej. el SIEM); evita duplicados en la ingesta.
+    external_id = db.Column(db.String(120), nullable=True, unique=True, index=True)
 
     risk = db.relationship("RiskScenario", back_populates="incidents")
+
+
+class RiskCounter(db.Model):
+    """Conteos agregados del registro por dimension; los mantiene counters.py."""
+    dimension = db.Column(db.String(30), primary_key=True)
+    key1 = db.Column(db.String(50), primary_key=True)
+    key2 = db.Column(db.String(50), primary_key=True, default="")
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DataVersion(db.Model):
+    """Version por tabla; la incrementa response_cache.py en cada escritura."""
+    table_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ChangeLog(db.Model):
+    """Historial append-only de cambios por campo; lo escribe audit.py."""
+    __tablename__ = "change_log"
+    __table_args__ = (
+        # "Linea de tiempo del riesgo X".
+        db.Index("ix_change_log_row", "table_name", "row_id", "changed_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=True)  # NULL en sentencias masivas
+    action = db.Column(db.String(12), nullable=False)  # insert | update | delete | bulk_*
+    changes = db.Column(db.Text, nullable=False)  # JSON {campo: [antes, despues]}
+    context = db.Column(db.String(120), nullable=True)  # endpoint o script
+
+
+class RegisterSnapshot(db.Model):
+    """Foto del registro (scores, niveles, estado y estrategia); la escribe snapshots.py."""
+    __tablename__ = "register_snapshot"
+
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    label = db.Column(db.String(60), nullable=True)  # p. ej. "Cierre 2026-Q3"
+    # NULL: foto completa. Si no, id de la foto completa sobre la que se
+    # encadenan los deltas hasta esta.
+    base_id = db.Column(db.Integer, nullable=True, index=True)
+    risk_count = db.Column(db.Integer, nullable=False)
+    changed_rows = db.Column(db.Integer, nullable=False)  # filas guardadas en payload
+    removed_rows = db.Column(db.Integer, nullable=False, default=0)
+    payload = db.Column(db.LargeBinary, nullable=False)  # columnas comprimidas (zlib)
+    kpis = db.Column(db.Text, nullable=False)  # JSON {metrica: valor}
+
+
+# ------------------- Scores materializados -------------------
+CID_FIELDS = ("confidentiality", "integrity", "availability")
+SCORE_FIELDS = ("probability", "impact_override", "residual_probability", "residual_impact", "asset_id", "asset")
+
+
+def _stored_scores_values(impact, new_values: dict | None = None):
+    """Valores SQL de las columnas materializadas dado el impacto del activo.
+
+    `new_values`: columnas que asigna el mismo UPDATE (dentro del SET, las
+    columnas todavia tienen el valor anterior).
+    """
+    r = RiskScenario
+    new_values = new_values or {}
+
+    def column(name):
+        attr = getattr(r, name)
+        return literal(new_values[name], attr.type) if name in new_values else attr
+
+    probability, override = column("probability"), column("impact_override")
+    residual_probability, residual_impact = column("residual_probability"), column("residual_impact")
+    has_override = and_(override.isnot(None), override != 0)
+    eff_impact = case((has_override, override), else_=impact)
+    inherent = probability * eff_impact
+    not_evaluated = and_(residual_probability.is_(None), residual_impact.is_(None))
+    residual = case(
+        (not_evaluated, None),
+        else_=func.coalesce(residual_probability, probability) * func.coalesce(residual_impact, eff_impact),
+    )
+    return {
+        "inherent_score": inherent,
+        "inherent_level": risk_level_sql(inherent),
+        "residual_score": residual,
+        "residual_level": case((not_evaluated, None), else_=risk_level_sql(residual)),
+    }
+
+
+def asset_impact_sql():
+    """Asset.impact_value en SQL."""
+    own = cid_to_impact_sql(Asset.confidentiality + Asset.integrity + Asset.availability)
+    return func.max(own, func.coalesce(Asset.inherited_impact, 0))
+
+
+def backfill_stored_scores(session, asset_ids=None) -> int:
+    """Recalcula en SQL las columnas materializadas (todas o las de esos activos)."""
+    stmt = (
+        update(RiskScenario.__table__)
+        .where(RiskScenario.asset_id == Asset.id)
+        .values(_stored_scores_values(asset_impact_sql()))
+    )
+    if asset_ids is not None:
+        stmt = stmt.where(in_ids(RiskScenario.asset_id, asset_ids))
+    return session.connection().execute(stmt).rowcount
+
+
+def _risk_asset(session, risk: RiskScenario) -> Asset | None:
+    # Si se cambio asset_id a mano, la relacion cargada puede estar desactualizada.
+    asset = risk.__dict__.get("asset")
+    if asset is not None and (risk.asset_id is None or asset.id == risk.asset_id):
+        return asset
+    if risk.asset_id is None:
+        return None
+    return session.get(Asset, risk.asset_id)
+
+
+@event.listens_for(Session, "before_flush")
+def _sync_stored_scores(session, flush_context, instances):
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, RiskScenario):
+                if obj in session.dirty and not any(_changed(obj, f) for f in SCORE_FIELDS):
+                    continue
+                asset = _risk_asset(session, obj)
+                if asset is None:
+                    continue
+                obj.refresh_stored_scores(asset)
+            elif isinstance(obj, Asset) and obj in session.dirty:
+                if not any(_changed(obj, f) for f in CID_FIELDS):
+                    continue
+                # Un UPDATE por activo en vez de cargar todos sus riesgos.
+                session.connection().execute(
+                    update(RiskScenario.__table__)
+                    .where(RiskScenario.asset_id == obj.id)
+                    .values(_stored_scores_values(obj.impact_value))
+                )
+                for risk in obj.__dict__.get("risks", []):
+                    if risk not in session.new and risk not in session.dirty:
+                        session.expire(risk, [
+                            "stored_inherent_score", "stored_inherent_level",
+                            "stored_residual_score", "stored_residual_level",
+                        ])
+
+
+def _changed(obj, field: str) -> bool:
+    return db.inspect(obj).attrs[field].history.has_changes()
+
+
+# ------------------- Marca de modificacion -------------------
+def touch_risks(connection, risk_ids) -> None:
+    """updated_at = ahora, para cambios que no emiten UPDATE del riesgo (incidentes, controles)."""
+    risk_ids = {rid for rid in risk_ids if rid is not None}
+    if risk_ids:
+        connection.execute(
+            update(RiskScenario.__table__).where(in_ids(RiskScenario.id, risk_ids)).values(updated_at=datetime.utcnow())
+        )
+
+
+@event.listens_for(Session, "before_flush")
+def _touch_updated_at(session, flush_context, instances):
+    now = datetime.utcnow()
+    for obj in session.dirty:
+        # Un cambio solo en controles propuestos no dispara el onupdate.
+        if isinstance(obj, RiskScenario) and session.is_modified(obj):
+            obj.updated_at = now
+    risk_ids = set()
+    for obj in (*session.new, *session.deleted):
+        if isinstance(obj, Incident):
+            risk = obj.__dict__.get("risk")
+            risk_ids.add(obj.risk_id if obj.risk_id is not None else getattr(risk, "id", None))
+    if risk_ids - {None}:
+        touch_risks(session.connection(), risk_ids)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _touch_bulk_incidents(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    params = orm_execute_state.parameters
+    if orm_execute_state.is_insert and mapper is not None and mapper.class_ is Incident and params:
+        rows = params if isinstance(params, list) else [params]
+        touch_risks(orm_execute_state.session.connection(), {row.get("risk_id") for row in rows})
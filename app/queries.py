@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, asdict
+from datetime import date
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload, raiseload, selectinload
+
+from forms import STATUS, TREATMENT_STRATEGIES
+from models import RiskScenario
+
+LEVELS = ["Bajo", "Medio", "Alto", "Critico"]
+PER_PAGE_DEFAULT = 50
+PER_PAGE_MAX = 200
+
+
+# ------------------- Perfiles de carga -------------------
+# Cada vista pide exactamente las relaciones que renderiza. Las colecciones
+# que una vista no usa quedan en raiseload: si una plantilla las toca, falla
+# en desarrollo en vez de disparar una consulta por fila (N+1).
+_SCENARIO = (
+    joinedload(RiskScenario.asset),
+    joinedload(RiskScenario.threat),
+    joinedload(RiskScenario.vulnerability),
+)
+
+LOAD_PROFILES = {
+    # Filas de tablas (panel, registro, PDF): escenario sin colecciones.
+    "row": _SCENARIO + (
+        raiseload(RiskScenario.proposed_controls),
+        raiseload(RiskScenario.incidents),
+    ),
+    # Ficha del riesgo: escenario + controles + incidentes.
+    "detail": _SCENARIO + (
+        selectinload(RiskScenario.proposed_controls),
+        selectinload(RiskScenario.incidents),
+    ),
+    "treatment": (selectinload(RiskScenario.proposed_controls),),
+    "residual": (joinedload(RiskScenario.asset),),
+    # Formularios que solo leen/escriben columnas del riesgo.
+    "bare": (),
+}
+
+
+def risk_query(profile: str = "row"):
+    return RiskScenario.query.options(*LOAD_PROFILES[profile])
+
+
+def get_risk_or_404(risk_id: int, profile: str = "bare") -> RiskScenario:
+    return risk_query(profile).filter(RiskScenario.id == risk_id).first_or_404()
+
+
+def _parse_date(value: str | None) -> date | None:
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _parse_int(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class RiskFilters:
+    level: str | None = None
+    status: str | None = None
+    strategy: str | None = None
+    asset_id: int | None = None
+    responsible: str | None = None
+    due_from: date | None = None
+    due_to: date | None = None
+
+    @classmethod
+    def from_args(cls, args) -> RiskFilters:
+        """Lee filtros desde request.args ignorando valores no validos."""
+        level = args.get("level")
+        status = args.get("status")
+        strategy = args.get("strategy")
+        return cls(
+            level=level if level in LEVELS else None,
+            status=status if status in dict(STATUS) else None,
+            strategy=strategy if strategy in dict(TREATMENT_STRATEGIES) else None,
+            asset_id=_parse_int(args.get("asset_id")),
+            responsible=(args.get("responsible") or "").strip() or None,
+            due_from=_parse_date(args.get("due_from")),
+            due_to=_parse_date(args.get("due_to")),
+        )
+
+    def to_args(self) -> dict:
+        return {k: (v.isoformat() if isinstance(v, date) else v) for k, v in asdict(self).items() if v is not None}
+
+    def apply(self, query):
+        if self.level:
+            query = query.filter(RiskScenario.stored_inherent_level == self.level)
+        if self.status:
+            query = query.filter(RiskScenario.status == self.status)
+        if self.strategy:
+            query = query.filter(RiskScenario.treatment_strategy == self.strategy)
+        if self.asset_id:
+            query = query.filter(RiskScenario.asset_id == self.asset_id)
+        if self.responsible:
+            query = query.filter(RiskScenario.responsible == self.responsible)
+        if self.due_from:
+            query = query.filter(RiskScenario.due_date >= self.due_from)
+        if self.due_to:
+            query = query.filter(RiskScenario.due_date <= self.due_to)
+        return query
+
+
+@dataclass
+class RiskPage:
+    items: list[RiskScenario]
+    next_cursor: str | None
+    prev_cursor: str | None
+
+
+def encode_cursor(risk: RiskScenario) -> str:
+    return f"{risk.stored_inherent_score}.{risk.id}"
+
+
+def decode_cursor(value: str | None) -> tuple[int, int] | None:
+    try:
+        score, rid = (value or "").split(".")
+        return int(score), int(rid)
+    except ValueError:
+        return None
+
+
+def risk_register_page(filters: RiskFilters, after: str | None = None, before: str | None = None,
+                       per_page: int = PER_PAGE_DEFAULT) -> RiskPage:
+    """Pagina del registro con paginacion keyset (score desc, id desc).
+
+    El costo no depende del numero de pagina: cada salto es un seek sobre
+    el indice de inherent_score en lugar de un OFFSET.
+    """
+    per_page = max(1, min(per_page, PER_PAGE_MAX))
+    score, rid = RiskScenario.stored_inherent_score, RiskScenario.id
+    key = tuple_(score, rid)
+    query = filters.apply(risk_query("row"))
+
+    after_key, before_key = decode_cursor(after), decode_cursor(before)
+    backwards = before_key is not None and after_key is None
+    if after_key:
+        s, i = after_key
+        query = query.filter(key < tuple_(s, i))
+    elif backwards:
+        s, i = before_key
+        query = query.filter(key > tuple_(s, i))
+
+    # Mismo sentido en ambas columnas: el indice se recorre sin ordenar aparte.
+    order = (score.asc(), rid.asc()) if backwards else (score.desc(), rid.desc())
+    rows = query.order_by(*order).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return RiskPage([], None, None)
+    if backwards:
+        next_cursor = encode_cursor(rows[-1])
+        prev_cursor = encode_cursor(rows[0]) if has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1]) if has_more else None
+        prev_cursor = encode_cursor(rows[0]) if after_key else None
+    return RiskPage(rows, next_cursor, prev_cursor)
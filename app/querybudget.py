@@ -0,0 +1,91 @@
+"""Presupuesto de consultas SQL por ruta.
+
+Crea una base temporal con un volumen grande de datos, recorre las rutas
+principales con el cliente de pruebas de Flask y cuenta las sentencias SQL
+que ejecuta cada una. Termina con codigo 1 si alguna ruta supera su
+presupuesto (p. ej. porque una plantilla volvio a disparar N+1).
+
+Uso:
+    python querybudget.py [--risks 5000]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+from sqlalchemy import event
+
+# Presupuesto maximo de sentencias por ruta (con caches calientes). No debe
+# depender del volumen. Las rutas con selects de catalogo leen una vez por
+# request la version de datos de los catalogos (ver catalog_cache).
+BUDGETS = {
+    "/": 3,
+    "/risks": 1,
+    "/risks?level=Critico&status=Pendiente": 1,
+    "/risks/{risk_id}": 3,
+    "/risks/{risk_id}/edit": 2,
+    "/risks/{risk_id}/treatment": 3,
+    "/risks/{risk_id}/residual": 1,
+    "/risks/{risk_id}/history": 2,
+    "/risks/bulk?level=Critico": 2,
+    "/search?q=servidor": 3,
+    "/assets": 1,
+    "/threats": 1,
+    "/vulnerabilities": 1,
+    "/controls": 1,
+    "/reports/risk-register.pdf": 1,
+    "/analysis": 1,
+    "/analysis/heatmap.json": 1,
+    "/analysis/controls": 1,
+}
+
+
+def run(n_risks: int) -> int:
+    tmp = tempfile.mkdtemp(prefix="riskguard-qb-")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "qb.sqlite3")
+    os.environ["EXPORTS_DIR"] = os.path.join(tmp, "exports")
+    # Se mide lo que hace cada ruta al renderizar, no el cache de respuestas.
+    os.environ["RESPONSE_CACHE"] = "off"
+
+    from app import create_app
+    from models import db
+    from seed import generate
+
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    counter = {"n": 0}
+    main_thread = threading.get_ident()
+
+    with app.app_context():
+        generate(n_assets=max(1, n_risks // 10), n_catalog=50, n_risks=n_risks)
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            # Solo el hilo del request: el worker del PDF consulta en paralelo.
+            if threading.get_ident() == main_thread:
+                counter["n"] += 1
+
+    client = app.test_client()
+    failures = 0
+    for route, budget in BUDGETS.items():
+        url = route.format(risk_id=1)
+        # Se mide en caliente: los catalogos cacheados se cargan en la primera
+        # visita. El PDF no, porque la primera visita encola un trabajo.
+        if not route.startswith("/reports/"):
+            client.get(url).close()
+        counter["n"] = 0
+        status = client.get(url).status_code
+        used = counter["n"]
+        ok = status == 200 and used <= budget
+        failures += not ok
+        print(f"{'OK ' if ok else 'FAIL'} {url:45} status={status} queries={used} budget={budget}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--risks", type=int, default=5000)
+    sys.exit(run(parser.parse_args().risks))
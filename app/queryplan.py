@@ -0,0 +1,109 @@
+"""Verifica con EXPLAIN QUERY PLAN que las consultas calientes usen indices.
+
+Recorre las rutas principales sobre una base temporal con datos sinteticos,
+captura cada SELECT que ejecutan y revisa su plan. Termina con codigo 1 si
+alguna consulta recorre una tabla completa sin indice ("SCAN tabla") fuera de
+las excepciones declaradas en ALLOWED_SCANS.
+
+Uso:
+    python queryplan.py
+"""
+from __future__ import annotations
+
+import os
+import re
+import sys
+import tempfile
+
+ROUTES = [
+    "/",
+    "/risks",
+    "/risks?after=10.500",
+    "/risks?level=Critico",
+    "/risks?status=Pendiente",
+    "/risks?strategy=Mitigar",
+    "/risks?asset_id=3",
+    "/risks?responsible=Responsable%201",
+    "/risks?due_from=2025-01-01&due_to=2025-12-31",
+    "/risks/{risk_id}",
+    "/risks/{risk_id}/edit",
+    "/risks/{risk_id}/treatment",
+    "/risks/{risk_id}/residual",
+    "/assets",
+    "/threats",
+    "/vulnerabilities",
+    "/controls",
+    "/reports/risk-register.pdf",
+    "/analysis",
+]
+
+# Recorridos completos que son intencionales (ruta -> tablas).
+ALLOWED_SCANS = {
+    # Los KPIs agregan sobre todo el registro.
+    "/": {"risk_scenario"},
+    # Catalogos sin paginar: listan la tabla completa a proposito.
+    "/threats": {"threat"},
+    "/vulnerabilities": {"vulnerability"},
+    "/controls": {"control"},
+    # Los contadores son O(celdas): se leen completos.
+    "/analysis": {"risk_counter"},
+}
+
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def run() -> int:
+    tmp = tempfile.mkdtemp(prefix="riskguard-qp-")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "qp.sqlite3")
+    os.environ["EXPORTS_DIR"] = os.path.join(tmp, "exports")
+    # Se mide lo que hace cada ruta al renderizar, no el cache de respuestas.
+    os.environ["RESPONSE_CACHE"] = "off"
+
+    from sqlalchemy import event
+
+    from app import create_app
+    from models import db
+    from seed import generate
+
+    app = create_app()
+    captured: list[tuple[str, tuple]] = []
+    with app.app_context():
+        generate(n_assets=200, n_catalog=50, n_risks=2000)
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def _capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT") and not executemany:
+                captured.append((statement, parameters))
+
+    client = app.test_client()
+    failures = 0
+    for route in ROUTES:
+        url = route.format(risk_id=1)
+        captured.clear()
+        client.get(url).close()
+        queries = list(captured)
+        allowed = ALLOWED_SCANS.get(route, set())
+        route_ok = True
+        with app.app_context():
+            conn = db.engine.raw_connection()
+            try:
+                for statement, params in queries:
+                    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + statement, params)]
+                    scans = [m.group(1) for line in plan if (m := _FULL_SCAN.match(line))]
+                    bad = [t for t in scans if t not in allowed]
+                    if bad:
+                        failures += 1
+                        route_ok = False
+                        print(f"FAIL {url}: recorrido completo de {', '.join(bad)}")
+                        print("     " + " ".join(statement.split())[:200])
+                        for line in plan:
+                            print(f"       {line}")
+            finally:
+                conn.close()
+        if route_ok:
+            print(f"ok   {url} ({len(queries)} consultas)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,317 @@
+"""Export columnar del registro (Apache Arrow / Parquet) para analitica.
+
+Requiere pyarrow (opcional). Una fila por escenario de riesgo, con los datos
+del activo, amenaza y vulnerabilidad desnormalizados, scores y niveles,
+tratamiento, controles propuestos y resumen de incidentes.
+
+- Se escribe por lotes (record batches) leyendo el registro con yield_per:
+  la memoria no depende del tamano del registro.
+- Las columnas categoricas (niveles, estados, tipos, catalogos) van
+  codificadas como diccionario.
+- Export incremental: solo los riesgos cuyo `updated_at` (o el de su activo,
+  amenaza, vulnerabilidad o controles propuestos) es posterior a `since`.
+  Los riesgos borrados no aparecen: se detectan comparando con un export
+  completo.
+
+Formatos: Parquet (.parquet) o Arrow IPC stream (.arrows; el formato de
+archivo de Arrow no admite diccionarios distintos por lote).
+
+Uso:
+    python register_export.py --dir ../exports/analytics                # completo
+    python register_export.py --dir ../exports/analytics --incremental  # cambios desde el ultimo export
+    python register_export.py --since 2026-01-01T00:00 --format arrow
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import func, or_, select
+
+from models import db, Asset, Control, Incident, RiskScenario, Threat, Vulnerability, risk_controls
+from utils import cid_to_impact
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # dependencia opcional
+    pa = pq = None
+
+BATCH_ROWS = 5000
+FORMATS = {"parquet": ".parquet", "arrow": ".arrows"}
+STATE_FILE = "state.json"
+
+
+def require_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError("El export columnar requiere pyarrow (pip install pyarrow)")
+
+
+def register_schema() -> "pa.Schema":
+    require_pyarrow()
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("risk_id", pa.int64()),
+        ("asset_id", pa.int64()),
+        ("asset", pa.string()),
+        ("asset_type", category),
+        ("asset_process", category),
+        ("asset_owner", category),
+        ("confidentiality", pa.int8()),
+        ("integrity", pa.int8()),
+        ("availability", pa.int8()),
+        ("asset_impact", pa.int8()),
+        ("threat_id", pa.int64()),
+        ("threat", category),
+        ("threat_category", category),
+        ("vulnerability_id", pa.int64()),
+        ("vulnerability", category),
+        ("vulnerability_category", category),
+        ("probability", pa.int8()),
+        ("impact_override", pa.int8()),
+        ("impact", pa.int8()),
+        ("inherent_score", pa.int8()),
+        ("inherent_level", category),
+        ("residual_probability", pa.int8()),
+        ("residual_impact", pa.int8()),
+        ("residual_score", pa.int8()),
+        ("residual_level", category),
+        ("treatment_strategy", category),
+        ("status", category),
+        ("responsible", category),
+        ("due_date", pa.date32()),
+        ("completed_at", pa.date32()),
+        ("acceptance_approved_by", pa.string()),
+        ("proposed_control_ids", pa.list_(pa.int64())),
+        ("proposed_controls", pa.list_(pa.string())),
+        ("incident_count", pa.int32()),
+        ("last_incident_date", pa.date32()),
+        ("created_at", pa.timestamp("us")),
+        ("updated_at", pa.timestamp("us")),
+    ])
+
+
+# Columnas leidas en la consulta principal, en el orden del schema
+# (las derivadas se calculan por lote).
+_SELECT = (
+    RiskScenario.id, Asset.id, Asset.name, Asset.asset_type, Asset.process, Asset.owner,
+    Asset.confidentiality, Asset.integrity, Asset.availability, Asset.inherited_impact,
+    Threat.id, Threat.name, Threat.category, Vulnerability.id, Vulnerability.name, Vulnerability.category,
+    RiskScenario.probability, RiskScenario.impact_override,
+    RiskScenario.stored_inherent_score, RiskScenario.stored_inherent_level,
+    RiskScenario.residual_probability, RiskScenario.residual_impact,
+    RiskScenario.stored_residual_score, RiskScenario.stored_residual_level,
+    RiskScenario.treatment_strategy, RiskScenario.status, RiskScenario.responsible,
+    RiskScenario.due_date, RiskScenario.completed_at, RiskScenario.acceptance_approved_by,
+    RiskScenario.created_at, RiskScenario.updated_at,
+)
+
+
+@dataclass
+class ExportResult:
+    path: str
+    full: bool
+    since: datetime | None
+    watermark: datetime  # usar como `since` del proximo export incremental
+    rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    def to_dict(self) -> dict:
+        data = dict(self.__dict__)
+        data["since"] = self.since.isoformat() if self.since else None
+        data["watermark"] = self.watermark.isoformat()
+        return data
+
+
+def register_stmt(since: datetime | None = None, batch_size: int = BATCH_ROWS):
+    stmt = (
+        select(*_SELECT)
+        .join(Asset, RiskScenario.asset_id == Asset.id)
+        .join(Threat, RiskScenario.threat_id == Threat.id)
+        .join(Vulnerability, RiskScenario.vulnerability_id == Vulnerability.id)
+        .order_by(RiskScenario.id)
+        .execution_options(yield_per=batch_size)
+    )
+    if since is not None:
+        controls_changed = (
+            select(risk_controls.c.risk_id)
+            .join(Control, Control.id == risk_controls.c.control_id)
+            .where(Control.updated_at > since)
+        )
+        stmt = stmt.where(or_(
+            RiskScenario.updated_at > since,
+            Asset.updated_at > since,
+            Threat.updated_at > since,
+            Vulnerability.updated_at > since,
+            RiskScenario.id.in_(controls_changed),
+        ))
+    return stmt
+
+
+def _controls_by_risk(session, risk_ids: list[int]) -> dict[int, tuple[list, list]]:
+    result: dict[int, tuple[list, list]] = {}
+    rows = session.execute(
+        select(risk_controls.c.risk_id, Control.id, Control.name)
+        .join(Control, Control.id == risk_controls.c.control_id)
+        .where(risk_controls.c.risk_id.in_(risk_ids))
+        .order_by(risk_controls.c.risk_id, Control.id)
+    )
+    for rid, cid, name in rows:
+        ids, names = result.setdefault(rid, ([], []))
+        ids.append(cid)
+        names.append(name)
+    return result
+
+
+def _incidents_by_risk(session, risk_ids: list[int]) -> dict[int, tuple[int, object]]:
+    rows = session.execute(
+        select(Incident.risk_id, func.count(), func.max(Incident.date))
+        .where(Incident.risk_id.in_(risk_ids))
+        .group_by(Incident.risk_id)
+    )
+    return {rid: (n, last) for rid, n, last in rows}
+
+
+def _record_batch(session, schema: "pa.Schema", rows: list) -> "pa.RecordBatch":
+    (rid, asset_id, asset, asset_type, process, owner, c, i, a, inherited, threat_id, threat, threat_cat,
+     vuln_id, vuln, vuln_cat, probability, impact_override, inherent, inherent_level,
+     residual_p, residual_i, residual, residual_level, strategy, status, responsible,
+     due_date, completed_at, approved_by, created_at, updated_at) = zip(*rows)
+    risk_ids = list(rid)
+    controls = _controls_by_risk(session, risk_ids)
+    incidents = _incidents_by_risk(session, risk_ids)
+    no_controls, no_incidents = ([], []), (0, None)
+
+    columns = {
+        "risk_id": rid, "asset_id": asset_id, "asset": asset, "asset_type": asset_type,
+        "asset_process": process, "asset_owner": owner,
+        "confidentiality": c, "integrity": i, "availability": a,
+        # Impacto efectivo del activo (incluye el heredado de sus dependientes).
+        "asset_impact": [max(cid_to_impact(x + y + z), h or 0) for x, y, z, h in zip(c, i, a, inherited)],
+        "threat_id": threat_id, "threat": threat, "threat_category": threat_cat,
+        "vulnerability_id": vuln_id, "vulnerability": vuln, "vulnerability_category": vuln_cat,
+        "probability": probability, "impact_override": [v or None for v in impact_override],
+        # inherent = P x I, por lo que el impacto efectivo es exacto.
+        "impact": [s // p for s, p in zip(inherent, probability)],
+        "inherent_score": inherent, "inherent_level": inherent_level,
+        "residual_probability": residual_p, "residual_impact": residual_i,
+        "residual_score": residual, "residual_level": residual_level,
+        "treatment_strategy": strategy, "status": status, "responsible": responsible,
+        "due_date": due_date, "completed_at": completed_at, "acceptance_approved_by": approved_by,
+        "proposed_control_ids": [controls.get(r, no_controls)[0] for r in risk_ids],
+        "proposed_controls": [controls.get(r, no_controls)[1] for r in risk_ids],
+        "incident_count": [incidents.get(r, no_incidents)[0] for r in risk_ids],
+        "last_incident_date": [incidents.get(r, no_incidents)[1] for r in risk_ids],
+        "created_at": created_at, "updated_at": updated_at,
+    }
+    arrays = []
+    for f in schema:
+        if pa.types.is_dictionary(f.type):
+            arrays.append(pa.array(columns[f.name], type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(columns[f.name], type=f.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def iter_record_batches(session, since: datetime | None = None, batch_size: int = BATCH_ROWS):
+    schema = register_schema()
+    for rows in session.execute(register_stmt(since, batch_size)).partitions():
+        yield _record_batch(session, schema, rows)
+
+
+def export_register(sink, fmt: str = "parquet", since: datetime | None = None,
+                    batch_size: int = BATCH_ROWS, session=None) -> ExportResult:
+    """Escribe el registro (o los cambios desde `since`) en `sink` (ruta o archivo binario).
+
+    Debe ejecutarse dentro de un app context.
+    """
+    require_pyarrow()
+    if fmt not in FORMATS:
+        raise ValueError(f"Formato desconocido: {fmt}")
+    session = session or db.session
+    start = time.perf_counter()
+    # Lo que cambie durante el export vuelve a salir en el siguiente incremental.
+    watermark = datetime.utcnow()
+    result = ExportResult(path=sink if isinstance(sink, str) else getattr(sink, "name", ""),
+                          full=since is None, since=since, watermark=watermark)
+
+    schema = register_schema().with_metadata({
+        "riskguard.exported_at": watermark.isoformat(),
+        "riskguard.since": since.isoformat() if since else "",
+    })
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    try:
+        for batch in iter_record_batches(session, since, batch_size):
+            writer.write_batch(batch)
+            result.rows += batch.num_rows
+            result.batches += 1
+    finally:
+        writer.close()
+    result.seconds = round(time.perf_counter() - start, 3)
+    return result
+
+
+# ------------------- Exports programados (CLI) -------------------
+def _load_state(directory: str) -> dict:
+    try:
+        with open(os.path.join(directory, STATE_FILE), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(directory: str, result: ExportResult) -> None:
+    tmp = os.path.join(directory, STATE_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump({"watermark": result.watermark.isoformat(), "last_file": os.path.basename(result.path)}, fh)
+    os.replace(tmp, os.path.join(directory, STATE_FILE))
+
+
+def export_to_directory(directory: str, fmt: str = "parquet", since: datetime | None = None,
+                        incremental: bool = False, batch_size: int = BATCH_ROWS) -> ExportResult:
+    """Export con nombre por fecha; con `incremental` toma `since` del ultimo export."""
+    os.makedirs(directory, exist_ok=True)
+    if incremental and since is None:
+        watermark = _load_state(directory).get("watermark")
+        since = datetime.fromisoformat(watermark) if watermark else None
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    kind = "full" if since is None else "delta"
+    path = os.path.join(directory, f"register_{kind}_{stamp}{FORMATS[fmt]}")
+    result = export_register(path + ".tmp", fmt, since, batch_size)
+    os.replace(path + ".tmp", path)
+    result.path = path
+    _save_state(directory, result)
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", default=None, help="carpeta de salida (por defecto EXPORTS_DIR/analytics)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None, help="solo cambios desde (UTC, ISO 8601)")
+    parser.add_argument("--incremental", action="store_true", help="cambios desde el ultimo export de la carpeta")
+    parser.add_argument("--batch", type=int, default=BATCH_ROWS)
+    args = parser.parse_args()
+    require_pyarrow()
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        directory = args.dir or os.path.join(app.config["EXPORTS_DIR"], "analytics")
+        result = export_to_directory(directory, args.format, args.since, args.incremental, args.batch)
+    print(json.dumps(result.to_dict(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from models import db
+from response_cache import data_versions
+
+ARTIFACT_PREFIX = "registro_riesgos_"
+_KEY_RE = re.compile(r"^[0-9a-f]{24}$")
+# Tablas que aparecen en el PDF (ver response_cache.data_versions).
+REGISTER_TABLES = ("risk_scenario", "asset", "threat", "vulnerability", "control")
+
+
+class TaskQueueFull(Exception):
+    """Hay max_results tareas pendientes: no se encolan mas hasta que terminen."""
+
+
+@dataclass
+class ReportJob:
+    key: str
+    status: str = "queued"  # queued | running | done | error
+    artifact: str | None = None  # clave del PDF generado (ver ReportJobs._run)
+    result: dict | None = None  # resultado de submit_task
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.key,
+            "artifact": self.artifact,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def register_key() -> str:
+    """Clave del registro segun la version de sus tablas: una consulta, sin leer filas.
+
+    Incluye la fecha de cada version para que una base recreada (versiones
+    desde 0 otra vez) no coincida con PDFs viejos de `exports/`.
+    """
+    versions = data_versions(REGISTER_TABLES)
+    raw = "|".join(f"{name}:{version}:{updated_at}" for name, (version, updated_at) in sorted(versions.items()))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24]
+
+
+class ReportJobs:
+    """Cola local (sin broker) que genera el PDF en segundo plano.
+
+    Los artefactos se guardan en `exports/` con nombre derivado de la version
+    de datos del registro (register_key): un registro sin cambios se sirve
+    desde disco sin regenerarse, y cualquier worker del servidor puede
+    servirlo. El directorio se poda por tamano total y cantidad de archivos
+    (los menos usados primero).
+
+    submit_task usa la misma cola para otros calculos largos (p. ej. la
+    simulacion de perdidas). Esos trabajos van aparte, en `_tasks`, con el
+    resultado en memoria (`job.result`): a lo sumo max_results entre
+    pendientes y terminados, y los terminados vencen a los task_ttl segundos.
+    """
+
+    def __init__(self, app, exports_dir: str, max_workers: int = 1,
+                 max_bytes: int = 200 * 1024 * 1024, max_files: int = 20,
+                 max_results: int = 32, task_ttl: float = 3600):
+        self.app = app
+        self.exports_dir = exports_dir
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_results = max_results
+        self.task_ttl = task_ttl
+        self._jobs: dict[str, ReportJob] = {}
+        self._tasks: dict[str, ReportJob] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="riskguard-report")
+        os.makedirs(exports_dir, exist_ok=True)
+
+    def artifact_path(self, key: str) -> str:
+        return os.path.join(self.exports_dir, f"{ARTIFACT_PREFIX}{key}.pdf")
+
+    def cached(self, key: str) -> str | None:
+        if not _KEY_RE.match(key):
+            return None
+        path = self.artifact_path(key)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # marca de uso para la poda LRU
+        return path
+
+    def submit(self, key: str) -> ReportJob:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job and job.status in ("queued", "running"):
+                return job
+            if self.cached(key):
+                job = ReportJob(key, status="done", artifact=key, finished_at=time.time())
+                self._jobs[key] = job
+                return job
+            job = ReportJob(key)
+            self._jobs[key] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def submit_task(self, key: str, fn) -> ReportJob:
+        """Encola fn() (dentro de un app context) con id `key`; reutiliza el trabajo si ya existe.
+
+        Lanza TaskQueueFull si no hay lugar ni descartando resultados terminados.
+        """
+        with self._lock:
+            job = self._tasks.get(key)
+            if job and job.status != "error":
+                return job
+            self._tasks.pop(key, None)
+            self._prune_tasks(self.max_results - 1)
+            if len(self._tasks) >= self.max_results:
+                raise TaskQueueFull(f"Hay {len(self._tasks)} calculos pendientes; intenta mas tarde")
+            job = ReportJob(key)
+            self._tasks[key] = job
+        self._executor.submit(self._run_task, job, fn)
+        return job
+
+    def _prune_tasks(self, limit: int) -> None:
+        """Con el lock tomado: quita los terminados vencidos y, si sobran, los mas viejos."""
+        now = time.time()
+        finished = sorted((j.finished_at, key) for key, j in self._tasks.items() if j.finished_at is not None)
+        for finished_at, key in finished:
+            if now - finished_at > self.task_ttl or len(self._tasks) > limit:
+                del self._tasks[key]
+
+    def get(self, key: str) -> ReportJob | None:
+        with self._lock:
+            self._prune_tasks(self.max_results)  # descarta resultados vencidos
+            job = self._jobs.get(key) or self._tasks.get(key)
+        if job is None and _KEY_RE.match(key) and os.path.exists(self.artifact_path(key)):
+            # Generado por otro proceso/worker.
+            job = ReportJob(key, status="done", artifact=key)
+        return job
+
+    def _run(self, job: ReportJob) -> None:
+        from reports import build_risk_register_pdf, iter_register_rows
+
+        job.status = "running"
+        tmp_path = None
+        try:
+            with self.app.app_context():
+                # La clave se vuelve a leer en la misma transaccion que las filas:
+                # si el registro cambio desde el request, el PDF queda con la
+                # clave de lo que muestra y no con la pedida.
+                db.session.connection().exec_driver_sql("BEGIN")
+                key = register_key()
+                if not self.cached(key):
+                    path = self.artifact_path(key)
+                    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                    build_risk_register_pdf(iter_register_rows(db.session), tmp_path)
+                    os.replace(tmp_path, path)
+            job.artifact = key
+            job.status = "done"
+        except Exception as exc:  # el error se muestra en el endpoint de estado
+            job.status = "error"
+            job.error = str(exc)
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            job.finished_at = time.time()
+        self.evict()
+
+    def _run_task(self, job: ReportJob, fn) -> None:
+        job.status = "running"
+        try:
+            with self.app.app_context():
+                job.result = fn()
+            job.status = "done"
+        except Exception as exc:  # el error se muestra en el endpoint de estado
+            job.status = "error"
+            job.error = str(exc)
+        finally:
+            job.finished_at = time.time()
+        with self._lock:
+            self._prune_tasks(self.max_results)
+
+    def evict(self) -> None:
+        """Borra artefactos viejos hasta cumplir max_bytes y max_files."""
+        entries = []
+        for name in os.listdir(self.exports_dir):
+            if not (name.startswith(ARTIFACT_PREFIX) and name.endswith(".pdf")):
+                continue
+            st = os.stat(os.path.join(self.exports_dir, name))
+            entries.append((st.st_mtime, st.st_size, name))
+        entries.sort(reverse=True)  # mas recientes primero
+
+        total = 0
+        for i, (_, size, name) in enumerate(entries):
+            total += size
+            # El mas reciente se conserva siempre, aunque exceda max_bytes.
+            if i > 0 and (i >= self.max_files or total > self.max_bytes):
+                try:
+                    os.remove(os.path.join(self.exports_dir, name))
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            for key, job in list(self._jobs.items()):
+                if job.status == "done" and job.artifact is not None \
+                        and not os.path.exists(self.artifact_path(job.artifact)):
+                    del self._jobs[key]
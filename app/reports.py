@@ -1,7 +1,10 @@
 from __future__ import annotations
 
-import os
+import time
+from collections.abc import Iterable, Iterator
 from datetime import datetime
+from itertools import chain
+from typing import BinaryIO
 
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER
@@ -9,28 +12,86 @@ from reportlab.lib.pagesizes import letter, landscape
 from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.units import inch
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from sqlalchemy import select
 
-from models import RiskScenario
+from instrumentation import METRICS
+from models import Asset, RiskScenario, Threat, Vulnerability
 
+# Filas por sub-tabla: aprox. una pagina landscape. Tablas chicas evitan que
+# ReportLab re-parta una tabla gigante (costo cuadratico) y permiten liberar
+# cada bloque apenas se dibuja.
+ROWS_PER_TABLE = 40
+FETCH_CHUNK = 1000
 
-def build_risk_register_pdf(risks: list[RiskScenario]) -> str:
-    """Genera un PDF con el registro de riesgos.
+
+def iter_register_rows(session, chunk_size: int = FETCH_CHUNK) -> Iterator[tuple]:
+    """Filas del registro como tuplas, leidas por bloques (sin hidratar ORM)."""
+    stmt = (
+        select(
+            RiskScenario.id,
+            Asset.name,
+            Threat.name,
+            Vulnerability.name,
+            RiskScenario.probability,
+            RiskScenario.stored_inherent_score,
+            RiskScenario.stored_inherent_level,
+            RiskScenario.treatment_strategy,
+            RiskScenario.status,
+        )
+        .join(Asset, RiskScenario.asset_id == Asset.id)
+        .join(Threat, RiskScenario.threat_id == Threat.id)
+        .join(Vulnerability, RiskScenario.vulnerability_id == Vulnerability.id)
+        .order_by(RiskScenario.stored_inherent_score.desc(), RiskScenario.id.desc())
+        .execution_options(yield_per=chunk_size)
+    )
+    for rid, asset, threat, vuln, p, score, level, strategy, status in session.execute(stmt):
+        # score = P x I, por lo que el impacto efectivo es exacto.
+        yield rid, asset, threat, vuln, p, score // p, score, level, strategy, status
+
+
+class _FlowableStream(list):
+    """Lista de flowables que se rellena desde un generador bajo demanda.
+
+    doc.build() consume la lista desde el frente (len/[0]/del [0]), asi que
+    basta con mantener unos pocos elementos materializados a la vez.
+    """
+
+    def __init__(self, source: Iterable, lookahead: int = 2):
+        super().__init__()
+        self._source = iter(source)
+        self._lookahead = lookahead
+
+    def _fill(self) -> None:
+        while self._source is not None and super().__len__() < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self) -> int:
+        self._fill()
+        return super().__len__()
+
+    def __getitem__(self, i):
+        self._fill()
+        return super().__getitem__(i)
+
+
+def build_risk_register_pdf(rows: Iterable[tuple], out: str | BinaryIO) -> None:
+    """Genera un PDF con el registro de riesgos en `out` (ruta o archivo).
 
     Nota: antes se dibujaba “a mano” con drawString() y los textos largos
     se montaban encima de otras columnas. Ahora usamos Table + Paragraph
     para que el texto haga wrap dentro de cada celda.
-    """
-    base_dir = os.path.abspath(os.path.dirname(__file__))
-    out_dir = os.path.join(base_dir, "..", "exports")
-    os.makedirs(out_dir, exist_ok=True)
-
-    filename = f"registro_riesgos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    out_path = os.path.join(out_dir, filename)
 
+    `rows` se consume en streaming (ver iter_register_rows): la tabla se
+    emite en sub-tablas de ROWS_PER_TABLE filas, por lo que la memoria no
+    crece con el tamano del registro.
+    """
     # Usamos landscape para que entren mejor todas las columnas.
     pagesize = landscape(letter)
     doc = SimpleDocTemplate(
-        out_path,
+        out,
         pagesize=pagesize,
         leftMargin=0.5 * inch,
         rightMargin=0.5 * inch,
@@ -73,48 +134,61 @@ def build_risk_register_pdf(risks: list[RiskScenario]) -> str:
     # Anchos en inches (landscape letter). Ajustados para que sumen aprox. 9.6 in.
     col_widths = [0.4, 2.0, 1.6, 1.6, 0.35, 0.35, 0.55, 0.8, 1.2, 0.75]
 
-    # Sort by score desc
-    risks_sorted = sorted(risks, key=lambda r: r.inherent_score(), reverse=True)
-
-    # Construimos la tabla con Paragraph para que el texto haga wrap.
-    data: list[list[Paragraph]] = [[Paragraph(h, header_style) for h in headers]]
-    for r in risks_sorted:
-        vals = [
-            str(r.id),
-            r.asset.name,
-            r.threat.name,
-            r.vulnerability.name,
-            str(r.probability),
-            str(r.impact_value()),
-            str(r.inherent_score()),
-            r.inherent_level(),
-            r.treatment_strategy or "-",
-            r.status,
+    table_style = TableStyle(
+        [
+            ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("ALIGN", (0, 0), (-1, 0), "CENTER"),
+            ("LEFTPADDING", (0, 0), (-1, -1), 4),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 4),
+            ("TOPPADDING", (0, 0), (-1, -1), 2),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+            ("FONT", (0, 1), (-1, -1), "Helvetica", 8),
         ]
-        data.append([Paragraph(str(v), cell_style) for v in vals])
-
-    table = Table(data, colWidths=[w * inch for w in col_widths], repeatRows=1)
-    table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-                ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
-                ("VALIGN", (0, 0), (-1, -1), "TOP"),
-                ("ALIGN", (0, 0), (-1, 0), "CENTER"),
-                ("LEFTPADDING", (0, 0), (-1, -1), 4),
-                ("RIGHTPADDING", (0, 0), (-1, -1), 4),
-                ("TOPPADDING", (0, 0), (-1, -1), 2),
-                ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
-            ]
-        )
     )
 
+    def make_table(chunk: list[list]) -> Table:
+        header_row = [Paragraph(h, header_style) for h in headers]
+        table = Table([header_row] + chunk, colWidths=[w * inch for w in col_widths], repeatRows=1)
+        table.setStyle(table_style)
+        return table
+
+    def tables() -> Iterator[Table]:
+        # Construimos cada bloque con Paragraph para que el texto haga wrap.
+        chunk: list[list] = []
+        emitted = False
+        for r in rows:
+            rid, asset, threat, vuln, p, i, score, level, strategy, status = r
+            # Solo las columnas de texto necesitan Paragraph (wrap); las
+            # numericas van como texto plano, que es mucho mas barato.
+            chunk.append([
+                str(rid),
+                Paragraph(asset, cell_style),
+                Paragraph(threat, cell_style),
+                Paragraph(vuln, cell_style),
+                str(p),
+                str(i),
+                str(score),
+                Paragraph(level, cell_style),
+                Paragraph(strategy or "-", cell_style),
+                Paragraph(status, cell_style),
+            ])
+            if len(chunk) == ROWS_PER_TABLE:
+                yield make_table(chunk)
+                chunk = []
+                emitted = True
+        if chunk or not emitted:
+            yield make_table(chunk)
+
     elements = [
         Paragraph("Registro de Riesgos - RiskGuard", title_style),
         Paragraph(f"Generado: {datetime.now().strftime('%Y-%m-%d %H:%M')}", meta_style),
         Spacer(1, 0.1 * inch),
-        table,
     ]
 
-    doc.build(elements)
-    return out_path
+    start = time.perf_counter()
+    try:
+        doc.build(_FlowableStream(chain(elements, tables())))
+    finally:
+        METRICS.observe_pdf(time.perf_counter() - start)
@@ -0,0 +1,310 @@
+"""Cache de paginas HTML invalidado por version de datos.
+
+Cada escritura (flush del ORM o insert/update/delete masivo) incrementa la
+version de las tablas tocadas en `data_version`, dentro de la misma
+transaccion. La clave de cache de una pagina incluye la version de las
+tablas de las que depende, asi que un cambio commiteado invalida la pagina
+en todos los workers sin mensajes entre procesos, y un rollback no invalida
+nada. Leer las versiones cuesta una consulta por request.
+
+Backends (RESPONSE_CACHE): "memory" (LRU por proceso, por defecto), "disk"
+(archivos compartidos entre workers), "tiered" (memoria y luego disco) u
+"off".
+
+Las paginas con formularios llevan el token CSRF de cada sesion: se cachean
+con un marcador que se reemplaza al servir.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session as flask_session
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import db, ChangeLog, DataVersion, RiskCounter
+
+CSRF_PLACEHOLDER = "__response_cache_csrf__"
+# Tablas derivadas: no invalidan paginas.
+_UNTRACKED = {DataVersion.__tablename__, RiskCounter.__tablename__, ChangeLog.__tablename__}
+
+
+@dataclass
+class CachedPage:
+    body: str
+    etag: str
+    last_modified: datetime | None
+    per_session: bool  # contiene el marcador CSRF
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data["last_modified"] = self.last_modified.isoformat() if self.last_modified else None
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "CachedPage":
+        data = json.loads(raw)
+        if data["last_modified"]:
+            data["last_modified"] = datetime.fromisoformat(data["last_modified"])
+        return cls(**data)
+
+
+# ------------------- Backends -------------------
+class MemoryBackend:
+    """LRU en memoria del proceso."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._items: OrderedDict[str, CachedPage] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedPage | None:
+        with self._lock:
+            page = self._items.get(key)
+            if page is not None:
+                self._items.move_to_end(key)
+            return page
+
+    def set(self, key: str, page: CachedPage) -> None:
+        with self._lock:
+            self._items[key] = page
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+class DiskBackend:
+    """Un archivo JSON por pagina; lo comparten todos los workers del host."""
+
+    def __init__(self, directory: str, max_files: int = 2000, prune_every: int = 100):
+        self.directory = directory
+        self.max_files = max_files
+        self.prune_every = prune_every
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def get(self, key: str) -> CachedPage | None:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as fh:
+                page = CachedPage.from_json(fh.read())
+            os.utime(path)  # para podar por uso
+        except (OSError, ValueError, KeyError):
+            return None
+        return page
+
+    def set(self, key: str, page: CachedPage) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(page.to_json())
+        os.replace(tmp, self._path(key))
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    entries.append((os.path.getmtime(os.path.join(self.directory, name)), name))
+                except OSError:
+                    continue
+        entries.sort(reverse=True)
+        for _, name in entries[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+class TieredBackend:
+    def __init__(self, memory: MemoryBackend, disk: DiskBackend):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> CachedPage | None:
+        page = self.memory.get(key)
+        if page is None:
+            page = self.disk.get(key)
+            if page is not None:
+                self.memory.set(key, page)
+        return page
+
+    def set(self, key: str, page: CachedPage) -> None:
+        self.memory.set(key, page)
+        self.disk.set(key, page)
+
+
+def make_backend(kind: str, directory: str, max_entries: int = 512):
+    if kind == "off":
+        return None
+    if kind == "memory":
+        return MemoryBackend(max_entries)
+    if kind == "disk":
+        return DiskBackend(directory)
+    if kind == "tiered":
+        return TieredBackend(MemoryBackend(max_entries), DiskBackend(directory))
+    raise ValueError(f"RESPONSE_CACHE desconocido: {kind}")
+
+
+# ------------------- Versiones de datos -------------------
+def data_versions(tables) -> dict[str, tuple[int, datetime | None]]:
+    rows = db.session.execute(
+        select(DataVersion.table_name, DataVersion.version, DataVersion.updated_at)
+        .where(DataVersion.table_name.in_(tables))
+    )
+    versions = {name: (0, None) for name in tables}
+    versions.update({name: (version, updated_at) for name, version, updated_at in rows})
+    return versions
+
+
+def _bump(connection, tables) -> None:
+    tables = sorted(set(tables) - _UNTRACKED)
+    if not tables:
+        return
+    now = datetime.utcnow()
+    stmt = sqlite_insert(DataVersion.__table__)
+    connection.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["table_name"],
+            set_={"version": DataVersion.__table__.c.version + 1, "updated_at": stmt.excluded.updated_at},
+        ),
+        [{"table_name": name, "version": 1, "updated_at": now} for name in tables],
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_after_flush(session, flush_context):
+    touched = {obj.__table__.name for obj in (*session.new, *session.deleted)}
+    touched |= {obj.__table__.name for obj in session.dirty if session.is_modified(obj)}
+    _bump(session.connection(), touched)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _bump_bulk_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _bump(orm_execute_state.session.connection(), [orm_execute_state.statement.table.name])
+
+
+# ------------------- Cache de respuestas -------------------
+class CacheMetrics:
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, outcome: str) -> None:
+        with self._lock:
+            self._counts[(endpoint, outcome)] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+        by_endpoint: dict[str, Counter] = {}
+        for (endpoint, outcome), n in counts.items():
+            by_endpoint.setdefault(endpoint, Counter())[outcome] += n
+        total = sum(by_endpoint.values(), Counter())
+        lookups = total["hit"] + total["miss"]
+        return {
+            "total": dict(total),
+            "hit_ratio": round(total["hit"] / lookups, 3) if lookups else None,
+            "by_endpoint": {endpoint: dict(c) for endpoint, c in sorted(by_endpoint.items())},
+        }
+
+    def prometheus_lines(self) -> list[str]:
+        with self._lock:
+            counts = sorted(self._counts.items())
+        lines = ["# HELP riskguard_response_cache_total Resultados del cache de paginas.",
+                 "# TYPE riskguard_response_cache_total counter"]
+        lines += [f'riskguard_response_cache_total{{endpoint="{endpoint}",outcome="{outcome}"}} {n}'
+                  for (endpoint, outcome), n in counts]
+        return lines
+
+
+class ResponseCache:
+    def __init__(self, app, backend):
+        self.app = app
+        self.backend = backend
+        self.metrics = CacheMetrics()
+        csrf_token = app.jinja_env.globals.get("csrf_token", generate_csrf)
+
+        def _csrf_token():
+            if g.get("response_cache_render"):
+                return CSRF_PLACEHOLDER
+            return csrf_token()
+
+        # Flask-WTF lo expone como global y como context processor.
+        app.jinja_env.globals["csrf_token"] = _csrf_token
+        app.context_processor(lambda: {"csrf_token": _csrf_token})
+
+    def cached(self, *tables: str):
+        """Cachea la pagina (GET) mientras no cambien las tablas indicadas."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                endpoint = request.endpoint
+                # Los mensajes flash se consumen al renderizar: esa pagina no se comparte.
+                if self.backend is None or request.method not in ("GET", "HEAD") or "_flashes" in flask_session:
+                    self.metrics.record(endpoint, "bypass")
+                    return view(*args, **kwargs)
+
+                versions = data_versions(tables)
+                key = "|".join([endpoint, request.full_path,
+                                *(f"{name}:{versions[name][0]}" for name in sorted(versions))])
+                page = self.backend.get(key)
+                if page is not None:
+                    self.metrics.record(endpoint, "hit")
+                else:
+                    self.metrics.record(endpoint, "miss")
+                    g.response_cache_render = True
+                    try:
+                        rv = view(*args, **kwargs)
+                    finally:
+                        g.pop("response_cache_render", None)
+                    if not isinstance(rv, str):
+                        return rv
+                    modified = [ts for _, ts in versions.values() if ts is not None]
+                    page = CachedPage(
+                        body=rv,
+                        etag=hashlib.sha256(rv.encode("utf-8")).hexdigest()[:32],
+                        last_modified=max(modified) if modified else None,
+                        per_session=CSRF_PLACEHOLDER in rv,
+                    )
+                    self.backend.set(key, page)
+                return self._respond(page, endpoint)
+            return wrapper
+        return decorator
+
+    def _respond(self, page: CachedPage, endpoint: str):
+        body, etag = page.body, page.etag
+        if page.per_session:
+            body = body.replace(CSRF_PLACEHOLDER, generate_csrf())
+            # El ETag cambia con la sesion y antes de que venza el token que
+            # quedo en la copia del navegador.
+            field = current_app.config.get("WTF_CSRF_FIELD_NAME", "csrf_token")
+            window = max(60, (current_app.config.get("WTF_CSRF_TIME_LIMIT") or 3600) // 2)
+            salt = f"{flask_session.get(field)}:{int(time.time() // window)}"
+            etag = hashlib.sha256(f"{etag}:{salt}".encode("utf-8")).hexdigest()[:32]
+        resp = make_response(body)
+        resp.set_etag(etag)
+        if page.last_modified and not page.per_session:
+            resp.last_modified = page.last_modified
+        resp.headers["Cache-Control"] = "no-cache"  # siempre revalidar con el ETag
+        resp = resp.make_conditional(request)
+        if resp.status_code == 304:
+            self.metrics.record(endpoint, "not_modified")
+        return resp
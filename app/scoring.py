@@ -0,0 +1,339 @@
+"""Scoring vectorizado del portafolio y simulacion what-if (requiere numpy).
+
+Las reglas son las mismas de utils.risk_level / Asset.impact_value y de los
+metodos de RiskScenario, pero aplicadas a todo el registro en una pasada
+sobre arreglos. El portafolio cargado se cachea por version de datos.
+
+Uso:
+    python scoring.py --check          # compara contra las columnas materializadas
+    python scoring.py --bench 1000000  # mide scoring y what-if sin base de datos
+"""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+from sqlalchemy import func, select
+
+from models import db, Asset, RiskScenario, asset_impact_sql, risk_controls
+from response_cache import data_versions
+from utils import risk_level
+
+try:
+    import numpy as np
+except ImportError:  # dependencia opcional
+    np = None
+
+LEVEL_NAMES = ("Bajo", "Medio", "Alto", "Critico")
+NOT_EVALUATED = "Sin evaluar"
+TARGETS = ("residual", "inherent")
+# Tabla score -> codigo de nivel generada con la regla escalar.
+_LEVEL_TABLE = (np.array([LEVEL_NAMES.index(risk_level(s)) for s in range(26)], dtype=np.int8)
+                if np is not None else None)
+# Tablas de las que sale el portafolio (ver response_cache.data_versions).
+TABLES = (RiskScenario.__tablename__, Asset.__tablename__)
+_CHUNK = 50_000
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise RuntimeError("Los analisis cuantitativos requieren numpy (pip install numpy)")
+
+
+@dataclass
+class Portfolio:
+    """Columnas de scoring del registro como arreglos alineados por riesgo.
+
+    Los valores 1-5 (y sus productos, hasta 25) caben en int8. Los nulos se
+    codifican como 0 en impact_override (igual que el `if` del modelo) y
+    como -1 en los campos residuales.
+    """
+    ids: "np.ndarray"
+    asset_id: "np.ndarray"
+    probability: "np.ndarray"
+    impact_override: "np.ndarray"
+    asset_impact: "np.ndarray"
+    residual_probability: "np.ndarray"
+    residual_impact: "np.ndarray"
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def take(self, idx: "np.ndarray") -> "Portfolio":
+        return Portfolio(*(getattr(self, f)[idx] for f in self.__dataclass_fields__))
+
+    @property
+    def impact(self) -> "np.ndarray":
+        return np.where(self.impact_override != 0, self.impact_override, self.asset_impact)
+
+
+@dataclass
+class Scores:
+    inherent: "np.ndarray"
+    inherent_level: "np.ndarray"  # codigos 0-3 sobre LEVEL_NAMES
+    residual: "np.ndarray"  # 0 si no hay evaluacion residual
+    residual_level: "np.ndarray"  # -1 si no hay evaluacion residual
+
+    def take(self, idx: "np.ndarray") -> "Scores":
+        return Scores(*(getattr(self, f)[idx] for f in self.__dataclass_fields__))
+
+    def counts(self) -> "np.ndarray":
+        """Conteos por nivel: 4 inherentes + [sin evaluar, 4 residuales]."""
+        return np.concatenate([
+            np.bincount(self.inherent_level, minlength=4),
+            np.bincount(self.residual_level + 1, minlength=5),
+        ])
+
+
+def distribution(counts: "np.ndarray") -> dict:
+    counts = counts.tolist()
+    return {
+        "inherent": dict(zip(LEVEL_NAMES, counts[:4])),
+        "residual": {**dict(zip(LEVEL_NAMES, counts[5:])), NOT_EVALUATED: counts[4]},
+    }
+
+
+def level_codes(score: "np.ndarray") -> "np.ndarray":
+    """Version vectorizada de risk_level(): codigo 0-3 por score (0-25)."""
+    return _LEVEL_TABLE[score]
+
+
+def score_portfolio(p: Portfolio) -> Scores:
+    impact = p.impact
+    inherent = p.probability * impact
+    evaluated = (p.residual_probability >= 0) | (p.residual_impact >= 0)
+    rp = np.where(p.residual_probability >= 0, p.residual_probability, p.probability)
+    ri = np.where(p.residual_impact >= 0, p.residual_impact, impact)
+    residual = np.where(evaluated, rp * ri, 0)
+    residual_level = np.where(evaluated, level_codes(residual), np.int8(-1))
+    return Scores(inherent, level_codes(inherent), residual, residual_level)
+
+
+# ------------------- Carga y cache -------------------
+@dataclass
+class Baseline:
+    """Portafolio vigente con sus scores y conteos ya calculados."""
+    portfolio: Portfolio
+    scores: Scores
+    counts: "np.ndarray"
+
+    @classmethod
+    def build(cls, portfolio: Portfolio) -> "Baseline":
+        scores = score_portfolio(portfolio)
+        return cls(portfolio, scores, scores.counts())
+
+
+_cached: tuple[dict, Baseline] | None = None
+_lock = threading.Lock()
+
+
+def load_portfolio(session) -> Portfolio:
+    """Lee el registro completo en arreglos, por bloques."""
+    require_numpy()
+    r = RiskScenario
+    impact = asset_impact_sql()
+    stmt = (
+        select(
+            r.id, r.asset_id, r.probability, func.coalesce(r.impact_override, 0), impact,
+            func.coalesce(r.residual_probability, -1), func.coalesce(r.residual_impact, -1),
+        )
+        .join(Asset, Asset.id == r.asset_id)
+        .order_by(r.id)
+        .execution_options(yield_per=_CHUNK)
+    )
+    chunks = [np.array([tuple(row) for row in part], dtype=np.int32)
+              for part in session.execute(stmt).partitions()]
+    data = np.concatenate(chunks) if chunks else np.empty((0, 7), dtype=np.int32)
+    return Portfolio(data[:, 0].copy(), data[:, 1].copy(), *(data[:, i].astype(np.int8) for i in range(2, 7)))
+
+
+def cached_baseline() -> Baseline:
+    """Baseline del registro; se recarga cuando cambia la version de risk_scenario o asset.
+
+    La version la sube cualquier escritura (ORM, updates directos sobre la
+    conexion, otros workers), asi que no hace falta TTL.
+    """
+    global _cached
+    versions = data_versions(TABLES)
+    with _lock:
+        entry = _cached
+    if entry and entry[0] == versions:
+        return entry[1]
+    baseline = Baseline.build(load_portfolio(db.session))
+    with _lock:
+        _cached = (versions, baseline)
+    return baseline
+
+
+# ------------------- What-if -------------------
+@dataclass
+class WhatIf:
+    """Cambio hipotetico sobre un subconjunto del portafolio.
+
+    El alcance se limita a los riesgos con `control_id` propuesto y/o del
+    activo `asset_id` (sin filtros: todo el portafolio). Los deltas se suman
+    a la probabilidad/impacto residual (o inherente) y se acotan a 1-5.
+    """
+    MAX_DELTA = 4
+
+    control_id: int | None = None
+    asset_id: int | None = None
+    probability_delta: int = 0
+    impact_delta: int = 0
+    target: str = "residual"
+
+    @classmethod
+    def from_args(cls, args) -> "WhatIf":
+        def _int(name):
+            value = args.get(name, "").strip()
+            return int(value) if value else None
+
+        scenario = cls(
+            control_id=_int("control_id"),
+            asset_id=_int("asset_id"),
+            probability_delta=_int("probability_delta") or 0,
+            impact_delta=_int("impact_delta") or 0,
+            target=args.get("target", "residual"),
+        )
+        scenario.validate()
+        return scenario
+
+    def validate(self) -> None:
+        if self.target not in TARGETS:
+            raise ValueError(f"target debe ser uno de: {', '.join(TARGETS)}")
+        for delta in (self.probability_delta, self.impact_delta):
+            if abs(delta) > self.MAX_DELTA:
+                raise ValueError(f"Los deltas deben estar entre -{self.MAX_DELTA} y {self.MAX_DELTA}")
+
+
+def _scope(p: Portfolio, scenario: WhatIf, session) -> "np.ndarray":
+    mask = np.ones(len(p), dtype=bool)
+    if scenario.asset_id is not None:
+        mask &= p.asset_id == scenario.asset_id
+    if scenario.control_id is not None:
+        risk_ids = np.fromiter(
+            session.execute(select(risk_controls.c.risk_id).where(risk_controls.c.control_id == scenario.control_id))
+            .scalars(),
+            dtype=np.int32,
+        )
+        in_control = np.zeros(len(p), dtype=bool)
+        if len(risk_ids) and len(p):
+            idx = np.searchsorted(p.ids, risk_ids)
+            idx = idx[(idx < len(p)) & (p.ids[np.minimum(idx, len(p) - 1)] == risk_ids)]
+            in_control[idx] = True
+        mask &= in_control
+    return mask
+
+
+def apply_what_if(p: Portfolio, scenario: WhatIf, mask: "np.ndarray") -> Portfolio:
+    """Portafolio hipotetico; no modifica `p`."""
+    if not (scenario.probability_delta or scenario.impact_delta):
+        return p
+
+    def _shift(values, delta):
+        return np.where(mask, np.clip(values + delta, 1, 5), values)
+
+    if scenario.target == "inherent":
+        return Portfolio(
+            p.ids, p.asset_id,
+            _shift(p.probability, scenario.probability_delta),
+            np.where(mask, _shift(p.impact, scenario.impact_delta), p.impact_override),
+            p.asset_impact, p.residual_probability, p.residual_impact,
+        )
+    # Residual: se parte del residual vigente (o del inherente si no hay) y
+    # los riesgos del alcance quedan evaluados.
+    rp = np.where(p.residual_probability >= 0, p.residual_probability, p.probability)
+    ri = np.where(p.residual_impact >= 0, p.residual_impact, p.impact)
+    return Portfolio(
+        p.ids, p.asset_id, p.probability, p.impact_override, p.asset_impact,
+        np.where(mask, _shift(rp, scenario.probability_delta), p.residual_probability),
+        np.where(mask, _shift(ri, scenario.impact_delta), p.residual_impact),
+    )
+
+
+def run_what_if(scenario: WhatIf, baseline: Baseline | None = None, session=None) -> dict:
+    """Distribucion de niveles antes/despues del cambio hipotetico.
+
+    Solo se recalculan los riesgos del alcance; los conteos del resto salen
+    del baseline cacheado.
+    """
+    require_numpy()
+    scenario.validate()
+    start = time.perf_counter()
+    base = baseline if baseline is not None else cached_baseline()
+    idx = np.flatnonzero(_scope(base.portfolio, scenario, session or db.session))
+    sub = base.portfolio.take(idx)
+    before = base.scores.take(idx)
+    after = score_portfolio(apply_what_if(sub, scenario, np.ones(len(idx), dtype=bool)))
+    changed = (before.inherent_level != after.inherent_level) | (before.residual_level != after.residual_level)
+    return {
+        "scenario": scenario.__dict__,
+        "risks": len(base.portfolio),
+        "in_scope": len(idx),
+        "changed": int(changed.sum()),
+        "before": distribution(base.counts),
+        "after": distribution(base.counts - before.counts() + after.counts()),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+# ------------------- CLI -------------------
+def _check() -> int:
+    """Compara el scoring vectorizado con las columnas materializadas."""
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        p = load_portfolio(db.session)
+        s = score_portfolio(p)
+        stored = db.session.execute(
+            select(func.coalesce(RiskScenario.stored_inherent_score, -1),
+                   func.coalesce(RiskScenario.stored_residual_score, 0)).order_by(RiskScenario.id)
+        ).all()
+    expected = np.array(stored, dtype=np.int8).reshape(-1, 2)
+    bad = np.flatnonzero((expected[:, 0] != s.inherent) | (expected[:, 1] != s.residual))
+    print(f"{len(p)} riesgos, {len(bad)} diferencias")
+    for i in bad[:10]:
+        print(f"  riesgo {p.ids[i]}: guardado {tuple(expected[i])} vectorizado {(s.inherent[i], s.residual[i])}")
+    return 1 if len(bad) else 0
+
+
+def _bench(n: int) -> int:
+    rng = np.random.default_rng(1)
+    ids = np.arange(1, n + 1, dtype=np.int32)
+    with_residual = rng.random(n) < 0.4
+    p = Portfolio(
+        ids=ids,
+        asset_id=rng.integers(1, max(2, n // 100), n, dtype=np.int32),
+        probability=rng.integers(1, 6, n, dtype=np.int8),
+        impact_override=np.where(rng.random(n) < 0.1, rng.integers(1, 6, n), 0).astype(np.int8),
+        asset_impact=rng.choice(np.array([1, 3, 5], dtype=np.int8), n),
+        residual_probability=np.where(with_residual, rng.integers(1, 6, n), -1).astype(np.int8),
+        residual_impact=np.where(with_residual, rng.integers(1, 6, n), -1).astype(np.int8),
+    )
+    start = time.perf_counter()
+    baseline = Baseline.build(p)
+    print(f"scoring de {n} riesgos: {(time.perf_counter() - start) * 1000:.1f} ms")
+    # Alcance chico (un activo) y el peor caso (todo el portafolio).
+    for scenario in (WhatIf(asset_id=1, probability_delta=-1), WhatIf(probability_delta=-1)):
+        start = time.perf_counter()
+        result = run_what_if(scenario, baseline)
+        print(f"what-if sobre {result['in_scope']} riesgos: {(time.perf_counter() - start) * 1000:.1f} ms")
+    return 0
+
+
+def main() -> int:
+    require_numpy()
+    if "--check" in sys.argv:
+        return _check()
+    if "--bench" in sys.argv:
+        idx = sys.argv.index("--bench")
+        return _bench(int(sys.argv[idx + 1]) if len(sys.argv) > idx + 1 else 1_000_000)
+    print(__doc__)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
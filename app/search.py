@@ -0,0 +1,238 @@
+"""Busqueda de texto completo (SQLite FTS5) en activos, catalogos, riesgos e incidentes.
+
+Un solo indice `search_index` (tabla virtual FTS5, columnas title y body)
+con un documento por fila de origen. El rowid del documento codifica el
+tipo y el id de origen (id * 8 + codigo), asi los triggers actualizan o
+borran por rowid sin recorrer el indice.
+
+- Sincronizacion por triggers de SQLite: cubren el ORM, los inserts masivos
+  (seed, importador, ingesta) y cualquier SQL directo.
+- El titulo de un riesgo es "activo + amenaza + vulnerabilidad"; renombrar
+  un activo o catalogo reescribe los titulos de sus riesgos.
+- Tokenizador unicode61 sin acentos ("inyeccion" encuentra "Inyección") e
+  indices de prefijo de 2 y 3 letras.
+- Resultados ordenados por bm25 (el titulo pesa mas que el cuerpo), con
+  resaltado del titulo y un fragmento del cuerpo. bm25 puntua cada
+  coincidencia (cientos de ms si una palabra esta en un tercio de 1M de
+  documentos): las consultas con mas de BROAD_MATCHES coincidencias se
+  ordenan de la mas reciente a la mas vieja, que FTS5 resuelve recorriendo
+  el indice por rowid sin puntuar. Con tantas coincidencias, bm25 casi no
+  discrimina entre ellas.
+
+Uso:
+    python search.py --rebuild   # reconstruye el indice desde las tablas
+"""
+from __future__ import annotations
+
+import re
+import sys
+from dataclasses import dataclass
+
+from markupsafe import Markup, escape
+from sqlalchemy import select, text
+
+from models import db, Incident
+
+INDEX = "search_index"
+TITLE_WEIGHT = 4.0
+SEARCH_LIMIT = 20
+BROAD_MATCHES = 5_000
+# Marcadores de resaltado (uso privado de Unicode): se escapan los textos y
+# recien despues se reemplazan por <mark>.
+_HL_START, _HL_END = "\ue000", "\ue001"
+
+
+@dataclass(frozen=True)
+class _Doc:
+    code: int
+    table: str
+    title: str  # expresion SQL; {r} es la fila de origen
+    body: tuple[str, ...]  # columnas de texto de la fila de origen
+
+    def title_sql(self, r: str) -> str:
+        return self.title.format(r=r)
+
+    def body_sql(self, r: str) -> str:
+        return " || ' ' || ".join(f"coalesce({r}.{col}, '')" for col in self.body)
+
+    @property
+    def watched(self) -> list[str]:
+        """Columnas propias que cambian el documento (para UPDATE OF)."""
+        own = re.findall(r"\{r\}\.(\w+)", self.title)
+        return sorted({*own, *self.body})
+
+
+_RISK_TITLE = (
+    "(SELECT name FROM asset WHERE id = {r}.asset_id) || ' + ' || "
+    "(SELECT name FROM threat WHERE id = {r}.threat_id) || ' + ' || "
+    "(SELECT name FROM vulnerability WHERE id = {r}.vulnerability_id)"
+)
+
+# Clave: nombre del recurso (el mismo que en la API).
+DOCUMENTS = {
+    "assets": _Doc(1, "asset", "{r}.name", ("asset_type", "process", "owner", "description")),
+    "threats": _Doc(2, "threat", "{r}.name", ("category", "description")),
+    "vulnerabilities": _Doc(3, "vulnerability", "{r}.name", ("category", "description")),
+    "controls": _Doc(4, "control", "{r}.name", ("iso_reference", "control_type", "description")),
+    "risks": _Doc(5, "risk_scenario", _RISK_TITLE,
+                  ("existing_controls", "observations", "responsible", "acceptance_justification")),
+    "incidents": _Doc(6, "incident", "coalesce({r}.external_id, '')", ("severity", "description")),
+}
+_KIND_BY_CODE = {doc.code: kind for kind, doc in DOCUMENTS.items()}
+# Renombrar una de estas tablas cambia el titulo de sus riesgos.
+_RISK_PARENTS = {"asset": "asset_id", "threat": "threat_id", "vulnerability": "vulnerability_id"}
+
+
+# ------------------- Esquema y sincronizacion -------------------
+def _trigger_sql() -> list[str]:
+    statements = []
+    for doc in DOCUMENTS.values():
+        rowid = f"NEW.id * 8 + {doc.code}"
+        statements += [
+            f"CREATE TRIGGER search_{doc.table}_ai AFTER INSERT ON {doc.table} BEGIN "
+            f"INSERT INTO {INDEX}(rowid, title, body) VALUES ({rowid}, {doc.title_sql('NEW')}, {doc.body_sql('NEW')}); "
+            f"END",
+            f"CREATE TRIGGER search_{doc.table}_au AFTER UPDATE OF {', '.join(doc.watched)} ON {doc.table} BEGIN "
+            f"UPDATE {INDEX} SET title = {doc.title_sql('NEW')}, body = {doc.body_sql('NEW')} WHERE rowid = {rowid}; "
+            f"END",
+            f"CREATE TRIGGER search_{doc.table}_ad AFTER DELETE ON {doc.table} BEGIN "
+            f"DELETE FROM {INDEX} WHERE rowid = OLD.id * 8 + {doc.code}; "
+            f"END",
+        ]
+    risks = DOCUMENTS["risks"]
+    for table, fk in _RISK_PARENTS.items():
+        statements.append(
+            f"CREATE TRIGGER search_{table}_rename AFTER UPDATE OF name ON {table} BEGIN "
+            f"UPDATE {INDEX} SET title = (SELECT {risks.title_sql('r')} FROM risk_scenario r "
+            f"WHERE r.id = {INDEX}.rowid / 8) "
+            f"WHERE rowid IN (SELECT id * 8 + {risks.code} FROM risk_scenario WHERE {fk} = NEW.id); "
+            f"END"
+        )
+    return statements
+
+
+def _backfill(connection) -> None:
+    for doc in DOCUMENTS.values():
+        connection.execute(text(
+            f"INSERT INTO {INDEX}(rowid, title, body) "
+            f"SELECT r.id * 8 + {doc.code}, {doc.title_sql('r')}, {doc.body_sql('r')} FROM {doc.table} r"
+        ))
+
+
+def ensure_index(connection) -> bool:
+    """Crea el indice si falta (y lo llena) y recrea los triggers. True si se creo."""
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": INDEX}
+    ).first()
+    if not exists:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {INDEX} USING fts5("
+            f"title, body, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+    # Los triggers se recrean en cada migracion (al cambiar DOCUMENTS, subir SCHEMA_VERSION).
+    names = connection.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'search\\_%' ESCAPE '\\'")
+    ).scalars().all()
+    for name in names:
+        connection.execute(text(f"DROP TRIGGER {name}"))
+    for statement in _trigger_sql():
+        connection.execute(text(statement))
+    if not exists:
+        _backfill(connection)
+    return not exists
+
+
+def rebuild(connection) -> int:
+    """Vacia y vuelve a llenar el indice; devuelve la cantidad de documentos."""
+    connection.execute(text(f"DELETE FROM {INDEX}"))
+    _backfill(connection)
+    connection.execute(text(f"INSERT INTO {INDEX}({INDEX}) VALUES ('optimize')"))
+    return connection.execute(text(f"SELECT count(*) FROM {INDEX}")).scalar_one()
+
+
+# ------------------- Consultas -------------------
+_TOKEN = re.compile(r'"[^"]*"|[^\s"]+')
+_WORD = re.compile(r"\w+")
+
+
+def match_expression(q: str, prefix_last: bool = False) -> str | None:
+    """Texto del usuario -> consulta FTS5 segura.
+
+    Todas las palabras deben aparecer (AND). "entre comillas" busca la frase;
+    palabra* busca por prefijo. Con `prefix_last`, la ultima palabra tambien
+    (busqueda mientras se escribe).
+    """
+    terms = []
+    tokens = _TOKEN.findall(q)
+    for i, token in enumerate(tokens):
+        words = _WORD.findall(token)
+        if not words:
+            continue
+        prefix = token.endswith("*") or (prefix_last and i == len(tokens) - 1 and not token.startswith('"'))
+        terms.append('"' + " ".join(words) + '"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+
+@dataclass
+class SearchHit:
+    kind: str
+    id: int
+    title: Markup
+    snippet: Markup
+    risk_id: int | None = None  # incidentes: riesgo al que pertenecen
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "id": self.id, "title": str(self.title), "snippet": str(self.snippet),
+                "risk_id": self.risk_id}
+
+
+def _highlighted(value: str | None) -> Markup:
+    return Markup(str(escape(value or "")).replace(_HL_START, "<mark>").replace(_HL_END, "</mark>"))
+
+
+def search(q: str, kinds: list[str] | None = None, limit: int = SEARCH_LIMIT, offset: int = 0,
+           prefix_last: bool = False) -> list[SearchHit]:
+    """Documentos que coinciden con `q`: por relevancia (bm25) o, si la consulta es amplia, por fecha."""
+    expression = match_expression(q, prefix_last)
+    if expression is None:
+        return []
+    params = {"q": expression, "limit": limit, "offset": offset, "broad": BROAD_MATCHES}
+    where = ""
+    if kinds:
+        codes = ", ".join(str(DOCUMENTS[kind].code) for kind in kinds)
+        where = f"AND rowid % 8 IN ({codes})"
+    # Contar hasta BROAD_MATCHES recorriendo por rowid es barato; puntuar no.
+    broad = db.session.execute(text(
+        f"SELECT 1 FROM {INDEX} WHERE {INDEX} MATCH :q {where} ORDER BY rowid DESC LIMIT 1 OFFSET :broad"
+    ), params).scalar()
+    order = "rowid DESC" if broad else f"bm25({INDEX}, {TITLE_WEIGHT}, 1.0)"
+    rows = db.session.execute(text(
+        f"SELECT rowid, highlight({INDEX}, 0, '{_HL_START}', '{_HL_END}'), "
+        f"snippet({INDEX}, 1, '{_HL_START}', '{_HL_END}', '…', 16) "
+        f"FROM {INDEX} WHERE {INDEX} MATCH :q {where} "
+        f"ORDER BY {order} LIMIT :limit OFFSET :offset"
+    ), params).all()
+    hits = [SearchHit(_KIND_BY_CODE[rowid % 8], rowid // 8, _highlighted(title), _highlighted(snippet))
+            for rowid, title, snippet in rows]
+    incidents = {hit.id: hit for hit in hits if hit.kind == "incidents"}
+    if incidents:
+        for incident_id, risk_id in db.session.execute(
+            select(Incident.id, Incident.risk_id).where(Incident.id.in_(incidents))
+        ):
+            incidents[incident_id].risk_id = risk_id
+    return hits
+
+
+def run():
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        if "--rebuild" in sys.argv:
+            n = rebuild(db.session.connection())
+            db.session.commit()
+            print(f"Indice de busqueda reconstruido: {n} documentos")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,7 +1,24 @@
 from __future__ import annotations
 
+import argparse
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert
+
 from app import create_app
-from models import db, Asset, Threat, Vulnerability, Control, RiskScenario
+from models import db, Asset, Threat, Vulnerability, Control, RiskScenario, Incident, risk_controls, stored_scores
+from utils import cid_to_impact
+
+BATCH_SIZE = 5000
+
+# Distribuciones aproximadas de un registro real.
+PROB_WEIGHTS = [10, 25, 35, 20, 10]  # P = 1..5
+STRATEGY_WEIGHTS = {None: 20, "Mitigar": 50, "Transferir": 10, "Aceptar": 15, "Evitar": 5}
+STATUS_WEIGHTS = {"Pendiente": 40, "En progreso": 30, "Implementado": 30}
+ASSET_TYPES = ["Hardware", "Software", "Datos", "Servicio", "Persona"]
+PROCESSES = ["Ventas", "Finanzas", "TI", "RRHH", "Operaciones", "Marketing", "Legal"]
+RESPONSIBLES = [f"Responsable {i}" for i in range(1, 41)]
 
 
 def run():
@@ -51,5 +68,126 @@ def run():
         print("Datos de ejemplo creados.")
 
 
+def _pick(rnd: random.Random, weights: dict):
+    return rnd.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _insert_batches(model_or_table, rows) -> None:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(insert(model_or_table), batch)
+            batch.clear()
+    if batch:
+        db.session.execute(insert(model_or_table), batch)
+
+
+def generate(n_assets: int = 1000, n_catalog: int = 100, n_risks: int = 10000, seed: int = 42) -> None:
+    """Genera datos sinteticos a escala con inserts masivos.
+
+    n_catalog es la cantidad de amenazas, vulnerabilidades y controles.
+    Debe ejecutarse dentro de un app context sobre una base vacia.
+    """
+    rnd = random.Random(seed)
+    today = date.today()
+
+    asset_impact = {}
+
+    def assets():
+        for i in range(1, n_assets + 1):
+            c, it, a = (rnd.choices([1, 2, 3], weights=[30, 45, 25])[0] for _ in range(3))
+            asset_impact[i] = cid_to_impact(c + it + a)
+            yield {
+                "name": f"Activo {i}", "asset_type": rnd.choice(ASSET_TYPES), "process": rnd.choice(PROCESSES),
+                "owner": rnd.choice(RESPONSIBLES), "confidentiality": c, "integrity": it, "availability": a,
+            }
+
+    _insert_batches(Asset, assets())
+    _insert_batches(Threat, ({"name": f"Amenaza {i}", "category": rnd.choice(["Externa", "Interna", "Error humano", "Fallo tecnico"])}
+                             for i in range(1, n_catalog + 1)))
+    _insert_batches(Vulnerability, ({"name": f"Vulnerabilidad {i}", "category": rnd.choice(["Tecnologica", "Organizacional", "Proceso"])}
+                                    for i in range(1, n_catalog + 1)))
+    _insert_batches(Control, ({"name": f"Control {i}", "iso_reference": f"ISO 27002:2022 - {rnd.randint(5, 8)}.{rnd.randint(1, 37)}",
+                               "control_type": rnd.choice(["Preventivo", "Detectivo", "Correctivo"])}
+                              for i in range(1, n_catalog + 1)))
+
+    def risks():
+        for _ in range(n_risks):
+            asset_id = rnd.randint(1, n_assets)
+            probability = rnd.choices(range(1, 6), weights=PROB_WEIGHTS)[0]
+            impact_override = rnd.randint(1, 5) if rnd.random() < 0.1 else None
+            strategy = _pick(rnd, STRATEGY_WEIGHTS)
+            status = _pick(rnd, STATUS_WEIGHTS) if strategy else "Pendiente"
+            due = today + timedelta(days=rnd.randint(-180, 365)) if strategy and rnd.random() < 0.8 else None
+            completed = None
+            residual_p = residual_i = None
+            if status == "Implementado":
+                completed = (due or today) + timedelta(days=rnd.randint(-60, 30))
+                residual_p = max(1, probability - rnd.randint(0, 2))
+                residual_i = rnd.choice([None, max(1, (impact_override or asset_impact[asset_id]) - 1)])
+            accepted = strategy == "Aceptar" and rnd.random() < 0.8
+            yield {
+                "asset_id": asset_id,
+                "threat_id": rnd.randint(1, n_catalog),
+                "vulnerability_id": rnd.randint(1, n_catalog),
+                "probability": probability,
+                "impact_override": impact_override,
+                "treatment_strategy": strategy,
+                "responsible": rnd.choice(RESPONSIBLES) if strategy else None,
+                "due_date": due,
+                "status": status,
+                "completed_at": completed,
+                "residual_probability": residual_p,
+                "residual_impact": residual_i,
+                "acceptance_justification": "Riesgo dentro del apetito" if accepted else None,
+                "acceptance_approved_by": "Comite de riesgos" if accepted else None,
+                "created_at": datetime.utcnow() - timedelta(days=rnd.randint(0, 720)),
+                **stored_scores(probability, impact_override, residual_p, residual_i, asset_impact[asset_id]),
+            }
+
+    _insert_batches(RiskScenario, risks())
+
+    def links():
+        for rid in range(1, n_risks + 1):
+            for cid in rnd.sample(range(1, n_catalog + 1), k=min(n_catalog, rnd.choice([0, 1, 1, 2, 3]))):
+                yield {"risk_id": rid, "control_id": cid}
+
+    def incidents():
+        for rid in range(1, n_risks + 1):
+            if rnd.random() < 0.3:
+                for _ in range(rnd.randint(1, 3)):
+                    yield {
+                        "risk_id": rid,
+                        "date": today - timedelta(days=rnd.randint(0, 720)),
+                        "severity": rnd.choice(["Baja", "Media", "Alta"]),
+                        "description": "Incidente sintetico",
+                    }
+
+    _insert_batches(risk_controls, links())
+    _insert_batches(Incident, incidents())
+    db.session.commit()
+
+
+def run_synthetic(args) -> None:
+    app = create_app()
+    with app.app_context():
+        if Asset.query.first():
+            print("DB ya tiene datos. Usa una base vacia (DATABASE_URL) para datos sinteticos.")
+            return
+        generate(args.assets, args.catalog, args.risks, args.seed)
+        print(f"Datos sinteticos creados: {args.assets} activos, {args.catalog} por catalogo, {args.risks} riesgos.")
+
+
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Datos de ejemplo o sinteticos a escala")
+    parser.add_argument("--synthetic", action="store_true", help="generar datos sinteticos a escala")
+    parser.add_argument("--assets", type=int, default=1000)
+    parser.add_argument("--catalog", type=int, default=100)
+    parser.add_argument("--risks", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if args.synthetic:
+        run_synthetic(args)
+    else:
+        run()
@@ -0,0 +1,312 @@
+"""Simulacion Monte Carlo de perdida anualizada (requiere numpy).
+
+Complementa la metodologia cualitativa (P x I) con una estimacion
+cuantitativa. Por cada riesgo:
+
+- Frecuencia anual ~ Poisson(lambda). lambda parte de la probabilidad 1-5
+  (FREQUENCY_BY_PROBABILITY) y se ajusta con el historial de incidentes del
+  riesgo (promedio con credibilidad: PRIOR_YEARS anos "virtuales" de la
+  tabla + HISTORY_YEARS anos observados).
+- Perdida por evento ~ LogNormal con mediana segun el impacto 1-5 (que ya
+  incluye el CID del activo o el override del escenario).
+
+Los anos simulados se reparten en lotes entre procesos
+(ProcessPoolExecutor). Cada lote tiene su propia semilla derivada de
+`seed`, por lo que el resultado no depende del numero de workers. La
+perdida por activo se reduce lote a lote (suma e histograma, ver
+AssetLosses): la memoria no crece con anos x activos.
+
+Uso:
+    python simulation.py [--trials 10000] [--workers 4] [--seed 1] [--residual]
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from models import db, Asset, Incident
+from response_cache import data_versions
+from scoring import load_portfolio, require_numpy
+
+try:
+    import numpy as np
+except ImportError:  # dependencia opcional
+    np = None
+
+# Eventos por ano esperados segun la escala de probabilidad.
+FREQUENCY_BY_PROBABILITY = {1: 0.05, 2: 0.2, 3: 0.5, 4: 1.0, 5: 3.0}
+# Mediana de perdida por evento (USD) segun impacto 1-5.
+LOSS_MEDIAN_BY_IMPACT = {1: 1_000, 2: 5_000, 3: 25_000, 4: 100_000, 5: 500_000}
+LOSS_SIGMA = 1.0
+HISTORY_YEARS = 2
+PRIOR_YEARS = 1.0
+PERCENTILES = (50, 90, 99)
+DEFAULT_TRIALS = 10_000
+MAX_TRIALS = 100_000
+# Tope de trabajo por simulacion: anos x riesgos (sorteos) y anos x activos
+# (histogramas). Se recortan los anos hasta cumplir ambos.
+MAX_RISK_CELLS = 500_000_000
+MAX_ASSET_CELLS = 50_000_000
+# Celdas (anos x riesgos) por lote: acota la memoria de cada worker.
+BATCH_CELLS = 2_000_000
+# Histograma por activo: bins logaritmicos de 1 a 10^HIST_DECADES USD, mas
+# la columna 0 para los anos sin perdida. Error relativo de los percentiles
+# menor a 10^(1/BINS_PER_DECADE) - 1 (~5%).
+BINS_PER_DECADE = 50
+HIST_DECADES = 10
+HIST_BINS = BINS_PER_DECADE * HIST_DECADES
+# Tablas de las que sale el modelo (clave de los resultados cacheados).
+TABLES = ("risk_scenario", "asset", "incident")
+
+
+@dataclass
+class LossModel:
+    """Parametros por riesgo, ordenados por activo para agregar por columnas."""
+    frequency: "np.ndarray"
+    loss_mu: "np.ndarray"
+    asset_ids: "np.ndarray"  # activos distintos, en orden
+    asset_starts: "np.ndarray"  # primera columna de cada activo
+
+    @property
+    def risks(self) -> int:
+        return len(self.frequency)
+
+
+@dataclass
+class AssetLosses:
+    """Perdida anual por activo acumulada lote a lote.
+
+    La suma va en centavos enteros (exacta y sin depender del orden de los
+    lotes) y los percentiles salen del histograma.
+    """
+    cents: "np.ndarray"  # (activos,) int64
+    counts: "np.ndarray"  # (activos, HIST_BINS + 1) int64
+
+    @classmethod
+    def empty(cls, assets: int) -> "AssetLosses":
+        return cls(np.zeros(assets, dtype=np.int64), np.zeros((assets, HIST_BINS + 1), dtype=np.int64))
+
+    @classmethod
+    def from_batch(cls, per_asset: "np.ndarray") -> "AssetLosses":
+        """Reduce una matriz (anos, activos) del lote."""
+        n_trials, assets = per_asset.shape
+        bins = np.floor(np.log10(np.maximum(per_asset, 1.0)) * BINS_PER_DECADE).astype(np.int64)
+        bins = np.where(per_asset > 0, np.clip(bins, 0, HIST_BINS - 1) + 1, 0)
+        bins += np.arange(assets, dtype=np.int64) * (HIST_BINS + 1)
+        counts = np.bincount(bins.ravel(), minlength=assets * (HIST_BINS + 1)).reshape(assets, HIST_BINS + 1)
+        return cls(np.rint(per_asset * 100).astype(np.int64).sum(axis=0), counts)
+
+    def add(self, other: "AssetLosses") -> None:
+        self.cents += other.cents
+        self.counts += other.counts
+
+    @property
+    def trials(self) -> int:
+        return int(self.counts[0].sum()) if len(self.counts) else 0
+
+    def mean(self) -> "np.ndarray":
+        return self.cents / 100 / max(1, self.trials)
+
+    def percentiles(self, ps=PERCENTILES) -> "np.ndarray":
+        """(len(ps), activos), interpolando en escala log dentro del bin."""
+        cum = self.counts.cumsum(axis=1)
+        rows = np.arange(len(cum))
+        out = np.zeros((len(ps), len(cum)))
+        for i, p in enumerate(ps):
+            target = p / 100 * cum[:, -1]
+            k = np.minimum((cum < target[:, None]).sum(axis=1), HIST_BINS)
+            below = np.where(k > 0, cum[rows, k - 1], 0)
+            frac = (target - below) / np.maximum(self.counts[rows, k], 1)
+            out[i] = np.where(k > 0, 10 ** ((k - 1 + frac) / BINS_PER_DECADE), 0.0)
+        return out
+
+
+@dataclass
+class SimulationResult:
+    trials: int
+    requested_trials: int
+    seed: int
+    workers: int
+    seconds: float
+    portfolio: dict
+    assets: list[dict] = field(default_factory=list)
+    exceedance: list[dict] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return self.__dict__
+
+
+def build_loss_model(session, residual: bool = False, today: date | None = None) -> LossModel:
+    require_numpy()
+    p = load_portfolio(session)
+    probability, impact = p.probability, p.impact
+    if residual:
+        probability = np.where(p.residual_probability >= 0, p.residual_probability, probability)
+        impact = np.where(p.residual_impact >= 0, p.residual_impact, impact)
+
+    prior = _lookup(FREQUENCY_BY_PROBABILITY, probability)
+    cutoff = (today or date.today()) - timedelta(days=365 * HISTORY_YEARS)
+    observed = np.zeros(len(p), dtype=np.float64)
+    rows = session.execute(
+        select(Incident.risk_id, func.count()).where(Incident.date >= cutoff).group_by(Incident.risk_id)
+    ).all()
+    if rows and len(p):
+        risk_ids, counts = np.array(rows, dtype=np.int64).T
+        idx = np.searchsorted(p.ids, risk_ids)
+        ok = (idx < len(p)) & (p.ids[np.minimum(idx, len(p) - 1)] == risk_ids)
+        observed[idx[ok]] = counts[ok]
+    frequency = (prior * PRIOR_YEARS + observed) / (PRIOR_YEARS + HISTORY_YEARS)
+    loss_mu = np.log(_lookup(LOSS_MEDIAN_BY_IMPACT, impact))
+
+    order = np.argsort(p.asset_id, kind="stable")
+    asset_ids, asset_starts = np.unique(p.asset_id[order], return_index=True)
+    return LossModel(frequency[order], loss_mu[order], asset_ids, asset_starts)
+
+
+def _lookup(table: dict, values: "np.ndarray") -> "np.ndarray":
+    lut = np.zeros(max(table) + 1, dtype=np.float64)
+    for key, value in table.items():
+        lut[key] = value
+    return lut[np.clip(values, min(table), max(table))]
+
+
+# ------------------- Workers -------------------
+_model: LossModel | None = None
+
+
+def _init_worker(model: LossModel) -> None:
+    global _model
+    _model = model
+
+
+def _simulate_batch(n_trials: int, seed: "np.random.SeedSequence", model: LossModel | None = None):
+    """Perdida anual de n_trials anos: total del portafolio y por activo (reducida)."""
+    m = model or _model
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(m.frequency, size=(n_trials, m.risks))
+    flat = counts.ravel()
+    cells = np.repeat(np.arange(flat.size), flat)
+    losses = rng.lognormal(m.loss_mu[cells % m.risks], LOSS_SIGMA)
+    per_risk = np.bincount(cells, weights=losses, minlength=flat.size).reshape(n_trials, m.risks)
+    per_asset = np.add.reduceat(per_risk, m.asset_starts, axis=1) if m.risks else per_risk
+    return per_risk.sum(axis=1), AssetLosses.from_batch(per_asset)
+
+
+def _simulate_group(batches: list, model: LossModel | None = None):
+    """Varios lotes seguidos: perdidas del portafolio en orden y activos ya sumados."""
+    m = model or _model
+    portfolio, assets = [], AssetLosses.empty(len(m.asset_ids))
+    for n_trials, seed in batches:
+        part, per_asset = _simulate_batch(n_trials, seed, m)
+        portfolio.append(part)
+        assets.add(per_asset)
+    return portfolio, assets
+
+
+def max_trials(model: LossModel) -> int:
+    """Anos permitidos para el modelo segun MAX_TRIALS, MAX_RISK_CELLS y MAX_ASSET_CELLS."""
+    return max(1, min(MAX_TRIALS, MAX_RISK_CELLS // max(1, model.risks),
+                      MAX_ASSET_CELLS // max(1, len(model.asset_ids))))
+
+
+def simulate(model: LossModel, trials: int = DEFAULT_TRIALS, seed: int = 1, workers: int = 1):
+    """Devuelve (perdida del portafolio por ano, AssetLosses)."""
+    require_numpy()
+    batch = max(1, min(trials, BATCH_CELLS // max(1, model.risks)))
+    sizes = [min(batch, trials - start) for start in range(0, trials, batch)]
+    batches = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    if workers <= 1:
+        portfolio, assets = _simulate_group(batches, model)
+    else:
+        # Grupos contiguos de lotes: cada proceso devuelve un solo acumulado.
+        n_groups = min(len(batches), workers * 2)
+        groups = [batches[len(batches) * i // n_groups:len(batches) * (i + 1) // n_groups] for i in range(n_groups)]
+        portfolio, assets = [], AssetLosses.empty(len(model.asset_ids))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,)) as pool:
+            for part, per_asset in pool.map(_simulate_group, groups):
+                portfolio.extend(part)
+                assets.add(per_asset)
+    return np.concatenate(portfolio), assets
+
+
+def _summary(losses: "np.ndarray") -> dict:
+    values = np.percentile(losses, PERCENTILES)
+    return {"mean": round(float(losses.mean()), 2),
+            **{f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, values)}}
+
+
+def exceedance_curve(losses: "np.ndarray", points: int = 20) -> list[dict]:
+    """Curva de excedencia: P(perdida anual > umbral)."""
+    ordered = np.sort(losses)
+    thresholds = np.quantile(ordered, np.linspace(0, 0.999, points))
+    above = len(ordered) - np.searchsorted(ordered, thresholds, side="right")
+    return [{"loss": round(float(t), 2), "probability": round(float(a) / len(ordered), 4)}
+            for t, a in zip(thresholds, above)]
+
+
+def simulation_key(trials: int, seed: int, residual: bool) -> str:
+    """Id del resultado: parametros + version de los datos del modelo (y el dia, por el historial)."""
+    versions = data_versions(TABLES)
+    raw = "|".join([f"{trials}:{seed}:{int(residual)}:{date.today()}",
+                    *(f"{name}:{version}:{updated_at}" for name, (version, updated_at) in sorted(versions.items()))])
+    return "sim-" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:24]
+
+
+def run_simulation(trials: int = DEFAULT_TRIALS, seed: int = 1, workers: int = 1,
+                   residual: bool = False, session=None) -> SimulationResult:
+    """Simulacion completa sobre el registro actual. Requiere app context.
+
+    Los anos se recortan a max_trials(model); el resultado trae los pedidos
+    en `requested_trials`.
+    """
+    session = session or db.session
+    model = build_loss_model(session, residual=residual)
+    requested, trials = trials, min(trials, max_trials(model))
+    start = time.perf_counter()
+    portfolio, per_asset = simulate(model, trials, seed, workers)
+    seconds = time.perf_counter() - start
+
+    names = dict(session.execute(select(Asset.id, Asset.name)).all())
+    means = per_asset.mean()
+    values = per_asset.percentiles(PERCENTILES)
+    assets = [
+        {"asset_id": int(aid), "name": names.get(int(aid)), "mean": round(float(means[i]), 2),
+         **{f"p{p}": round(float(v[i]), 2) for p, v in zip(PERCENTILES, values)}}
+        for i, aid in enumerate(model.asset_ids)
+    ]
+    assets.sort(key=lambda a: a["p90"], reverse=True)
+    return SimulationResult(
+        trials=trials, requested_trials=requested, seed=seed, workers=workers, seconds=round(seconds, 3),
+        portfolio=_summary(portfolio), assets=assets, exceedance=exceedance_curve(portfolio),
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--residual", action="store_true", help="usar la evaluacion residual")
+    args = parser.parse_args()
+    require_numpy()
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        result = run_simulation(args.trials, args.seed, args.workers, args.residual)
+    print(json.dumps(result.to_dict(), indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
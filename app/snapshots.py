@@ -0,0 +1,302 @@
+"""Fotos del registro en el tiempo (cierres de trimestre, tendencias de KPIs).
+
+Cada foto guarda, por riesgo, score y nivel inherente y residual, estado y
+estrategia en formato columnar: un array por columna (modulo array), los
+textos codificados por diccionario y los ids como diferencias, todo
+comprimido con zlib en un solo blob.
+
+- Deduplicacion: la primera foto de cada cadena es completa; las siguientes
+  guardan solo las filas que cambiaron respecto de la foto anterior y los
+  ids borrados. Tras KEYFRAME_EVERY deltas (o si cambio mas de la mitad del
+  registro) se guarda otra completa, para acotar cuantos deltas se aplican
+  al reconstruir una foto.
+- Cada foto guarda tambien sus KPIs ya calculados: las series de tiempo se
+  leen de register_snapshot sin tocar las tablas vivas.
+
+Uso (p. ej. con cron):
+    python snapshots.py
+    python snapshots.py --label "Cierre 2026-Q3"
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter
+from datetime import datetime
+from itertools import accumulate
+
+from sqlalchemy import and_, func, or_, select
+
+from counters import NO_STRATEGY, NOT_EVALUATED
+from kpis import dashboard_counts
+from models import db, RegisterSnapshot, RiskScenario
+
+FIELDS = ("inherent_score", "inherent_level", "residual_score", "residual_level", "status", "treatment_strategy")
+_INT_FIELDS = {"inherent_score", "residual_score"}
+_SELECT = (
+    RiskScenario.id,
+    RiskScenario.stored_inherent_score,
+    RiskScenario.stored_inherent_level,
+    RiskScenario.stored_residual_score,
+    RiskScenario.stored_residual_level,
+    RiskScenario.status,
+    RiskScenario.treatment_strategy,
+)
+KEYFRAME_EVERY = 30
+FORMAT_VERSION = 1
+
+State = dict  # id -> tuple con los valores de FIELDS
+
+
+# ------------------- Codificacion columnar -------------------
+def _le_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode: str, raw: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _id_deltas(ids: list[int]) -> array:
+    return array("i", (b - a for a, b in zip([0, *ids], ids)))
+
+
+def encode(rows: State, removed: list[int] = ()) -> bytes:
+    """Filas y ids borrados -> blob comprimido."""
+    ids = sorted(rows)
+    columns = [_id_deltas(ids), _id_deltas(sorted(removed))]
+    dicts = {}
+    for i, name in enumerate(FIELDS):
+        values = [rows[rid][i] for rid in ids]
+        if name in _INT_FIELDS:
+            columns.append(array("H", (0 if v is None else v + 1 for v in values)))
+        else:
+            dicts[name] = [None, *sorted({v for v in values if v is not None})]
+            codes = {v: code for code, v in enumerate(dicts[name])}
+            columns.append(array("H", (codes[v] for v in values)))
+    header = json.dumps({"version": FORMAT_VERSION, "rows": len(ids), "removed": len(removed),
+                         "fields": FIELDS, "dicts": dicts}).encode()
+    return zlib.compress(struct.pack("<I", len(header)) + header + b"".join(map(_le_bytes, columns)), 6)
+
+
+def decode(payload: bytes) -> tuple[State, list[int]]:
+    """Blob -> (filas, ids borrados)."""
+    raw = zlib.decompress(payload)
+    (size,) = struct.unpack_from("<I", raw)
+    header = json.loads(raw[4:4 + size])
+    offset = 4 + size
+
+    def take(typecode: str, n: int) -> array:
+        nonlocal offset
+        end = offset + n * array(typecode).itemsize
+        values = _from_le(typecode, raw[offset:end])
+        offset = end
+        return values
+
+    n = header["rows"]
+    ids = list(accumulate(take("i", n)))
+    removed = list(accumulate(take("i", header["removed"])))
+    columns = []
+    for name in header["fields"]:
+        codes = take("H", n)
+        if name in _INT_FIELDS:
+            columns.append([None if v == 0 else v - 1 for v in codes])
+        else:
+            values = header["dicts"][name]
+            columns.append([values[c] for c in codes])
+    return dict(zip(ids, zip(*columns))) if n else {}, removed
+
+
+# ------------------- Captura -------------------
+def capture() -> State:
+    """Estado actual del registro (una consulta por columnas)."""
+    rows = db.session.execute(select(*_SELECT).execution_options(yield_per=5000))
+    return {rid: tuple(values) for rid, *values in rows}
+
+
+def compute_kpis(state: State, counts: dict[str, int]) -> dict:
+    """KPIs del panel mas distribuciones, en un dict plano {metrica: valor}."""
+    kpis: dict = dict(counts)
+    kpis["pct_with_plan"] = round(100 * counts["with_plan"] / counts["high"], 1) if counts["high"] else 0.0
+    kpis["pct_on_time"] = round(100 * counts["on_time"] / counts["due"], 1) if counts["due"] else 0.0
+    inherent = [v[0] for v in state.values()]
+    residual = [v[2] for v in state.values() if v[2] is not None]
+    kpis["avg_inherent_score"] = round(sum(inherent) / len(inherent), 2) if inherent else 0.0
+    kpis["avg_residual_score"] = round(sum(residual) / len(residual), 2) if residual else 0.0
+    dist: Counter = Counter()
+    for _, inherent_level, _, residual_level, status, strategy in state.values():
+        dist[f"inherent_level.{inherent_level}"] += 1
+        dist[f"residual_level.{residual_level or NOT_EVALUATED}"] += 1
+        dist[f"status.{status}"] += 1
+        dist[f"strategy.{strategy or NO_STRATEGY}"] += 1
+    kpis.update(sorted(dist.items()))
+    return kpis
+
+
+def state_at(snapshot_id: int) -> State | None:
+    """Reconstruye una foto: la completa de su cadena mas los deltas hasta ella."""
+    row = db.session.execute(
+        select(RegisterSnapshot.base_id).where(RegisterSnapshot.id == snapshot_id)
+    ).one_or_none()
+    if row is None:
+        return None
+    base = row.base_id or snapshot_id
+    chain = db.session.execute(
+        select(RegisterSnapshot.payload)
+        .where(or_(RegisterSnapshot.id == base,
+                   and_(RegisterSnapshot.base_id == base, RegisterSnapshot.id <= snapshot_id)))
+        .order_by(RegisterSnapshot.id)
+    ).scalars()
+    state: State = {}
+    for payload in chain:
+        rows, removed = decode(payload)
+        for rid in removed:
+            state.pop(rid, None)
+        state.update(rows)
+    return state
+
+
+def take_snapshot(label: str | None = None) -> RegisterSnapshot:
+    """Toma una foto del registro y la commitea."""
+    current = capture()
+    last = db.session.execute(
+        select(RegisterSnapshot.id, RegisterSnapshot.base_id).order_by(RegisterSnapshot.id.desc()).limit(1)
+    ).one_or_none()
+    changed, removed, base = current, [], None
+    if last is not None:
+        base = last.base_id or last.id
+        previous = state_at(last.id)
+        changed = {rid: values for rid, values in current.items() if previous.get(rid) != values}
+        removed = sorted(previous.keys() - current.keys())
+        deltas = db.session.execute(
+            select(func.count(RegisterSnapshot.id)).where(RegisterSnapshot.base_id == base)
+        ).scalar_one()
+        if deltas >= KEYFRAME_EVERY or len(changed) + len(removed) > len(current) // 2:
+            changed, removed, base = current, [], None
+
+    snapshot = RegisterSnapshot(
+        taken_at=datetime.utcnow(),
+        label=label or None,
+        base_id=base,
+        risk_count=len(current),
+        changed_rows=len(changed),
+        removed_rows=len(removed),
+        payload=encode(changed, removed),
+        kpis=json.dumps(compute_kpis(current, dashboard_counts()), ensure_ascii=False),
+    )
+    db.session.add(snapshot)
+    db.session.commit()
+    return snapshot
+
+
+# ------------------- Consultas -------------------
+def _meta(row) -> dict:
+    sid, taken_at, label, base_id, risk_count, changed_rows, removed_rows, size = row
+    return {"id": sid, "taken_at": taken_at.isoformat(), "label": label, "full": base_id is None,
+            "risk_count": risk_count, "changed_rows": changed_rows, "removed_rows": removed_rows, "bytes": size}
+
+
+_META = (RegisterSnapshot.id, RegisterSnapshot.taken_at, RegisterSnapshot.label, RegisterSnapshot.base_id,
+         RegisterSnapshot.risk_count, RegisterSnapshot.changed_rows, RegisterSnapshot.removed_rows,
+         func.length(RegisterSnapshot.payload))
+
+
+def list_snapshots() -> list[dict]:
+    """Fotos tomadas, de la mas reciente a la mas vieja (sin leer los blobs)."""
+    rows = db.session.execute(select(*_META).order_by(RegisterSnapshot.id.desc()))
+    return [_meta(row) for row in rows]
+
+
+def kpi_series(metrics: list[str] | None = None, since: datetime | None = None) -> dict:
+    """{metrica: [[fecha, valor], ...]} leyendo solo los KPIs guardados en cada foto."""
+    stmt = select(RegisterSnapshot.taken_at, RegisterSnapshot.kpis).order_by(RegisterSnapshot.taken_at)
+    if since is not None:
+        stmt = stmt.where(RegisterSnapshot.taken_at >= since)
+    series: dict[str, list] = {name: [] for name in metrics or ()}
+    for taken_at, kpis in db.session.execute(stmt):
+        values = json.loads(kpis)
+        for name in metrics or values:
+            # Una categoria ausente en una foto (p. ej. ningun riesgo Critico) vale 0.
+            series.setdefault(name, []).append([taken_at.isoformat(), values.get(name, 0)])
+    return series
+
+
+def _row(rid: int, values: tuple) -> dict:
+    return {"id": rid, **dict(zip(FIELDS, values))}
+
+
+def diff(from_id: int, to_id: int, limit: int = 1000) -> dict | None:
+    """Altas, bajas y cambios por campo entre dos fotos; los resumenes cuentan todo."""
+    before, after = state_at(from_id), state_at(to_id)
+    if before is None or after is None:
+        return None
+    added = sorted(after.keys() - before.keys())
+    removed = sorted(before.keys() - after.keys())
+    changed = []
+    transitions: Counter = Counter()
+    for rid in sorted(before.keys() & after.keys()):
+        old, new = before[rid], after[rid]
+        if old == new:
+            continue
+        fields = {name: [a, b] for name, a, b in zip(FIELDS, old, new) if a != b}
+        changed.append({"id": rid, **fields})
+        for name in ("inherent_level", "residual_level", "status"):
+            if name in fields:
+                a, b = fields[name]
+                transitions[f"{name}: {a or '-'} -> {b or '-'}"] += 1
+    metas = {m["id"]: m for m in map(_meta, db.session.execute(
+        select(*_META).where(RegisterSnapshot.id.in_((from_id, to_id)))))}
+    return {
+        "from": metas[from_id],
+        "to": metas[to_id],
+        "summary": {"added": len(added), "removed": len(removed), "changed": len(changed),
+                    "transitions": dict(transitions.most_common())},
+        "added": [_row(rid, after[rid]) for rid in added[:limit]],
+        "removed": [_row(rid, before[rid]) for rid in removed[:limit]],
+        "changed": changed[:limit],
+    }
+
+
+def svg_polyline(points: list, width: int = 600, height: int = 140, pad: int = 6) -> dict:
+    """Coordenadas de una serie [[fecha, valor], ...] para un <polyline> (eje x por orden)."""
+    values = [v for _, v in points]
+    if not values:
+        return {"points": "", "min": None, "max": None, "last": None}
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    step = (width - 2 * pad) / max(1, len(values) - 1)
+    coords = " ".join(
+        f"{pad + i * step:.1f},{height - pad - (v - low) / span * (height - 2 * pad):.1f}"
+        for i, v in enumerate(values)
+    )
+    return {"points": coords, "min": low, "max": high, "last": values[-1]}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--label", default=None, help="p. ej. 'Cierre 2026-Q3'")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        snapshot = take_snapshot(args.label)
+        print(json.dumps(_meta(db.session.execute(
+            select(*_META).where(RegisterSnapshot.id == snapshot.id)).one())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
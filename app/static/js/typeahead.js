@@ -0,0 +1,33 @@
+// Busqueda para <select data-typeahead="url">: en catalogos grandes el select
+// no trae todas las opciones; se llenan consultando /catalog/<kind>/search.
+(function () {
+  document.querySelectorAll("select[data-typeahead]").forEach(function (select) {
+    var url = select.getAttribute("data-typeahead");
+    var input = document.createElement("input");
+    input.type = "search";
+    input.className = "form-control form-control-sm mb-1";
+    input.placeholder = "Buscar por nombre o ID...";
+    select.parentNode.insertBefore(input, select);
+
+    var timer = null;
+    input.addEventListener("input", function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        fetch(url + "?q=" + encodeURIComponent(input.value))
+          .then(function (r) { return r.json(); })
+          .then(function (items) {
+            // Conservar lo ya seleccionado (p. ej. en selects multiples).
+            Array.from(select.options).forEach(function (opt) {
+              if (!opt.selected) { opt.remove(); }
+            });
+            var present = new Set(Array.from(select.options).map(function (o) { return o.value; }));
+            items.forEach(function (item) {
+              if (!present.has(String(item.id))) {
+                select.add(new Option(item.label, item.id));
+              }
+            });
+          });
+      }, 250);
+    });
+  });
+})();
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import os
+
+from sqlalchemy import event
+
+# PRAGMAs por perfil de almacenamiento. "production" esta pensado para varios
+# workers de gunicorn sobre el mismo archivo SQLite: WAL permite lectores
+# concurrentes con un escritor y busy_timeout evita "database is locked".
+STORAGE_PROFILES = {
+    "dev": {
+        "busy_timeout": 5000,
+    },
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 10000,
+        "cache_size": -64000,  # KiB (negativo) => 64 MB por conexion
+        "mmap_size": 268435456,  # 256 MB
+        "temp_store": "MEMORY",
+    },
+}
+
+ENGINE_OPTIONS = {
+    "dev": {},
+    "production": {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+    },
+}
+
+
+def configure_storage(app) -> None:
+    """Ajusta opciones del engine segun STORAGE_PROFILE. Llamar antes de db.init_app()."""
+    profile = os.getenv("STORAGE_PROFILE", "dev")
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"STORAGE_PROFILE desconocido: {profile}")
+    app.config["STORAGE_PROFILE"] = profile
+    app.config.setdefault("SQLITE_PRAGMAS", dict(STORAGE_PROFILES[profile]))
+    uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    # Las bases en memoria usan un pool de una sola conexion.
+    if uri.startswith("sqlite") and uri not in ("sqlite://", "sqlite:///:memory:"):
+        app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", dict(ENGINE_OPTIONS[profile]))
+
+
+def install_pragmas(app, engine) -> None:
+    """Ejecuta los PRAGMAs configurados en cada conexion nueva del pool."""
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = app.config.get("SQLITE_PRAGMAS", {})
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, connection_record):
+        cursor = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
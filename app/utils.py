@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+import json
+from collections.abc import Iterable
 from dataclasses import dataclass
 
+from sqlalchemy import case, func, select
+
 
 def risk_level(score: int) -> str:
     """Clasificacion de riesgo segun escala 1-25.
@@ -29,6 +33,45 @@ def cid_to_impact(cid_total: int) -> int:
     return 5
 
 
+def risk_level_sql(score):
+    """Version SQL (CASE) de risk_level() para agregar en la base de datos."""
+    return case(
+        (score <= 5, "Bajo"),
+        (score <= 10, "Medio"),
+        (score <= 15, "Alto"),
+        else_="Critico",
+    )
+
+
+def cid_to_impact_sql(cid_total):
+    """Version SQL (CASE) de cid_to_impact()."""
+    return case(
+        (cid_total <= 4, 1),
+        (cid_total <= 7, 3),
+        else_=5,
+    )
+
+
+def json_ids(ids: Iterable[int], name: str | None = None):
+    """Tabla (columna value) con los IDs, pasados como un solo parametro JSON (json_each)."""
+    return func.json_each(json.dumps(sorted(set(ids)))).table_valued("value", name=name)
+
+
+def in_ids(column, ids: Iterable[int]):
+    """`column IN (...)` con un solo parametro: sin el limite de variables de SQLite."""
+    return column.in_(select(json_ids(ids).c.value))
+
+
+def severity_rank_sql(score):
+    """Rango de severidad (1-4) calculado directo sobre el score en SQL."""
+    return case(
+        (score <= 5, 1),
+        (score <= 10, 2),
+        (score <= 15, 3),
+        else_=4,
+    )
+
+
 def severity_rank(level: str) -> int:
     order = {"Bajo": 1, "Medio": 2, "Alto": 3, "Critico": 4}
     return order.get(level, 0)
@@ -39,3 +82,9 @@ class KPI:
     label: str
     value: str
     note: str | None = None
+
+
+def pct(a: int, b: int) -> str:
+    if b <= 0:
+        return "0%"
+    return f"{round((a / b) * 100)}%"